@@ -0,0 +1,344 @@
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+
+import pandas as pd # type: ignore
+from mysql.connector import Error
+
+from funcion import fila_a_data_row
+from image_generator import ImageGenerator, MedidorRendimiento, RENDERERS, get_render_workers, get_render_batch_size
+from database_manager import DatabaseManager, ReservaCorrelativos
+from output_sinks import DirectorySink, ZipSink, nombres_zip, unir_zips
+
+
+# Cada cuántos carnets se muestra el progreso
+INTERVALO_PROGRESO = 100
+
+
+def leer_cedulas(ruta):
+    """
+    Lee las cédulas de una hoja de cálculo (Excel, OpenDocument, CSV o TSV).
+
+    La hoja debe tener una columna "Cedula" o "Cédula"; el resto de las
+    columnas se ignora, porque los datos y la foto se toman de la base de datos.
+
+    Retorna:
+    - list: Cédulas como texto, sin repetir y en el orden de la hoja.
+    """
+    if ruta.endswith(('.xlsx', '.xlsm', '.xls')):
+        df = pd.read_excel(ruta)
+    elif ruta.endswith('.ods'):
+        df = pd.read_excel(ruta, engine='odf')
+    elif ruta.endswith('.csv'):
+        df = pd.read_csv(ruta)
+    elif ruta.endswith('.tsv'):
+        df = pd.read_csv(ruta, sep='\t')
+    else:
+        raise ValueError("Formato de archivo no soportado.")
+
+    columna = next((col for col in ("Cedula", "Cédula") if col in df.columns), None)
+    if columna is None:
+        raise ValueError("El archivo debe contener la columna Cedula.")
+
+    cedulas = []
+    for valor in df[columna].dropna():
+        # pandas lee las cédulas numéricas como float si la columna tiene vacíos
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)
+        cedulas.append(str(valor).strip())
+    return list(dict.fromkeys(cedula for cedula in cedulas if cedula))
+
+
+def leer_checkpoint(ruta):
+    """
+    Devuelve los carnets ya generados según el archivo de progreso.
+
+    El archivo tiene una línea JSON por carnet generado. Una última línea
+    incompleta (por ejemplo, si se cortó la luz) se ignora.
+
+    Retorna:
+    - dict: Cédula -> nombre del archivo generado.
+    """
+    hechas = {}
+    if not os.path.exists(ruta):
+        return hechas
+    with open(ruta, encoding='utf-8') as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+                hechas[str(registro["cedula"])] = registro["archivo"]
+            except (ValueError, KeyError, TypeError):
+                continue
+    return hechas
+
+
+def es_zip(salida):
+    return salida.lower().endswith('.zip')
+
+
+def partes_zip(salida):
+    """Devuelve las partes <salida>.part-N.zip que dejaron ejecuciones anteriores, en orden."""
+    partes = []
+    for ruta in glob.glob(glob.escape(salida) + ".part-*.zip"):
+        numero = numero_parte(salida, ruta)
+        if numero is not None:
+            partes.append((numero, ruta))
+    return [ruta for _, ruta in sorted(partes)]
+
+
+def numero_parte(salida, ruta):
+    """Devuelve el N de una parte <salida>.part-N.zip, o None si la ruta no es una parte."""
+    numero = ruta[len(salida) + len(".part-"):-len(".zip")]
+    return int(numero) if numero.isdigit() else None
+
+
+def verificar_checkpoint(hechas, salida):
+    """
+    Descarta del progreso los carnets que no están en la salida.
+
+    Un ZIP de una ejecución que se cortó de golpe (sin cerrarlo) no se puede
+    leer, así que sus carnets deben generarse de nuevo aunque figuren en el
+    progreso; esas partes se eliminan. Lo mismo vale para un --checkpoint
+    que no corresponda a la salida.
+
+    Retorna:
+    - dict: Las entradas de hechas cuyo archivo existe en la salida.
+    """
+    if es_zip(salida):
+        existentes = set()
+        if os.path.exists(salida):
+            nombres = nombres_zip(salida)
+            if nombres is None:
+                raise ValueError(f"No se puede leer {salida}. Use --reiniciar para generarlo de nuevo.")
+            existentes |= nombres
+        for parte in partes_zip(salida):
+            nombres = nombres_zip(parte)
+            if nombres is None:
+                print(f"Se descarta {parte}: la ejecución que lo escribía se cortó antes de cerrarlo.")
+                os.remove(parte)
+            else:
+                existentes |= nombres
+    else:
+        existentes = {archivo for archivo in hechas.values() if os.path.exists(os.path.join(salida, archivo))}
+
+    validas = {cedula: archivo for cedula, archivo in hechas.items() if archivo in existentes}
+    if len(validas) < len(hechas):
+        print(f"{len(hechas) - len(validas)} carnets del progreso no están en {salida}; se generarán de nuevo.")
+    return validas
+
+
+def crear_sink(salida, reanudar):
+    """
+    Crea el destino de los carnets: un ZIP si la salida termina en .zip, si no, un directorio.
+
+    Para un ZIP, cada ejecución escribe su propia parte <salida>.part-N.zip
+    (ver terminar_zip), de modo que cortar una ejecución no daña los carnets
+    de las anteriores.
+    """
+    if es_zip(salida):
+        partes = partes_zip(salida)
+        if not reanudar:
+            for parte in partes:
+                os.remove(parte)
+            partes = []
+        numero = numero_parte(salida, partes[-1]) + 1 if partes else 1
+        return ZipSink(f"{salida}.part-{numero}.zip")
+    # Los nombres son {cedula}_{tipo}.png, así que al reanudar se reemplaza
+    # cualquier carnet que se haya escrito sin llegar a anotarse en el progreso
+    return DirectorySink(salida, sobrescribir=True)
+
+
+def terminar_zip(salida, reanudar):
+    """
+    Une las partes de las ejecuciones en el ZIP de salida y las elimina.
+
+    Si no se está reanudando, el ZIP de salida anterior se reemplaza en
+    lugar de sumarse a las partes.
+    """
+    partes = partes_zip(salida)
+    origenes = ([salida] if reanudar and os.path.exists(salida) else []) + partes
+    unir_zips(salida, origenes)
+    for parte in partes:
+        os.remove(parte)
+
+
+def migrar_fotos():
+    """Mueve las fotos de trabajadores.imagen al almacén de fotos."""
+    db = DatabaseManager()
+    if db.pool is None:
+        print("No hay conexión a la base de datos.", file=sys.stderr)
+        return 1
+    if db.almacen_fotos is None:
+        print("Configure photo_store_dir en settings.json para usar el almacén de fotos.", file=sys.stderr)
+        return 1
+    movidas = db.migrar_fotos_a_almacen()
+    print(f"Fotos movidas al almacén: {movidas}.")
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        description="Genera carnets sin interfaz gráfica, en paralelo y con reanudación.",
+    )
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--archivo", help="Hoja de cálculo con una columna Cedula; los datos se toman de la base de datos.")
+    origen.add_argument("--todos", action="store_true", help="Generar todos los trabajadores que cumplan --adscrito y --tipo.")
+    origen.add_argument("--migrar-fotos", action="store_true", help="Mover las fotos de la base de datos al almacén de fotos (photo_store_dir) y salir.")
+    parser.add_argument("--adscrito", help="Código de la oficina (con --todos).")
+    parser.add_argument("--tipo", help="Tipo de carnet (con --todos).")
+    parser.add_argument("--salida", help="Directorio o archivo .zip de destino.")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos de renderizado. Por defecto, render_workers de settings.json.")
+    parser.add_argument("--renderer", choices=RENDERERS, default="wkhtml", help="Modo de renderizado.")
+    parser.add_argument("--tamano-lote", type=int, default=None, help="Carnets por ejecución de wkhtmltoimage. Por defecto, render_batch_size de settings.json.")
+    parser.add_argument("--checkpoint", help="Archivo de progreso. Por defecto, <salida>.progreso.jsonl.")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el progreso guardado y generar todo de nuevo.")
+    return parser
+
+
+def main(argv=None):
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+    if args.archivo and (args.adscrito or args.tipo):
+        parser.error("--adscrito y --tipo solo se usan con --todos.")
+    if args.migrar_fotos:
+        return migrar_fotos()
+    if not args.salida:
+        parser.error("Falta --salida.")
+
+    checkpoint = args.checkpoint or os.path.normpath(args.salida) + ".progreso.jsonl"
+    if args.reiniciar and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    try:
+        hechas = verificar_checkpoint(leer_checkpoint(checkpoint), args.salida)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    if hechas:
+        print(f"Reanudando: {len(hechas)} carnets ya generados según {checkpoint}.")
+
+    db = DatabaseManager()
+    if db.pool is None:
+        print("No hay conexión a la base de datos.", file=sys.stderr)
+        return 1
+    oficinas = db.registro_oficinas()
+
+    no_encontradas = []
+    if args.archivo:
+        try:
+            cedulas = leer_cedulas(args.archivo)
+        except Exception as e:
+            print(f"No se pudo leer {args.archivo}: {str(e)}", file=sys.stderr)
+            return 1
+        pendientes = [cedula for cedula in cedulas if cedula not in hechas]
+        filas = db.iter_data_by_cedulas(pendientes)
+    else:
+        pendientes = None
+        filas = db.iter_data(args.adscrito, args.tipo)
+
+    invalidos = []
+    encontradas = set()
+
+    def filas_pendientes():
+        for fila in filas:
+            cedula = str(fila[2])
+            encontradas.add(cedula)
+            if cedula in hechas:
+                continue
+            if not all(fila[:7]):
+                invalidos.append(cedula)
+                continue
+            yield fila_a_data_row(fila, oficinas)
+
+    generados = 0
+    aciertos = 0
+    errores = 0
+    medidor = MedidorRendimiento()
+    inicio = time.perf_counter()
+    interrumpido = False
+    fallo_lectura = False
+    try:
+        sink = crear_sink(args.salida, reanudar=bool(hechas))
+    except Exception as e:
+        print(f"No se pudo abrir la salida {args.salida}: {str(e)}", file=sys.stderr)
+        return 1
+
+    generador = ImageGenerator()
+    # Los correlativos se reservan de a bloques en lugar de uno por viaje
+    generador.db.reserva_correlativos = ReservaCorrelativos(generador.db)
+    try:
+        with sink, open(checkpoint, 'a', encoding='utf-8') as progreso:
+            resultados = generador.iter_carnets(
+                filas_pendientes(),
+                workers=args.workers or get_render_workers(),
+                sink=sink,
+                renderer=args.renderer,
+                tamano_lote=args.tamano_lote or get_render_batch_size(),
+            )
+            for resultado in resultados:
+                cedula = str(resultado["cedula"])
+                medidor.agregar(resultado)
+                if resultado["error"] is None:
+                    generados += 1
+                    if resultado["cache"]:
+                        aciertos += 1
+                    progreso.write(json.dumps({"cedula": cedula, "archivo": resultado["archivo"]}) + "\n")
+                    progreso.flush()
+                else:
+                    errores += 1
+                    print(f"Error en la cédula {cedula}: {str(resultado['error'])}", file=sys.stderr)
+                    logging.error(f"No se pudo generar el carnet de {cedula}: {str(resultado['error'])}\n{resultado['detalle']}")
+
+                total = generados + errores
+                if total % INTERVALO_PROGRESO == 0:
+                    segundos = time.perf_counter() - inicio
+                    linea = f"{total} carnets procesados ({total / segundos:.1f} carnets/s"
+                    if medidor.ultimo is not None:
+                        linea += f"; último lote: {medidor.ultimo['carnets']} en {medidor.ultimo['segundos']:.2f} s, {medidor.ultimo['carnets_por_segundo']:.1f} carnets/s"
+                    print(linea + ")")
+    except KeyboardInterrupt:
+        interrumpido = True
+    except Error as e:
+        # La lectura de los trabajadores se cortó: lo generado queda en el progreso
+        print(f"Error al leer los trabajadores: {str(e)}", file=sys.stderr)
+        fallo_lectura = True
+
+    if es_zip(args.salida):
+        try:
+            terminar_zip(args.salida, reanudar=bool(hechas))
+        except (OSError, zipfile.BadZipFile) as e:
+            # Las partes quedan en disco y se unen en la próxima ejecución
+            print(f"No se pudieron unir las partes de {args.salida}: {str(e)}", file=sys.stderr)
+            return 1
+
+    if pendientes is not None and not interrumpido and not fallo_lectura:
+        no_encontradas = [cedula for cedula in pendientes if cedula not in encontradas]
+
+    segundos = time.perf_counter() - inicio
+    print(f"Generados: {generados} (desde la caché: {aciertos}, renderizados: {generados - aciertos}) en {segundos:.1f} s.")
+    if medidor.resumen():
+        print(medidor.resumen())
+    if errores:
+        print(f"Errores: {errores} (ver image_generator.log).")
+    if invalidos:
+        print(f"Con datos incompletos: {len(invalidos)}: {', '.join(invalidos)}")
+    if no_encontradas:
+        print(f"No encontradas en la base de datos: {len(no_encontradas)}: {', '.join(no_encontradas)}")
+    if interrumpido:
+        print(f"Interrumpido. Ejecute el mismo comando para continuar desde {checkpoint}.")
+        return 130
+    if fallo_lectura:
+        print(f"Incompleto. Ejecute el mismo comando para continuar desde {checkpoint}.")
+        return 1
+    return 1 if errores or invalidos or no_encontradas else 0
+
+
+if __name__ == "__main__":
+    # Necesario en el ejecutable congelado para los procesos de renderizado
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,11 +1,383 @@
 # database_manager.py
 import json
+import os
+import threading
+import time
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errorcode, errors
+from contextlib import contextmanager
 import pandas as pd
-from funcion import convertir_imagen_a_binario
+from itertools import islice
+from funcion import crear_miniatura
+from photo_store import PREFIJO_CLAVE_ALMACEN, get_almacen_fotos
+from search_index import IndiceBusqueda
 from datetime import datetime, timedelta
-import re
+
+
+# Conexiones por pool; las operaciones que no encuentran una libre esperan a que se devuelva otra
+TAMANO_POOL = 4
+
+# Segundos sin usarse tras los cuales una conexión del pool se comprueba con ping antes de prestarla
+ESPERA_SIN_VERIFICAR = 60
+
+# Importación masiva: filas por transacción y tope de bytes de fotos por sentencia,
+# para no superar max_allowed_packet del servidor
+TAMANO_LOTE_IMPORTACION = 500
+MAX_BYTES_LOTE_IMPORTACION = 8 * 1024 * 1024
+
+# Intentos de emisión por lote si otro equipo tomó los mismos correlativos
+INTENTOS_EMISION = 3
+
+# Correlativos que una ReservaCorrelativos toma de la base de datos en cada viaje
+TAMANO_BLOQUE_CORRELATIVOS = 100
+
+# Trabajadores por página en fetch_data
+TAMANO_PAGINA = 25
+
+# Segundos que valen los conteos y límites de página en caché; pasado ese
+# tiempo se vuelven a leer, para ver lo que escribieron otros equipos
+VIGENCIA_PAGINACION = 30
+
+# Filas por bloque en iter_trabajadores
+TAMANO_BLOQUE_LECTURA = 500
+
+# Segundos que el servidor espera a que iter_trabajadores pida el siguiente
+# bloque antes de cortar la consulta (net_write_timeout de la sesión)
+ESPERA_LECTURA = 3600
+
+# Segundos entre mediciones del desfase con el reloj del servidor
+INTERVALO_RELOJ_SERVIDOR = 600
+
+# Las consultas de listado no traen la foto: en la columna "imagen" devuelven
+# una clave que se resuelve con fetch_foto, "sha256:<hash>" si la foto está en
+# el almacén de fotos, "foto:<cedula>" si está en la tabla o "" si no hay foto
+PREFIJO_CLAVE_FOTO = "foto:"
+COLUMNAS_LISTADO = (
+    "nombre, apellidos, cedula, adscrito, cargo, "
+    f"CASE WHEN foto_hash IS NOT NULL THEN CONCAT('{PREFIJO_CLAVE_ALMACEN}', foto_hash) "
+    f"WHEN imagen IS NOT NULL THEN CONCAT('{PREFIJO_CLAVE_FOTO}', cedula) ELSE '' END AS imagen, tipo_carnet"
+)
+
+# Migraciones del esquema, en orden: (versión, descripción, sentencias).
+# Para cambiar el esquema se agrega una versión nueva al final; las ya
+# publicadas no se modifican, porque las instalaciones existentes no las
+# vuelven a aplicar.
+MIGRACIONES = [
+    (1, "Tablas de oficinas, trabajadores y carnets", [
+        """
+        CREATE TABLE IF NOT EXISTS oficinas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(255) NOT NULL,
+            nomenclatura VARCHAR(50) NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trabajadores (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(255) NOT NULL,
+            apellidos VARCHAR(255) NOT NULL,
+            cedula VARCHAR(50) NOT NULL UNIQUE,
+            adscrito VARCHAR(255) NOT NULL,
+            cargo VARCHAR(255) NOT NULL,
+            imagen LONGBLOB,
+            tipo_carnet VARCHAR(50) NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS carnets (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            id_trabajador INT NOT NULL,
+            fecha_emision DATE NOT NULL,
+            fecha_expiracion DATE NOT NULL,
+            correlativo VARCHAR(50) NOT NULL UNIQUE,
+            FOREIGN KEY (id_trabajador) REFERENCES trabajadores(id)  -- Relación con la tabla de trabajadores
+        )
+        """,
+    ]),
+    (2, "Contadores de correlativos por oficina", [
+        """
+        CREATE TABLE IF NOT EXISTS correlativos_oficina (
+            adscrito VARCHAR(255) NOT NULL PRIMARY KEY,
+            ultimo INT UNSIGNED NOT NULL
+        )
+        """,
+    ]),
+    (3, "Índices para filtros de trabajadores y último carnet", [
+        # fetch_data por oficina y tipo, ordenado por id
+        "CREATE INDEX idx_trabajadores_adscrito_tipo ON trabajadores (adscrito, tipo_carnet, id)",
+        # fetch_data solo por tipo
+        "CREATE INDEX idx_trabajadores_tipo ON trabajadores (tipo_carnet, id)",
+        # feth_last_carnet y emitir_carnets: último carnet de cada trabajador
+        "CREATE INDEX idx_carnets_trabajador_emision ON carnets (id_trabajador, fecha_emision)",
+    ]),
+    (4, "Miniatura de la foto de cada trabajador", [
+        # JPEG de hasta funcion.MINIATURA_FOTO; en las filas existentes se genera al pedirla (fetch_miniatura)
+        "ALTER TABLE trabajadores ADD COLUMN miniatura BLOB NULL AFTER imagen",
+    ]),
+    (5, "Hash de las fotos guardadas en el almacén de fotos", [
+        # Si foto_hash no es NULL la foto está en photo_store y imagen queda en NULL
+        "ALTER TABLE trabajadores ADD COLUMN foto_hash CHAR(64) NULL AFTER imagen",
+        "CREATE INDEX idx_trabajadores_foto_hash ON trabajadores (foto_hash)",
+    ]),
+    (6, "Índice para filtrar trabajadores solo por oficina", [
+        # fetch_data e iter_trabajadores solo por oficina, ordenado por id: con
+        # (adscrito, tipo_carnet, id) el orden por id requería un filesort
+        "CREATE INDEX idx_trabajadores_adscrito ON trabajadores (adscrito, id)",
+    ]),
+]
+_esquema_migrado = False
+
+# Versiones mínimas del servidor: emitir_carnets y la paginación usan
+# funciones de ventana (ROW_NUMBER() OVER ...)
+VERSION_MINIMA_MYSQL = (8, 0)
+VERSION_MINIMA_MARIADB = (10, 2)
+
+# Ajustes de conexión leídos de settings.json, una vez por proceso
+_ajustes_conexion = None
+
+# Pools del proceso, indexados por el PID y los ajustes de conexión
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Registros de oficinas del proceso, por servidor y base de datos (ver DatabaseManager.registro_oficinas)
+_registros_oficinas = {}
+_registros_lock = threading.Lock()
+
+# Desfase entre el reloj del servidor y el local, por servidor:
+# (host, port) -> (desfase, instante de la medición en time.monotonic())
+_desfases_reloj = {}
+_desfases_lock = threading.Lock()
+
+# Índices de búsqueda del proceso, por servidor y base de datos (ver DatabaseManager.indice_busqueda)
+_indices_busqueda = {}
+_indices_lock = threading.Lock()
+
+
+def servidor_compatible(version):
+    """Indica si la versión del servidor (SELECT VERSION()) admite funciones de ventana."""
+    version = (version or "").lower()
+    es_mariadb = "mariadb" in version
+    # Algunas versiones de MariaDB anteponen "5.5.5-" por compatibilidad con clientes antiguos
+    if es_mariadb and version.startswith("5.5.5-"):
+        version = version[len("5.5.5-"):]
+    partes = version.split("-")[0].split(".")
+    try:
+        numero = (int(partes[0]), int(partes[1]))
+    except (ValueError, IndexError):
+        return False
+    return numero >= (VERSION_MINIMA_MARIADB if es_mariadb else VERSION_MINIMA_MYSQL)
+
+
+def clave_foto(cedula):
+    """Devuelve la clave con la que se pide la foto de un trabajador a fetch_foto."""
+    return f"{PREFIJO_CLAVE_FOTO}{cedula}"
+
+
+def es_clave_foto(valor):
+    """Indica si el valor es una clave de foto en lugar de la foto misma."""
+    return isinstance(valor, str) and valor.startswith((PREFIJO_CLAVE_FOTO, PREFIJO_CLAVE_ALMACEN))
+
+
+def leer_ajustes_conexion():
+    """
+    Devuelve los ajustes de conexión de settings.json.
+
+    El archivo se lee una sola vez por proceso; todas las instancias de
+    DatabaseManager comparten el resultado.
+    """
+    global _ajustes_conexion
+    if _ajustes_conexion is None:
+        with open('settings.json') as f:
+            settings = json.load(f)
+        _ajustes_conexion = {
+            "host": settings['mysql_host'],
+            "port": int(settings.get('mysql_port') or 3306),
+            "database": settings['mysql_db'],
+            "user": settings['mysql_user'],
+            "password": settings['mysql_pass'],
+            "pool_size": int(settings.get('mysql_pool_size') or TAMANO_POOL),
+        }
+    return _ajustes_conexion
+
+
+def obtener_pool(ajustes):
+    """
+    Devuelve el pool de conexiones del proceso para los ajustes indicados.
+
+    El pool se crea la primera vez que se pide. La clave incluye el PID, de
+    modo que los procesos de renderizado creados con fork no reutilizan los
+    sockets heredados del proceso principal.
+    """
+    clave = (os.getpid(),) + tuple(sorted(ajustes.items()))
+    with _pools_lock:
+        pool = _pools.get(clave)
+        if pool is None:
+            pool = PoolConexiones(ajustes)
+            _pools[clave] = pool
+        return pool
+
+
+class RegistroOficinas:
+    """
+    Lista de oficinas con índices por nombre y por código.
+
+    Se carga una vez desde la tabla de oficinas y la comparten todas las
+    instancias de DatabaseManager del proceso, de modo que las búsquedas
+    dentro de los bucles de importación y de renderizado no consultan la
+    base de datos. DatabaseManager la descarta al guardar, modificar o
+    eliminar una oficina.
+    """
+
+    def __init__(self, oficinas):
+        """
+        Parámetros:
+        - oficinas (list): Tuplas (nombre, codigo), como las devuelve la tabla.
+        """
+        self.oficinas = list(oficinas)
+        self.nombre_por_codigo = {codigo: nombre for nombre, codigo in self.oficinas}
+        self.codigo_por_nombre = {nombre: codigo for nombre, codigo in self.oficinas}
+
+    def nombre(self, codigo):
+        """Devuelve el nombre de la oficina con ese código, o None si no existe."""
+        return self.nombre_por_codigo.get(codigo)
+
+    def codigo(self, valor):
+        """
+        Devuelve el código de una oficina a partir de su código o de su nombre.
+
+        Retorna:
+        - str: El código, o None si el valor no coincide con ninguna oficina.
+        """
+        if valor in self.nombre_por_codigo:
+            return valor
+        return self.codigo_por_nombre.get(valor)
+
+    def __len__(self):
+        return len(self.oficinas)
+
+    def __iter__(self):
+        return iter(self.oficinas)
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones MySQL compartido por las instancias de DatabaseManager.
+
+    Cada operación toma una conexión con conexion() y la devuelve al terminar.
+    Si el pool está agotado, la operación espera a que se libere una conexión
+    en lugar de fallar. Dentro de un mismo hilo, las operaciones anidadas
+    reutilizan la conexión que el hilo ya tiene prestada, y con ella su
+    transacción: un commit() de la operación interior confirma también lo
+    que la exterior tenga pendiente. La transacción que quede abierta al
+    devolver la conexión, por un error, una excepción cualquiera o un
+    generador que se cierra a medias, se deshace con rollback().
+
+    Para no sumar viajes a la base de datos en cada operación, una conexión
+    solo se comprueba con ping si estuvo sin usarse más de
+    ESPERA_SIN_VERIFICAR segundos, y una conexión que falló con un error de
+    comunicación se descarta en lugar de volver al pool.
+    """
+
+    def __init__(self, ajustes):
+        self.semaforo = threading.BoundedSemaphore(ajustes["pool_size"])
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.parametros = {
+            "host": ajustes["host"],
+            "port": ajustes["port"],
+            "database": ajustes["database"],
+            "user": ajustes["user"],
+            "password": ajustes["password"],
+            "charset": 'utf8mb4',
+            "collation": 'utf8mb4_general_ci',
+        }
+        # Conexiones libres: (conexión, instante de la devolución en time.monotonic())
+        # La primera se abre ahora para detectar enseguida un servidor o datos de acceso incorrectos
+        self.libres = [(mysql.connector.connect(**self.parametros), time.monotonic())]
+
+    def _tomar(self):
+        """Devuelve una conexión libre lista para usar, abriendo una nueva si no hay."""
+        with self.lock:
+            cnx, devuelta = self.libres.pop() if self.libres else (None, None)
+        if cnx is None:
+            return mysql.connector.connect(**self.parametros)
+        if time.monotonic() - devuelta > ESPERA_SIN_VERIFICAR:
+            cnx.ping(reconnect=True, attempts=3, delay=1)
+        return cnx
+
+    @contextmanager
+    def conexion(self):
+        """Presta una conexión; si estuvo inactiva mucho tiempo, se comprueba antes y se reconecta si hace falta."""
+        actual = getattr(self.local, "cnx", None)
+        if actual is not None:
+            yield actual
+            return
+
+        with self.semaforo:
+            cnx = self._tomar()
+            self.local.cnx = cnx
+            descartar = False
+            try:
+                yield cnx
+            except (errors.OperationalError, errors.InterfaceError):
+                # La conexión puede estar cortada: no vuelve al pool
+                descartar = True
+                raise
+            finally:
+                self.local.cnx = None
+                # Se descarta cualquier transacción a medias antes de devolverla; también
+                # la de una lectura con autocommit desactivado, que fijaría la
+                # instantánea de las lecturas siguientes
+                if not descartar:
+                    try:
+                        if cnx.in_transaction:
+                            cnx.rollback()
+                    except Error:
+                        descartar = True
+                if descartar:
+                    try:
+                        cnx.close()
+                    except Error:
+                        pass
+                else:
+                    with self.lock:
+                        self.libres.append((cnx, time.monotonic()))
+
+
+class ReservaCorrelativos:
+    """
+    Reserva correlativos por bloques y los entrega sin consultar la base de datos.
+
+    Pensada para trabajos por lotes: cada vez que se agota el bloque de una
+    oficina se reservan tamano_bloque números con un solo viaje a la base de
+    datos (DatabaseManager.reservar_correlativos). Los números del bloque que
+    no se usen antes de terminar el proceso quedan como huecos.
+
+    Uso:
+        db.reserva_correlativos = ReservaCorrelativos(db)
+    """
+
+    def __init__(self, db, tamano_bloque=TAMANO_BLOQUE_CORRELATIVOS):
+        self.db = db
+        self.tamano_bloque = tamano_bloque
+        self.bloques = {}  # adscrito -> (siguiente, último reservado)
+        self.lock = threading.Lock()
+
+    def tomar(self, adscrito, cantidad=1):
+        """Devuelve una lista con 'cantidad' números nuevos para la oficina."""
+        numeros = []
+        with self.lock:
+            while len(numeros) < cantidad:
+                siguiente, limite = self.bloques.get(adscrito, (1, 0))
+                if siguiente > limite:
+                    reservar = max(self.tamano_bloque, cantidad - len(numeros))
+                    limite = self.db.reservar_correlativos(adscrito, reservar)
+                    siguiente = limite - reservar + 1
+                usar = min(limite - siguiente + 1, cantidad - len(numeros))
+                numeros.extend(range(siguiente, siguiente + usar))
+                self.bloques[adscrito] = (siguiente + usar, limite)
+        return numeros
+
 
 class DatabaseManager:
     def __init__(self):
@@ -14,79 +386,132 @@ class DatabaseManager:
         self.tabla_empleados = "trabajadores"
         self.tabla_oficina = "oficinas"
         self.table_carnet = "carnets"
+        self.tabla_correlativos = "correlativos_oficina"
+        # ReservaCorrelativos opcional para emitir correlativos por bloques
+        self.reserva_correlativos = None
+        # Caché de paginación: conteos por filtro y límites de página por filtro y
+        # tamaño, cada uno como (momento de lectura, valor)
+        self._conteos = {}
+        self._limites_paginas = {}
+        # Almacén de fotos en disco, si está configurado en settings.json
+        self.almacen_fotos = get_almacen_fotos()
+        if self.pool is not None:
+            self.migrar()
+
+    @contextmanager
+    def conexion(self):
+        """
+        Presta una conexión del pool para una operación.
+
+        Uso:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                ...
+        """
+        if self.pool is None:
+            raise Error(msg="No hay conexión a la base de datos.")
+        with self.pool.conexion() as cnx:
+            yield cnx
 
     def create_tables(self):
         """
         Crea las tablas en la base de datos si no existen.
+
+        Las tablas, índices y demás cambios del esquema están en MIGRACIONES;
+        este método aplica las que falten.
         """
+        self.migrar(forzar=True)
+
+    def migrar(self, forzar=False):
+        """
+        Aplica las migraciones de MIGRACIONES que todavía no están registradas.
+
+        Las versiones aplicadas se guardan en la tabla schema_version, por lo que
+        una instalación existente se actualiza en el lugar al abrir la
+        aplicación. Un bloqueo con GET_LOCK evita que dos procesos (por ejemplo,
+        los de renderizado) apliquen la misma migración a la vez. Se ejecuta
+        una sola vez por proceso, salvo que forzar sea True.
+        """
+        global _esquema_migrado
+        if _esquema_migrado and not forzar:
+            return
         try:
-            cursor = self.connection.cursor()
-
-            # Crear la tabla de oficinas si no existe
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS oficinas (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    nombre VARCHAR(255) NOT NULL,
-                    nomenclatura VARCHAR(50) NOT NULL UNIQUE
-                )
-            """)
-
-            # Crear la tabla de trabajadores si no existe
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS trabajadores (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    nombre VARCHAR(255) NOT NULL,
-                    apellidos VARCHAR(255) NOT NULL,
-                    cedula VARCHAR(50) NOT NULL UNIQUE,
-                    adscrito VARCHAR(255) NOT NULL,
-                    cargo VARCHAR(255) NOT NULL,
-                    imagen LONGBLOB,
-                    tipo_carnet VARCHAR(50) NOT NULL
-                )
-            """)
-            
-            # Crear la tabla de carnets si no existe
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS carnets (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    id_trabajador INT NOT NULL,
-                    fecha_emision DATE NOT NULL,
-                    fecha_expiracion DATE NOT NULL,
-                    correlativo VARCHAR(50) NOT NULL UNIQUE,
-                    FOREIGN KEY (id_trabajador) REFERENCES trabajadores(id)  -- Relación con la tabla de trabajadores
-                )
-            """)
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute("SELECT VERSION()")
+                version = cursor.fetchone()[0]
+                if not servidor_compatible(version):
+                    cursor.close()
+                    print(f"El servidor de base de datos ({version}) no es compatible: "
+                          f"se necesita MySQL {VERSION_MINIMA_MYSQL[0]}.{VERSION_MINIMA_MYSQL[1]} "
+                          f"o MariaDB {VERSION_MINIMA_MARIADB[0]}.{VERSION_MINIMA_MARIADB[1]} o posterior.")
+                    return
+                cursor.execute("SELECT GET_LOCK('carnets_migraciones', 60)")
+                cursor.fetchone()
+                try:
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_version (
+                            version INT NOT NULL PRIMARY KEY,
+                            descripcion VARCHAR(255) NOT NULL,
+                            aplicada DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    cursor.execute("SELECT version FROM schema_version")
+                    aplicadas = {fila[0] for fila in cursor.fetchall()}
+
+                    for version, descripcion, sentencias in MIGRACIONES:
+                        if version in aplicadas:
+                            continue
+                        for sentencia in sentencias:
+                            try:
+                                cursor.execute(sentencia)
+                            except Error as e:
+                                # El índice o la columna ya existían (creados a mano o por un intento anterior)
+                                if e.errno not in (errorcode.ER_DUP_KEYNAME, errorcode.ER_DUP_FIELDNAME):
+                                    raise
+                        cursor.execute(
+                            "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                            (version, descripcion)
+                        )
+                        cnx.commit()
+                        print(f"Migración {version} aplicada: {descripcion}")
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK('carnets_migraciones')")
+                    cursor.fetchone()
+                    cursor.close()
+            _esquema_migrado = True
+        except Error as e:
+            print(f"Error al migrar el esquema de la base de datos: {e}")
 
-            # Confirmar los cambios
-            self.connection.commit()
-            cursor.close()
-            print("Tablas creadas o verificadas correctamente.")
+    def version_esquema(self):
+        """Devuelve la última versión del esquema aplicada, o 0 si no hay ninguna."""
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                version = cursor.fetchone()[0]
+                cursor.close()
+                return version
         except Error as e:
-            print(f"Error al crear las tablas: {e}")
-    
+            print(f"Error al obtener la versión del esquema: {e}")
+            return 0
+
     def set_connection_details(self):
         """Establece los detalles de conexión a la base de datos."""
-        with open('settings.json') as f:
-            settings = json.load(f)
-        self.host = settings['mysql_host']
-        self.database = settings['mysql_db']
-        self.user = settings['mysql_user']
-        self.password = settings['mysql_pass']
+        self.ajustes = leer_ajustes_conexion()
+        self.host = self.ajustes['host']
+        self.port = self.ajustes['port']
+        self.database = self.ajustes['database']
+        self.user = self.ajustes['user']
+        self.password = self.ajustes['password']
 
     def connect_to_database(self):
-        """Establece la conexión a la base de datos."""
+        """Obtiene el pool de conexiones del proceso (lo crea si todavía no existe)."""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                charset='utf8mb4',
-                collation='utf8mb4_general_ci'
-            )
+            self.pool = obtener_pool(self.ajustes)
         except Error as e:
             print(f"Error al conectar a la base de datos: {e}")
-            self.connection = None
+            self.pool = None
     
     def generar_correlativo(self, id_trabajador):
         """
@@ -99,107 +524,614 @@ class DatabaseManager:
         - correlativo (str): Correlativo único en el formato "ADSCRIPCION-ID_TRABAJADOR-INCREMENTAL".
         """
         try:
-            cursor = self.connection.cursor()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
 
-            # Obtener la adscripción del trabajador
-            query_adscrito = f"SELECT adscrito FROM {self.tabla_empleados} WHERE id = %s"
-            cursor.execute(query_adscrito, (id_trabajador,))
-            resultado_adscrito = cursor.fetchone()
+                # Obtener la adscripción del trabajador
+                query_adscrito = f"SELECT adscrito FROM {self.tabla_empleados} WHERE id = %s"
+                cursor.execute(query_adscrito, (id_trabajador,))
+                resultado_adscrito = cursor.fetchone()
 
-            if not resultado_adscrito:
-                raise ValueError("No se encontró el trabajador con el ID proporcionado.")
+                if not resultado_adscrito:
+                    raise ValueError("No se encontró el trabajador con el ID proporcionado.")
 
-            adscrito = resultado_adscrito[0]  # Obtener la adscripción
-
-            # Obtener el último correlativo para esa adscripción
-            query_correlativo = f"""
-                SELECT correlativo FROM {self.table_carnet}
-                WHERE id_trabajador IN (
-                    SELECT id FROM {self.tabla_empleados} WHERE adscrito = %s
-                )
-                ORDER BY correlativo DESC
-                LIMIT 1
-            """
-            cursor.execute(query_correlativo, (adscrito,))
-            ultimo_correlativo = cursor.fetchone()
+                adscrito = resultado_adscrito[0]  # Obtener la adscripción
+                cursor.close()
 
-            if ultimo_correlativo:
-                # Extraer el número incremental del último correlativo
-                correlativo_str = ultimo_correlativo[0]
-                
-                # Usar una expresión regular para separar la parte alfabética y la numérica
-                match = re.match(r"([A-Za-z]+)(\d{4})$", correlativo_str)
-                if match:
-                    letras = match.group(1)  # Parte alfabética
-                    numero = int(match.group(2))  # Parte numérica como entero
-                    
-                    # Incrementar el número
-                    incremental = numero + 1
-                    
-            else:
-                # Si no hay correlativos previos, empezar desde 1
-                incremental = 1
+            # Tomar el siguiente número del contador de la oficina
+            incremental = self.tomar_correlativos(adscrito, 1)[0]
 
             # Generar el nuevo correlativo
             correlativo = f"{adscrito}{incremental:04d}"
 
-
             return correlativo
 
         except Error as e:
             print(f"Error al generar el correlativo: {e}")
             return None
-        finally:
-            cursor.close()
     
     def fetch_data_all(self):
-        """Consulta datos de la base de datos y los devuelve como un DataFrame."""
-        if self.connection is None:
-            print("No hay conexión a la base de datos.")
-            return None
+        """
+        Consulta datos de la base de datos y los devuelve como un DataFrame.
 
-        query = f"SELECT nombre, apellidos,cedula, adscrito, cargo, imagen, tipo_carnet FROM {self.tabla_empleados}"
-        
+        El DataFrame se arma con iter_trabajadores y no incluye las fotos (la
+        columna imagen tiene la clave de la foto). Para recorrer la tabla
+        completa sin cargarla en memoria, usar iter_trabajadores directamente.
+        Retorna None si la consulta falla.
+        """
+        columnas = ["nombre", "apellidos", "cedula", "adscrito", "cargo", "imagen", "tipo_carnet"]
         try:
-            df = pd.read_sql(query, self.connection)
-            return df
-        
-        except Error as e:
-            print(f"Error al ejecutar la consulta: {e}")
+            filas = [fila for bloque in self.iter_trabajadores() for fila in bloque]
+        except Error:
             return None
+        return pd.DataFrame(filas, columns=columnas)
+
+    @contextmanager
+    def conexion_dedicada(self):
+        """
+        Abre una conexión propia, fuera del pool, para una consulta larga.
+
+        iter_trabajadores la usa para leer sin búfer: la conexión queda ocupada
+        mientras se recorre el resultado, y si fuera del pool la reutilizarían
+        las operaciones anidadas del mismo hilo (por ejemplo, emitir carnets
+        entre un bloque y otro).
+        """
+        cnx = mysql.connector.connect(
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+            charset='utf8mb4',
+            collation='utf8mb4_general_ci'
+        )
+        try:
+            yield cnx
+        finally:
+            cnx.close()
+
+    def iter_trabajadores(self, adscrito=None, tipo=None, chunk_size=TAMANO_BLOQUE_LECTURA, incluir_fotos=False):
+        """
+        Recorre los trabajadores que cumplen el filtro, en bloques de chunk_size filas.
 
-    def fetch_data(self, adscrito=None, tipo=None, page=1):
-        limit = 25
-        offset = (page - 1) * limit
-        if adscrito and tipo:
-            query = f"SELECT nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet FROM {self.tabla_empleados} WHERE adscrito = '{adscrito}' AND tipo_carnet = '{tipo}' LIMIT {limit} OFFSET {offset}"
-        elif adscrito:
-            query = f"SELECT nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet FROM {self.tabla_empleados} WHERE adscrito = '{adscrito}' LIMIT {limit} OFFSET {offset}"
-        elif tipo:
-            query = f"SELECT nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet FROM {self.tabla_empleados} WHERE tipo_carnet = '{tipo}' LIMIT {limit} OFFSET {offset}"
+        La consulta se lee con un cursor sin búfer: el servidor envía las filas
+        a medida que se piden con fetchmany, así que en memoria solo hay un
+        bloque a la vez, sin importar el tamaño de la tabla.
+
+        Parámetros:
+        - adscrito (str): Código de la oficina (opcional).
+        - tipo (str): Tipo de carnet (opcional).
+        - chunk_size (int): Filas por bloque.
+        - incluir_fotos (bool): Si es True la columna imagen trae los bytes de
+          la foto (leídos del almacén de fotos si está ahí); si no, la clave de
+          la foto, como fetch_data.
+
+        Retorna:
+        - Un generador de listas de filas (nombre, apellidos, cedula, adscrito,
+          cargo, imagen, tipo_carnet), ordenadas por id. Si la lectura falla se
+          lanza el Error (ver _iter_consulta).
+        """
+        condicion, parametros = self._filtro_trabajadores(adscrito, tipo)
+        if incluir_fotos:
+            columnas = "nombre, apellidos, cedula, adscrito, cargo, imagen, foto_hash, tipo_carnet"
         else:
-            query = f"SELECT nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet FROM {self.tabla_empleados} LIMIT {limit} OFFSET {offset}"
+            columnas = COLUMNAS_LISTADO
+        query = f"SELECT {columnas} FROM {self.tabla_empleados} WHERE {condicion} ORDER BY id"
+
+        for filas in self._iter_consulta(query, parametros, chunk_size):
+            if incluir_fotos:
+                filas = [
+                    fila[:5] + (fila[5] if fila[6] is None else self._leer_almacen(fila[6]), fila[7])
+                    for fila in filas
+                ]
+            yield filas
+
+    def iter_trabajadores_con_carnet(self, adscrito=None, tipo=None, chunk_size=TAMANO_BLOQUE_LECTURA):
+        """
+        Recorre los trabajadores con su último carnet, en bloques de chunk_size filas.
+
+        El último carnet de cada trabajador se busca con una subconsulta por
+        fila sobre el índice (id_trabajador, fecha_emision), de modo que el
+        resultado se envía a medida que se lee, como en iter_trabajadores.
+
+        Retorna:
+        - Un generador de listas de filas (nombre, apellidos, cedula, adscrito,
+          cargo, tipo_carnet, correlativo, fecha_emision, fecha_expiracion),
+          ordenadas por id. Los trabajadores sin carnet tienen None en las tres
+          últimas columnas. Si la lectura falla se lanza el Error.
+        """
+        condicion, parametros = self._filtro_trabajadores(adscrito, tipo, alias="t")
+        query = f"""
+            SELECT t.nombre, t.apellidos, t.cedula, t.adscrito, t.cargo, t.tipo_carnet,
+                   c.correlativo, c.fecha_emision, c.fecha_expiracion
+            FROM {self.tabla_empleados} t
+            LEFT JOIN {self.table_carnet} c ON c.id = (
+                SELECT c2.id FROM {self.table_carnet} c2
+                WHERE c2.id_trabajador = t.id
+                ORDER BY c2.fecha_emision DESC, c2.id DESC
+                LIMIT 1
+            )
+            WHERE {condicion}
+            ORDER BY t.id
+        """
+        yield from self._iter_consulta(query, parametros, chunk_size)
+
+    def _iter_consulta(self, query, parametros, chunk_size):
+        """
+        Ejecuta una consulta con un cursor sin búfer y entrega el resultado en bloques.
+
+        Usa una conexión dedicada (ver conexion_dedicada). Si el generador se
+        abandona antes del final, al cerrar la conexión se descarta el resto
+        del resultado sin leerlo.
+
+        Si la consulta falla, incluso a mitad del recorrido, se lanza el Error:
+        un resultado cortado no debe confundirse con el final de las filas.
+        """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query)
+            with self.conexion_dedicada() as cnx:
+                cursor = cnx.cursor(buffered=False)
+                cursor.execute(f"SET SESSION net_write_timeout = {ESPERA_LECTURA}")
+                cursor.execute(query, tuple(parametros))
+                while True:
+                    filas = cursor.fetchmany(chunk_size)
+                    if not filas:
+                        break
+                    yield filas
+                cursor.close()
+        except Error as e:
+            print(f"Error al recorrer los trabajadores: {e}")
+            raise
+
+    def _filtro_trabajadores(self, adscrito=None, tipo=None, alias=None):
+        """
+        Devuelve la condición WHERE y sus parámetros para filtrar trabajadores.
+
+        alias es el alias de la tabla de trabajadores en la consulta, si tiene uno.
+        """
+        prefijo = f"{alias}." if alias else ""
+        condiciones = []
+        parametros = []
+        if adscrito:
+            condiciones.append(f"{prefijo}adscrito = %s")
+            parametros.append(adscrito)
+        if tipo:
+            condiciones.append(f"{prefijo}tipo_carnet = %s")
+            parametros.append(tipo)
+        return " AND ".join(condiciones) or "1 = 1", parametros
+
+    def _fetch_pagina(self, adscrito, tipo, despues_de, limite):
+        """
+        Devuelve hasta 'limite' trabajadores con id mayor que despues_de, ordenados por id.
+
+        Retorna:
+        - list: Tuplas (id, nombre, apellidos, cedula, adscrito, cargo, clave de la foto, tipo_carnet).
+        """
+        condicion, parametros = self._filtro_trabajadores(adscrito, tipo)
+        query = f"""
+            SELECT id, {COLUMNAS_LISTADO}
+            FROM {self.tabla_empleados}
+            WHERE {condicion} AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """
+        with self.conexion() as cnx:
+            cursor = cnx.cursor()
+            cursor.execute(query, (*parametros, despues_de, limite))
             resultado = cursor.fetchall()
             cursor.close()
-            return resultado
+        return resultado
+
+    def _limite_pagina(self, adscrito, tipo, page, page_size):
+        """
+        Devuelve el id del último trabajador anterior a la página indicada, o
+        None si la página está después de la última.
+
+        La primera vez que se pide una página de un filtro se leen los límites
+        de todas sus páginas con una sola consulta, que recorre una vez el
+        índice (adscrito, tipo_carnet, id) sin leer las filas; se guardan por
+        filtro y tamaño de página hasta la próxima escritura de este equipo o
+        durante VIGENCIA_PAGINACION segundos, así que ir a la última página o
+        saltar a cualquier otra no vuelve a recorrerlo.
+        """
+        if page <= 1:
+            return 0
+        clave = (adscrito, tipo, page_size)
+        limites = self._en_cache_paginacion(self._limites_paginas, clave)
+        if limites is None:
+            condicion, parametros = self._filtro_trabajadores(adscrito, tipo)
+            # El id de la fila k * page_size es el límite de la página k + 1
+            query = f"""
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS fila
+                    FROM {self.tabla_empleados}
+                    WHERE {condicion}
+                ) AS numeradas
+                WHERE MOD(fila, %s) = 0
+                ORDER BY fila
+            """
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (*parametros, page_size))
+                limites = {numero: fila[0] for numero, fila in enumerate(cursor.fetchall(), start=2)}
+                cursor.close()
+            self._limites_paginas[clave] = (time.monotonic(), limites)
+        return limites.get(page)
+
+    def fetch_data(self, adscrito=None, tipo=None, page=1, page_size=TAMANO_PAGINA):
+        """
+        Devuelve una página de trabajadores, opcionalmente filtrada.
+
+        La paginación es por clave (WHERE id > último id de la página anterior).
+        Los límites de todas las páginas del filtro se calculan juntos la
+        primera vez que se pide una página distinta de la primera (ver
+        _limite_pagina); a partir de ahí cualquier página cuesta lo mismo que
+        la primera, hasta la próxima escritura.
+
+        Parámetros:
+        - adscrito (str): Código de la oficina (opcional).
+        - tipo (str): Tipo de carnet (opcional).
+        - page (int): Número de página, desde 1.
+        - page_size (int): Trabajadores por página.
+
+        Retorna:
+        - list: Tuplas (nombre, apellidos, cedula, adscrito, cargo, clave de la foto, tipo_carnet),
+          o None si ocurre un error. La foto se obtiene aparte con fetch_foto.
+        """
+        try:
+            despues_de = self._limite_pagina(adscrito, tipo, page, page_size)
+            if despues_de is None:
+                return []
+            filas = self._fetch_pagina(adscrito, tipo, despues_de, page_size)
+            return [fila[1:] for fila in filas]
         except Error as e:
             print(f"Error al obtener datos: {e}")
             return None
+
+    def contar_trabajadores(self, adscrito=None, tipo=None):
+        """
+        Devuelve cuántos trabajadores cumplen el filtro.
+
+        El resultado se guarda en caché por filtro durante VIGENCIA_PAGINACION
+        segundos y se descarta antes con cada escritura de este equipo en la
+        tabla de trabajadores (ver invalidar_paginacion).
+        """
+        clave = (adscrito, tipo)
+        conteo = self._en_cache_paginacion(self._conteos, clave)
+        if conteo is None:
+            condicion, parametros = self._filtro_trabajadores(adscrito, tipo)
+            try:
+                with self.conexion() as cnx:
+                    cursor = cnx.cursor()
+                    cursor.execute(f"SELECT COUNT(*) FROM {self.tabla_empleados} WHERE {condicion}", tuple(parametros))
+                    conteo = cursor.fetchone()[0]
+                    cursor.close()
+            except Error as e:
+                print(f"Error al contar los trabajadores: {e}")
+                return 0
+            self._conteos[clave] = (time.monotonic(), conteo)
+        return conteo
+
+    def contar_paginas(self, adscrito=None, tipo=None, page_size=TAMANO_PAGINA):
+        """Devuelve el número de páginas del filtro (al menos 1)."""
+        return max(1, -(-self.contar_trabajadores(adscrito, tipo) // page_size))
+
+    @staticmethod
+    def _en_cache_paginacion(cache, clave):
+        """Devuelve el valor guardado en la caché de paginación, o None si no está o ya venció."""
+        guardado = cache.get(clave)
+        if guardado is None or time.monotonic() - guardado[0] > VIGENCIA_PAGINACION:
+            return None
+        return guardado[1]
+
+    def invalidar_paginacion(self):
+        """
+        Descarta los conteos y límites de página guardados; se llama tras cada
+        escritura y al filtrar o refrescar la lista en la interfaz.
+        """
+        self._conteos.clear()
+        self._limites_paginas.clear()
     
+    def iter_data(self, adscrito=None, tipo=None, page_size=TAMANO_BLOQUE_LECTURA):
+        """
+        Recorre todos los trabajadores que cumplen el filtro, fila por fila.
+
+        Parámetros:
+        - adscrito (str): Código de la oficina (opcional).
+        - tipo (str): Tipo de carnet (opcional).
+        - page_size (int): Filas por bloque de iter_trabajadores.
+
+        Retorna:
+        - Un generador de filas en el mismo formato que fetch_data.
+        """
+        for bloque in self.iter_trabajadores(adscrito, tipo, page_size):
+            yield from bloque
+
+    def iter_data_by_cedulas(self, cedulas, chunk_size=500):
+        """
+        Recorre los trabajadores de una lista de cédulas.
+
+        Las cédulas se consultan en bloques de chunk_size con WHERE cedula IN (...),
+        en lugar de una consulta por trabajador.
+
+        Parámetros:
+        - cedulas (iterable): Cédulas a buscar.
+        - chunk_size (int): Cédulas por consulta.
+
+        Retorna:
+        - Un generador de filas en el mismo formato que fetch_data. Las cédulas
+          que no existen se omiten. Si una consulta falla se lanza el Error.
+        """
+        cedulas = list(cedulas)
+        for inicio in range(0, len(cedulas), chunk_size):
+            bloque = cedulas[inicio:inicio + chunk_size]
+            marcadores = ", ".join(["%s"] * len(bloque))
+            query = f"SELECT {COLUMNAS_LISTADO} FROM {self.tabla_empleados} WHERE cedula IN ({marcadores})"
+            try:
+                # La conexión se devuelve al pool antes de entregar las filas
+                with self.conexion() as cnx:
+                    cursor = cnx.cursor()
+                    cursor.execute(query, tuple(bloque))
+                    resultado = cursor.fetchall()
+                    cursor.close()
+            except Error as e:
+                print(f"Error al obtener datos por cédula: {e}")
+                raise
+            yield from resultado
+
     def fetch_data_by_cedula(self, cedula):
-        query = f"SELECT nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet FROM {self.tabla_empleados} WHERE cedula = %s"
+        """Devuelve el trabajador de la cédula en el formato de fetch_data, o None si no existe."""
+        query = f"SELECT {COLUMNAS_LISTADO} FROM {self.tabla_empleados} WHERE cedula = %s"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (cedula,))
-            resultado = cursor.fetchone()
-            cursor.close()
-            return resultado
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (cedula,))
+                resultado = cursor.fetchone()
+                cursor.close()
+                return resultado
         except Error as e:
             print(f"Error al obtener datos: {e}")
             return None
+
+    def indice_busqueda(self):
+        """
+        Devuelve el IndiceBusqueda del proceso, construyéndolo si hace falta.
+
+        El índice se arma con una sola consulta sobre nombre, apellidos,
+        cédula y cargo, y se descarta con cada escritura en la tabla de
+        trabajadores (ver invalidar_busqueda). Si la consulta falla se
+        devuelve un índice vacío que no se guarda, para volver a intentarlo
+        en la siguiente llamada.
+        """
+        clave = (self.host, self.port, self.database)
+        with _indices_lock:
+            indice = _indices_busqueda.get(clave)
+        if indice is not None:
+            return indice
+
+        query = f"SELECT id, nombre, apellidos, cedula, cargo FROM {self.tabla_empleados}"
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query)
+                indice = IndiceBusqueda(cursor.fetchall())
+                cursor.close()
+        except Error as e:
+            print(f"Error al construir el índice de búsqueda: {e}")
+            return IndiceBusqueda()
+        with _indices_lock:
+            _indices_busqueda[clave] = indice
+        return indice
+
+    def invalidar_busqueda(self):
+        """Descarta el índice de búsqueda; se llama tras cada escritura en la tabla de trabajadores."""
+        with _indices_lock:
+            _indices_busqueda.pop((self.host, self.port, self.database), None)
+
+    def buscar_trabajadores(self, consulta, limite=100):
+        """
+        Busca trabajadores por nombre, apellidos, cédula o cargo.
+
+        No distingue mayúsculas ni acentos, acepta prefijos ("jos per") y, si
+        no hay coincidencias, tolera errores de escritura (ver IndiceBusqueda).
+
+        Parámetros:
+        - consulta (str): Texto a buscar.
+        - limite (int): Máximo de resultados.
+
+        Retorna:
+        - list: Filas en el formato de fetch_data, de la más a la menos parecida.
+        """
+        return self.fetch_data_by_ids(self.indice_busqueda().buscar(consulta, limite))
+
+    def fetch_data_by_ids(self, ids):
+        """
+        Devuelve los trabajadores de una lista de ids, en el mismo orden.
+
+        Retorna:
+        - list: Filas en el formato de fetch_data. Los ids que no existen se omiten.
+        """
+        ids = list(ids)
+        if not ids:
+            return []
+        marcadores = ", ".join(["%s"] * len(ids))
+        query = f"SELECT id, {COLUMNAS_LISTADO} FROM {self.tabla_empleados} WHERE id IN ({marcadores})"
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, tuple(ids))
+                filas = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+                cursor.close()
+        except Error as e:
+            print(f"Error al obtener datos: {e}")
+            return []
+        return [filas[i] for i in ids if i in filas]
+
+    def fetch_foto(self, clave):
+        """
+        Devuelve la foto de un trabajador.
+
+        Parámetros:
+        - clave (str): Clave de la foto, tal como la devuelven las consultas de
+          listado (ver clave_foto).
+
+        Retorna:
+        - bytes: La foto, o None si no existe o si ocurre un error.
+        """
+        return self.fetch_fotos([clave]).get(clave)
+
+    def fetch_fotos(self, claves, chunk_size=TAMANO_LOTE_IMPORTACION):
+        """
+        Devuelve las fotos de varios trabajadores.
+
+        Las claves "sha256:" se leen directamente del almacén de fotos, sin
+        consultar la base de datos; las claves "foto:" se consultan por
+        bloques de chunk_size cédulas.
+
+        Retorna:
+        - dict: Clave -> bytes de la foto. Las claves sin foto se omiten.
+        """
+        fotos = {}
+        cedulas = []
+        for clave in dict.fromkeys(claves):
+            if not es_clave_foto(clave):
+                continue
+            if clave.startswith(PREFIJO_CLAVE_ALMACEN):
+                datos = self._leer_almacen(clave[len(PREFIJO_CLAVE_ALMACEN):])
+                if datos is not None:
+                    fotos[clave] = datos
+            else:
+                cedulas.append(clave[len(PREFIJO_CLAVE_FOTO):])
+        if not cedulas:
+            return fotos
+
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                for inicio in range(0, len(cedulas), chunk_size):
+                    bloque = cedulas[inicio:inicio + chunk_size]
+                    marcadores = ", ".join(["%s"] * len(bloque))
+                    cursor.execute(
+                        f"""
+                        SELECT cedula, imagen, foto_hash FROM {self.tabla_empleados}
+                        WHERE cedula IN ({marcadores}) AND (imagen IS NOT NULL OR foto_hash IS NOT NULL)
+                        """,
+                        tuple(bloque),
+                    )
+                    for cedula, imagen, foto_hash in cursor.fetchall():
+                        datos = bytes(imagen) if foto_hash is None else self._leer_almacen(foto_hash)
+                        if datos is not None:
+                            fotos[clave_foto(cedula)] = datos
+                cursor.close()
+        except Error as e:
+            print(f"Error al obtener las fotos: {e}")
+        return fotos
+
+    def _leer_almacen(self, foto_hash):
+        """Lee una foto del almacén, o devuelve None si no está o no hay almacén configurado."""
+        if self.almacen_fotos is None:
+            print(f"La foto {foto_hash} está en el almacén de fotos, pero photo_store_dir no está configurado.")
+            return None
+        return self.almacen_fotos.leer(foto_hash)
+
+    def fetch_miniatura(self, clave):
+        """
+        Devuelve la miniatura JPEG de la foto de un trabajador.
+
+        Si el trabajador se guardó antes de que existiera la columna miniatura,
+        se genera a partir de la foto y se guarda, de modo que solo la primera
+        consulta lee la foto completa.
+
+        Parámetros:
+        - clave (str): Clave de la foto (ver clave_foto).
+
+        Retorna:
+        - bytes: La miniatura, o None si no hay foto o si ocurre un error.
+        """
+        if not es_clave_foto(clave):
+            return None
+        if clave.startswith(PREFIJO_CLAVE_ALMACEN):
+            # Todos los trabajadores con la misma foto tienen la misma miniatura
+            columna, valor = "foto_hash", clave[len(PREFIJO_CLAVE_ALMACEN):]
+        else:
+            columna, valor = "cedula", clave[len(PREFIJO_CLAVE_FOTO):]
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(
+                    f"SELECT miniatura FROM {self.tabla_empleados} WHERE {columna} = %s ORDER BY miniatura IS NULL LIMIT 1",
+                    (valor,),
+                )
+                fila = cursor.fetchone()
+                cursor.close()
+            if fila is None:
+                return None
+            if fila[0] is not None:
+                return bytes(fila[0])
+
+            miniatura = crear_miniatura(self.fetch_foto(clave))
+            if miniatura is not None:
+                with self.conexion() as cnx:
+                    cursor = cnx.cursor()
+                    cursor.execute(
+                        f"UPDATE {self.tabla_empleados} SET miniatura = %s WHERE {columna} = %s AND miniatura IS NULL",
+                        (miniatura, valor),
+                    )
+                    cnx.commit()
+                    cursor.close()
+            return miniatura
+        except Error as e:
+            print(f"Error al obtener la miniatura: {e}")
+            return None
+
+    def migrar_fotos_a_almacen(self, chunk_size=100):
+        """
+        Mueve al almacén de fotos las fotos que siguen en trabajadores.imagen.
+
+        Se recorre la tabla por id en bloques de chunk_size; cada bloque se
+        confirma en su propia transacción, así que el proceso puede
+        interrumpirse y volver a ejecutarse. Las fotos repetidas se guardan
+        una sola vez en el almacén.
+
+        Retorna:
+        - int: Número de fotos movidas.
+        """
+        if self.almacen_fotos is None:
+            print("No hay almacén de fotos configurado (photo_store_dir en settings.json).")
+            return 0
+
+        movidas = 0
+        ultimo_id = 0
+        while True:
+            try:
+                with self.conexion() as cnx:
+                    cursor = cnx.cursor()
+                    cursor.execute(
+                        f"""
+                        SELECT id, imagen FROM {self.tabla_empleados}
+                        WHERE id > %s AND imagen IS NOT NULL AND foto_hash IS NULL
+                        ORDER BY id
+                        LIMIT %s
+                        """,
+                        (ultimo_id, chunk_size),
+                    )
+                    filas = cursor.fetchall()
+                    if not filas:
+                        cursor.close()
+                        return movidas
+                    # Primero se escriben los archivos; solo después se borra el blob
+                    cambios = [(self.almacen_fotos.guardar(bytes(imagen)), id_trabajador) for id_trabajador, imagen in filas]
+                    cursor.executemany(
+                        f"UPDATE {self.tabla_empleados} SET foto_hash = %s, imagen = NULL WHERE id = %s AND foto_hash IS NULL",
+                        cambios,
+                    )
+                    cnx.commit()
+                    cursor.close()
+            except (Error, OSError) as e:
+                print(f"Error al mover las fotos al almacén: {e}")
+                return movidas
+            movidas += len(filas)
+            ultimo_id = filas[-1][0]
+            print(f"{movidas} fotos movidas al almacén")
     
     def fetch_id_by_cedula(self, cedula):
         """
@@ -212,24 +1144,24 @@ class DatabaseManager:
         - id_trabajador (int): ID del trabajador si se encuentra, None en caso contrario.
         """
         try:
-            cursor = self.connection.cursor()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
 
-            # Obtener el ID del trabajador según la cédula
-            query = f"SELECT id FROM {self.tabla_empleados} WHERE cedula = %s"
-            cursor.execute(query, (cedula,))
-            resultado = cursor.fetchone()
+                # Obtener el ID del trabajador según la cédula
+                query = f"SELECT id FROM {self.tabla_empleados} WHERE cedula = %s"
+                cursor.execute(query, (cedula,))
+                resultado = cursor.fetchone()
+                cursor.close()
 
-            if resultado:
-                id_trabajador = resultado[0]
-                return id_trabajador
-            else:
-                return None
+                if resultado:
+                    id_trabajador = resultado[0]
+                    return id_trabajador
+                else:
+                    return None
 
         except Error as e:
             print(f"Error al obtener el ID por cédula: {e}")
             return None
-        finally:
-            cursor.close()
 
     def fetch_oficinas_with_id(self):
         """
@@ -240,11 +1172,12 @@ class DatabaseManager:
         """
         query = f"SELECT * FROM {self.tabla_oficina}"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            resultado = cursor.fetchall()
-            cursor.close()
-            return resultado
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query)
+                resultado = cursor.fetchall()
+                cursor.close()
+                return resultado
         except Error as e:
             print(f"Error al obtener la lista de oficinas: {e}")
             return []
@@ -253,29 +1186,74 @@ class DatabaseManager:
         """
         Obtiene una lista de oficinas desde la tabla de oficinas.
 
+        La lista sale de registro_oficinas, así que solo la primera llamada
+        consulta la base de datos.
+
         Retorna:
         - Una lista de tuplas en el formato [(nombre_oficina, codigo_oficina), ...].
         """
+        return list(self.registro_oficinas())
+
+    def registro_oficinas(self):
+        """
+        Devuelve el RegistroOficinas del proceso, cargándolo si hace falta.
+
+        Si la consulta falla se devuelve un registro vacío que no se guarda,
+        para volver a intentarlo en la siguiente llamada.
+        """
+        clave = (self.host, self.port, self.database)
+        with _registros_lock:
+            registro = _registros_oficinas.get(clave)
+        if registro is not None:
+            return registro
+
         query = f"SELECT nombre, nomenclatura FROM {self.tabla_oficina}"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query)
-            resultado = cursor.fetchall()
-            cursor.close()
-            return resultado
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query)
+                registro = RegistroOficinas(cursor.fetchall())
+                cursor.close()
         except Error as e:
             print(f"Error al obtener la lista de oficinas: {e}")
-            return []
+            return RegistroOficinas([])
+        with _registros_lock:
+            _registros_oficinas[clave] = registro
+        return registro
+
+    def invalidar_oficinas(self):
+        """Descarta el registro de oficinas; se llama tras cada cambio en la tabla de oficinas."""
+        with _registros_lock:
+            _registros_oficinas.pop((self.host, self.port, self.database), None)
     
     def get_total_filas(self):
         """Obtiene el número total de filas en la tabla carnets."""
         query = f"SELECT COUNT(*) AS total_filas FROM {self.tabla_empleados}"
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        resultado = cursor.fetchone()
-        cursor.close()
+        with self.conexion() as cnx:
+            cursor = cnx.cursor()
+            cursor.execute(query)
+            resultado = cursor.fetchone()
+            cursor.close()
         return resultado[0]
 
+    def _preparar_foto(self, imagen):
+        """
+        Decide dónde se guarda una foto nueva.
+
+        Con almacén de fotos la foto se escribe en él (una sola vez por
+        contenido) y en la tabla solo queda su hash; sin almacén se guarda en
+        trabajadores.imagen como siempre.
+
+        Retorna:
+        - tuple: (imagen, foto_hash, miniatura) para las columnas del mismo nombre.
+        """
+        if imagen is None:
+            return None, None, None
+        miniatura = crear_miniatura(imagen)
+        if self.almacen_fotos is None:
+            return imagen, None, miniatura
+        return None, self.almacen_fotos.guardar(bytes(imagen)), miniatura
+
     def save_new_entry(self, data):
         """
         Guarda una nueva entrada en la base de datos.
@@ -291,27 +1269,143 @@ class DatabaseManager:
                 - imagen (datos de la imagen en binario)
                 - tipo_carnet
 
+        La miniatura de la foto se genera aquí y se guarda junto a ella.
+
         Retorna:
         - True si la entrada se guardó correctamente, False en caso contrario.
         """
-        query = f"INSERT INTO {self.tabla_empleados} (nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+        query = f"INSERT INTO {self.tabla_empleados} (nombre, apellidos, cedula, adscrito, cargo, imagen, foto_hash, miniatura, tipo_carnet) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (
-                data['nombre'],
-                data['apellidos'],
-                data['cedula'],
-                data['adscrito'],
-                data['cargo'],
-                data['imagen'], 
-                data['tipo_carnet']
-            ))
-            self.connection.commit()
-            return True
-        except Error as e:
+            imagen, foto_hash, miniatura = self._preparar_foto(data['imagen'])
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (
+                    data['nombre'],
+                    data['apellidos'],
+                    data['cedula'],
+                    data['adscrito'],
+                    data['cargo'],
+                    imagen,
+                    foto_hash,
+                    miniatura,
+                    data['tipo_carnet']
+                ))
+                cnx.commit()
+                self.invalidar_paginacion()
+                self.invalidar_busqueda()
+                return True
+        except (Error, OSError) as e:
             print(f"Error al guardar la entrada: {e}")
             return False
 
+    def fetch_cedulas_existentes(self, cedulas, chunk_size=TAMANO_LOTE_IMPORTACION):
+        """
+        Devuelve cuáles de las cédulas ya están registradas.
+
+        Parámetros:
+        - cedulas (iterable): Cédulas a verificar.
+        - chunk_size (int): Cédulas por consulta.
+
+        Retorna:
+        - set: Cédulas (como texto) que ya existen en la tabla de trabajadores.
+        """
+        cedulas = [str(cedula) for cedula in cedulas]
+        existentes = set()
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                for inicio in range(0, len(cedulas), chunk_size):
+                    bloque = cedulas[inicio:inicio + chunk_size]
+                    marcadores = ", ".join(["%s"] * len(bloque))
+                    cursor.execute(f"SELECT cedula FROM {self.tabla_empleados} WHERE cedula IN ({marcadores})", tuple(bloque))
+                    existentes.update(str(fila[0]) for fila in cursor.fetchall())
+                cursor.close()
+        except Error as e:
+            print(f"Error al verificar duplicados: {e}")
+        return existentes
+
+    def bulk_upsert_trabajadores(self, registros, chunk_size=TAMANO_LOTE_IMPORTACION):
+        """
+        Inserta o actualiza muchos trabajadores a la vez.
+
+        Los registros se agrupan en bloques de hasta chunk_size filas (o menos,
+        si las fotos del bloque superan MAX_BYTES_LOTE_IMPORTACION). Cada bloque
+        se escribe con un único INSERT ... ON DUPLICATE KEY UPDATE mediante
+        executemany y se confirma en su propia transacción. Si un bloque falla,
+        se revierte completo y se continúa con el siguiente.
+
+        Al actualizar, un cargo vacío o una imagen None conservan el valor
+        registrado. La miniatura se genera con cada foto nueva.
+
+        Parámetros:
+        - registros (iterable): Diccionarios con las claves de save_new_entry
+          (nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet).
+          Puede ser un generador; solo se mantiene en memoria un bloque.
+        - chunk_size (int): Máximo de filas por transacción.
+
+        Retorna:
+        - dict: {"agregados", "actualizados", "errores"} con el número de filas.
+        """
+        query = f"""
+            INSERT INTO {self.tabla_empleados} (nombre, apellidos, cedula, adscrito, cargo, imagen, foto_hash, miniatura, tipo_carnet)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                nombre = VALUES(nombre),
+                apellidos = VALUES(apellidos),
+                adscrito = VALUES(adscrito),
+                cargo = IF(VALUES(cargo) = '', cargo, VALUES(cargo)),
+                miniatura = IF(VALUES(imagen) IS NULL AND VALUES(foto_hash) IS NULL, miniatura, VALUES(miniatura)),
+                imagen = IF(VALUES(imagen) IS NULL AND VALUES(foto_hash) IS NULL, imagen, VALUES(imagen)),
+                foto_hash = IF(VALUES(imagen) IS NULL AND VALUES(foto_hash) IS NULL, foto_hash, VALUES(foto_hash)),
+                tipo_carnet = VALUES(tipo_carnet)
+        """
+        resumen = {"agregados": 0, "actualizados": 0, "errores": 0}
+        registros = iter(registros)
+
+        while True:
+            bloque = []
+            tamano = 0
+            for registro in islice(registros, chunk_size):
+                bloque.append(registro)
+                tamano += len(registro['imagen'] or b"")
+                if tamano >= MAX_BYTES_LOTE_IMPORTACION:
+                    break
+            if not bloque:
+                if resumen["agregados"] or resumen["actualizados"]:
+                    self.invalidar_paginacion()
+                    self.invalidar_busqueda()
+                return resumen
+
+            try:
+                valores = [
+                    (r['nombre'], r['apellidos'], str(r['cedula']), r['adscrito'], r['cargo'] or '',
+                     *self._preparar_foto(r['imagen']), r['tipo_carnet'])
+                    for r in bloque
+                ]
+            except OSError as e:
+                print(f"Error al guardar las fotos de un bloque de {len(bloque)} registros: {e}")
+                resumen["errores"] += len(bloque)
+                continue
+            # Un mismo archivo puede repetir cédulas; cuentan una vez como agregadas
+            cedulas = list(dict.fromkeys(fila[2] for fila in valores))
+            try:
+                with self.conexion() as cnx:
+                    cursor = cnx.cursor()
+                    marcadores = ", ".join(["%s"] * len(cedulas))
+                    cursor.execute(f"SELECT cedula FROM {self.tabla_empleados} WHERE cedula IN ({marcadores})", tuple(cedulas))
+                    existentes = {str(fila[0]) for fila in cursor.fetchall()}
+
+                    cursor.executemany(query, valores)
+                    cnx.commit()
+                    cursor.close()
+            except Error as e:
+                print(f"Error al importar un bloque de {len(bloque)} registros: {e}")
+                resumen["errores"] += len(bloque)
+                continue
+
+            resumen["actualizados"] += len(existentes)
+            resumen["agregados"] += len(cedulas) - len(existentes)
+
     def feth_last_carnet(self, id_trabajador):
         """
         Obtiene el último carnet hecho según el trabajador.
@@ -330,38 +1424,228 @@ class DatabaseManager:
         }
         """
         try:
-            cursor = self.connection.cursor()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+
+                # Obtener el último carnet para el trabajador
+                query = f"""
+                    SELECT * FROM {self.table_carnet}
+                    WHERE id_trabajador = %s
+                    ORDER BY fecha_emision DESC
+                    LIMIT 1
+                """
+                cursor.execute(query, (id_trabajador,))
+                ultimo_carnet = cursor.fetchone()
+                cursor.close()
+
+                if not ultimo_carnet:
+                    return None
+
+                # Crear un diccionario con los datos del carnet
+                carnet = {
+                    "id": ultimo_carnet[0],
+                    "id_trabajador": ultimo_carnet[1],
+                    "fecha_emision": ultimo_carnet[2],
+                    "fecha_expiracion": ultimo_carnet[3],
+                    "correlativo": ultimo_carnet[4]
+                }
+
+                return carnet
 
-            # Obtener el último carnet para el trabajador
-            query = f"""
-                SELECT * FROM {self.table_carnet}
-                WHERE id_trabajador = %s
-                ORDER BY fecha_emision DESC
-                LIMIT 1
-            """
-            cursor.execute(query, (id_trabajador,))
-            ultimo_carnet = cursor.fetchone()
+        except Error as e:
+            print(f"Error al obtener el último carnet: {e}")
+            return None
+    
+    def emitir_carnets(self, cedulas, periodo_tiempo=365):
+        """
+        Obtiene el carnet vigente de varios trabajadores, emitiendo los que faltan.
+
+        En lugar de las consultas por trabajador de feth_last_carnet,
+        check_fecha_emision_expiracion y save_carnet, el lote completo usa:
+        - una consulta con ROW_NUMBER() que trae el último carnet de cada
+          trabajador junto con la hora del servidor,
+        - una reserva atómica de correlativos por oficina involucrada
+          (ver tomar_correlativos),
+        - un INSERT de varias filas con los carnets nuevos,
+        - una consulta que relee los carnets insertados por su correlativo.
+        Los carnets se insertan en una sola transacción. Si algún correlativo
+        ya existía (por ejemplo, emitido antes de que hubiera contador), el
+        lote se reintenta con números nuevos.
 
-            if not ultimo_carnet:
-                return None
+        Parámetros:
+        - cedulas (iterable): Cédulas de los trabajadores.
+        - periodo_tiempo (int): Vigencia de los carnets nuevos en días.
 
-            # Crear un diccionario con los datos del carnet
-            carnet = {
-                "id": ultimo_carnet[0],
-                "id_trabajador": ultimo_carnet[1],
-                "fecha_emision": ultimo_carnet[2],
-                "fecha_expiracion": ultimo_carnet[3],
-                "correlativo": ultimo_carnet[4]
-            }
+        Retorna:
+        - dict: Cédula (como texto) -> carnet, con las mismas claves que
+          feth_last_carnet. Las cédulas que no existen quedan con None.
 
-            return carnet
+        Si ocurre un error de base de datos se lanza el Error: un carnet sin
+        emitir no debe confundirse con una cédula que no existe.
+        """
+        cedulas = list(dict.fromkeys(str(cedula) for cedula in cedulas))
+        if not cedulas:
+            return {}
+
+        for intento in range(INTENTOS_EMISION):
+            try:
+                return self._emitir_carnets(cedulas, periodo_tiempo)
+            except mysql.connector.IntegrityError as e:
+                print(f"Correlativo repetido al emitir carnets, reintentando: {e}")
+                if intento == INTENTOS_EMISION - 1:
+                    print("No se pudieron emitir los carnets: los correlativos siguen repetidos.")
+                    raise
+            except Error as e:
+                print(f"Error al emitir los carnets: {e}")
+                raise
+
+    def _emitir_carnets(self, cedulas, periodo_tiempo):
+        """Emite los carnets de emitir_carnets en una transacción; deja pasar los errores."""
+        marcadores = ", ".join(["%s"] * len(cedulas))
+        ahora = self.hora_servidor()
+        vigencia, parametros_vigencia = self.predicado_vigencia("c", ahora)
+        query_vigentes = f"""
+            SELECT t.cedula, t.id, t.adscrito, c.id, c.fecha_emision, c.fecha_expiracion, c.correlativo, {vigencia}
+            FROM {self.tabla_empleados} t
+            LEFT JOIN (
+                SELECT id, id_trabajador, fecha_emision, fecha_expiracion, correlativo,
+                       ROW_NUMBER() OVER (PARTITION BY id_trabajador ORDER BY fecha_emision DESC, id DESC) AS fila
+                FROM {self.table_carnet}
+                WHERE id_trabajador IN (SELECT id FROM {self.tabla_empleados} WHERE cedula IN ({marcadores}))
+            ) c ON c.id_trabajador = t.id AND c.fila = 1
+            WHERE t.cedula IN ({marcadores})
+        """
 
-        except Error as e:
-            print(f"Error al obtener el último carnet: {e}")
-            return None
-        finally:
+        with self.conexion() as cnx:
+            cursor = cnx.cursor()
+            cursor.execute(query_vigentes, parametros_vigencia + tuple(cedulas) * 2)
+            filas = cursor.fetchall()
             cursor.close()
-    
+
+        carnets = {cedula: None for cedula in cedulas}
+        pendientes = []  # (cedula, id_trabajador, adscrito)
+        for cedula, id_trabajador, adscrito, id_carnet, emision, expiracion, correlativo, vigente in filas:
+            cedula = str(cedula)
+            if id_carnet is not None:
+                # Mismo criterio que check_fecha_emision_expiracion
+                if vigente:
+                    carnets[cedula] = {
+                        "id": id_carnet,
+                        "id_trabajador": id_trabajador,
+                        "fecha_emision": emision,
+                        "fecha_expiracion": expiracion,
+                        "correlativo": correlativo
+                    }
+                    continue
+            pendientes.append((cedula, id_trabajador, adscrito))
+
+        if not pendientes:
+            return carnets
+
+        # Correlativos de cada oficina, reservados con una sola operación por oficina
+        por_oficina = {}
+        for _, _, adscrito in pendientes:
+            por_oficina[adscrito] = por_oficina.get(adscrito, 0) + 1
+        numeros = {adscrito: iter(self.tomar_correlativos(adscrito, cantidad)) for adscrito, cantidad in por_oficina.items()}
+
+        fecha_actual = ahora
+        fecha_expiracion = fecha_actual + timedelta(days=periodo_tiempo)
+        nuevos = {}
+        valores = []
+        for cedula, id_trabajador, adscrito in pendientes:
+            correlativo = f"{adscrito}{next(numeros[adscrito]):04d}"
+            nuevos[correlativo] = cedula
+            valores.append((id_trabajador, fecha_actual, fecha_expiracion, correlativo))
+
+        with self.conexion() as cnx:
+            cursor = cnx.cursor()
+            cursor.executemany(f"""
+                INSERT INTO {self.table_carnet} (id_trabajador, fecha_emision, fecha_expiracion, correlativo)
+                VALUES (%s, %s, %s, %s)
+            """, valores)
+
+            # Releer los carnets nuevos para obtener su ID y las fechas como quedaron guardadas
+            marcadores_nuevos = ", ".join(["%s"] * len(nuevos))
+            cursor.execute(f"""
+                SELECT id, id_trabajador, fecha_emision, fecha_expiracion, correlativo
+                FROM {self.table_carnet}
+                WHERE correlativo IN ({marcadores_nuevos})
+            """, tuple(nuevos))
+            for id_carnet, id_trabajador, emision, expiracion, correlativo in cursor.fetchall():
+                carnets[nuevos[correlativo]] = {
+                    "id": id_carnet,
+                    "id_trabajador": id_trabajador,
+                    "fecha_emision": emision,
+                    "fecha_expiracion": expiracion,
+                    "correlativo": correlativo
+                }
+
+            cnx.commit()
+            cursor.close()
+        return carnets
+
+    def tomar_correlativos(self, adscrito, cantidad=1):
+        """
+        Devuelve 'cantidad' números de correlativo nuevos para la oficina.
+
+        Si la instancia tiene una ReservaCorrelativos en reserva_correlativos,
+        los números salen de su bloque local; si no, se reservan exactamente
+        los necesarios con reservar_correlativos.
+        """
+        if self.reserva_correlativos is not None:
+            return self.reserva_correlativos.tomar(adscrito, cantidad)
+        ultimo = self.reservar_correlativos(adscrito, cantidad)
+        return list(range(ultimo - cantidad + 1, ultimo + 1))
+
+    def reservar_correlativos(self, adscrito, cantidad=1):
+        """
+        Reserva 'cantidad' correlativos consecutivos de una oficina.
+
+        El contador de la oficina (tabla correlativos_oficina) se incrementa con
+        UPDATE ... SET ultimo = LAST_INSERT_ID(ultimo + n), que es atómico: dos
+        equipos que emiten a la vez nunca reciben el mismo número, y no hace
+        falta recorrer el historial de carnets. La reserva se confirma de
+        inmediato; los números que no se lleguen a usar quedan como huecos.
+        Como el commit confirma toda la transacción de la conexión, no debe
+        llamarse con escrituras pendientes en la misma conexión (ver
+        PoolConexiones): save_carnet y emitir_carnets reservan antes de escribir.
+
+        Si la oficina todavía no tiene contador, se crea a partir del mayor
+        correlativo ya emitido con su prefijo. La tabla la crea la migración 2
+        (ver MIGRACIONES).
+
+        Parámetros:
+        - adscrito (str): Código de la oficina.
+        - cantidad (int): Números a reservar.
+
+        Retorna:
+        - int: Último número reservado; los reservados son los 'cantidad'
+          números que terminan en él.
+        """
+        query_incremento = f"UPDATE {self.tabla_correlativos} SET ultimo = LAST_INSERT_ID(ultimo + %s) WHERE adscrito = %s"
+        with self.conexion() as cnx:
+            cursor = cnx.cursor()
+            cursor.execute(query_incremento, (cantidad, adscrito))
+            if cursor.rowcount == 0:
+                # Primer carnet de la oficina desde que existe el contador
+                cursor.execute(f"""
+                    INSERT INTO {self.tabla_correlativos} (adscrito, ultimo)
+                    SELECT %s, COALESCE(MAX(CAST(SUBSTRING(correlativo, CHAR_LENGTH(%s) + 1) AS UNSIGNED)), 0)
+                    FROM {self.table_carnet}
+                    WHERE correlativo LIKE CONCAT(%s, '%')
+                      AND SUBSTRING(correlativo, CHAR_LENGTH(%s) + 1) REGEXP '^[0-9]+$'
+                    ON DUPLICATE KEY UPDATE ultimo = ultimo
+                """, (adscrito, adscrito, adscrito, adscrito))
+                cursor.execute(query_incremento, (cantidad, adscrito))
+
+            ultimo = cursor.lastrowid
+            if not ultimo:
+                cursor.execute("SELECT LAST_INSERT_ID()")
+                ultimo = cursor.fetchone()[0]
+            cnx.commit()
+            cursor.close()
+        return int(ultimo)
+
     def save_carnet(self, id_trabajador, periodo_tiempo=365):
         """
         Inserta un nuevo carnet en la base de datos.
@@ -374,30 +1658,30 @@ class DatabaseManager:
         - True si el carnet se insertó correctamente, False en caso contrario.
         """
         try:
-            cursor = self.connection.cursor()
-
-            # Obtener la fecha actual del servidor SQL
-            query = "SELECT NOW()"
-            cursor.execute(query)
-            fecha_actual = cursor.fetchone()[0]
+            # Fecha actual del servidor SQL, con el desfase ya medido
+            fecha_actual = self.hora_servidor()
 
             # Calcular la fecha de expiración
             fecha_expiracion = fecha_actual + timedelta(days=periodo_tiempo)
 
-            # Generar el correlativo único
+            # Generar el correlativo único; la reserva se confirma por su cuenta,
+            # así que se hace antes de abrir la transacción del carnet
             correlativo = self.generar_correlativo(id_trabajador)
 
-            # Insertar el nuevo carnet
-            query = f"""
-                INSERT INTO {self.table_carnet} (id_trabajador, fecha_emision, fecha_expiracion, correlativo)
-                VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(query, (id_trabajador, fecha_actual, fecha_expiracion, correlativo))
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
 
-            # Confirmar los cambios
-            self.connection.commit()
-            cursor.close()
-            return True
+                # Insertar el nuevo carnet
+                query = f"""
+                    INSERT INTO {self.table_carnet} (id_trabajador, fecha_emision, fecha_expiracion, correlativo)
+                    VALUES (%s, %s, %s, %s)
+                """
+                cursor.execute(query, (id_trabajador, fecha_actual, fecha_expiracion, correlativo))
+
+                # Confirmar los cambios
+                cnx.commit()
+                cursor.close()
+                return True
 
         except Error as e:
             print(f"Error al insertar el carnet: {e}")
@@ -416,30 +1700,54 @@ class DatabaseManager:
         """
         query = f"INSERT INTO {self.tabla_oficina} (nombre, nomenclatura) VALUES (%s, %s)"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (nombre_oficina, codigo_oficina))
-            self.connection.commit()
-            cursor.close()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (nombre_oficina, codigo_oficina))
+                cnx.commit()
+                cursor.close()
+            self.invalidar_oficinas()
             return True
         except Error as e:
             print(f"Error al guardar la oficina: {e}")
             return False
     
     def update_entry(self, new_values):
-        query = f"UPDATE {self.tabla_empleados} SET nombre = %s, apellidos = %s, adscrito = %s, cargo = %s, imagen = %s, tipo_carnet = %s WHERE cedula = %s"
+        """
+        Modifica un trabajador existente usando su cédula.
+
+        Parámetros:
+        - new_values (dict): Las mismas claves que save_new_entry. Si 'imagen'
+          es None se conservan la foto y la miniatura registradas; si no, la
+          miniatura se genera de nuevo.
+        """
+        query = f"""
+            UPDATE {self.tabla_empleados}
+            SET nombre = %s, apellidos = %s, adscrito = %s, cargo = %s,
+                imagen = IF(%s, %s, imagen), foto_hash = IF(%s, %s, foto_hash),
+                miniatura = IF(%s, %s, miniatura), tipo_carnet = %s
+            WHERE cedula = %s
+        """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (
-                new_values['nombre'],
-                new_values['apellidos'],
-                new_values['adscrito'],
-                new_values['cargo'],
-                new_values['imagen'],
-                new_values['tipo_carnet'],
-                new_values['cedula']
-            ))
-            self.connection.commit()
-        except Error as e:
+            nueva = new_values['imagen'] is not None
+            imagen, foto_hash, miniatura = self._preparar_foto(new_values['imagen'])
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (
+                    new_values['nombre'],
+                    new_values['apellidos'],
+                    new_values['adscrito'],
+                    new_values['cargo'],
+                    nueva, imagen,
+                    nueva, foto_hash,
+                    nueva, miniatura,
+                    new_values['tipo_carnet'],
+                    new_values['cedula']
+                ))
+                cnx.commit()
+            # La oficina o el tipo pueden haber cambiado
+            self.invalidar_paginacion()
+            self.invalidar_busqueda()
+        except (Error, OSError) as e:
             print(f"Error al modificar el registro: {e}")
     
     def update_oficina(self, id_oficina, nuevo_nombre, nuevo_codigo):
@@ -456,10 +1764,12 @@ class DatabaseManager:
         """
         query = f"UPDATE {self.tabla_oficina} SET nombre = %s, nomenclatura = %s WHERE id = %s"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (nuevo_nombre, nuevo_codigo, id_oficina))
-            self.connection.commit()
-            cursor.close()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (nuevo_nombre, nuevo_codigo, id_oficina))
+                cnx.commit()
+                cursor.close()
+            self.invalidar_oficinas()
             return True
         except Error as e:
             print(f"Error al modificar la oficina: {e}")
@@ -477,31 +1787,12 @@ class DatabaseManager:
         """
         query = f"DELETE FROM {self.tabla_oficina} WHERE id = %s"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (id_oficina,))
-            self.connection.commit()
-            cursor.close()
-            return True
-        except Error as e:
-            print(f"Error al eliminar la oficina: {e}")
-            return False
-    
-    def delete_oficina(self, codigo_oficina):
-        """
-        Elimina una oficina de la base de datos.
-
-        Parámetros:
-        - codigo_oficina (str): Código único de la oficina a eliminar.
-
-        Retorna:
-        - True si la oficina se eliminó correctamente, False en caso contrario.
-        """
-        query = f"DELETE FROM {self.tabla_oficina} WHERE id = %s "
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (codigo_oficina,))
-            self.connection.commit()
-            cursor.close()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (id_oficina,))
+                cnx.commit()
+                cursor.close()
+            self.invalidar_oficinas()
             return True
         except Error as e:
             print(f"Error al eliminar la oficina: {e}")
@@ -519,15 +1810,81 @@ class DatabaseManager:
         """
         query = f"SELECT COUNT(*) FROM {self.tabla_empleados} WHERE cedula = %s"
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (cedula,))
-            resultado = cursor.fetchone()
-            cursor.close()
-            return resultado[0] > 0  # Retorna True si hay al menos un registro con la misma cédula
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                cursor.execute(query, (cedula,))
+                resultado = cursor.fetchone()
+                cursor.close()
+                return resultado[0] > 0  # Retorna True si hay al menos un registro con la misma cédula
         except Error as e:
             print(f"Error al verificar duplicados: {e}")
             return False
 
+    def hora_servidor(self):
+        """
+        Devuelve la hora actual del servidor MySQL sin consultarlo en cada llamada.
+
+        El desfase entre el reloj del servidor (incluida su zona horaria) y el
+        local se mide con un SELECT NOW(6) y se reutiliza durante
+        INTERVALO_RELOJ_SERVIDOR segundos; todas las instancias del proceso
+        comparten la medición.
+
+        Retorna:
+        - datetime: Hora del servidor, con la misma precisión que NOW().
+        """
+        clave = (self.host, self.port)
+        with _desfases_lock:
+            medicion = _desfases_reloj.get(clave)
+        if medicion is None or time.monotonic() - medicion[1] > INTERVALO_RELOJ_SERVIDOR:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                antes = datetime.now()
+                cursor.execute("SELECT NOW(6)")
+                hora = cursor.fetchone()[0]
+                despues = datetime.now()
+                cursor.close()
+            # Se toma la mitad del viaje como el instante en que el servidor leyó su reloj
+            medicion = (hora - (antes + (despues - antes) / 2), time.monotonic())
+            with _desfases_lock:
+                _desfases_reloj[clave] = medicion
+        return (datetime.now() + medicion[0]).replace(microsecond=0)
+
+    def carnet_vigente(self, carnet, ahora=None):
+        """
+        Indica si la hora del servidor está entre la emisión y la expiración del carnet.
+
+        Las fechas se comparan como el inicio de su día, igual que MySQL al
+        comparar un DATE con un DATETIME (ver predicado_vigencia).
+
+        Parámetros:
+        - carnet (dict): Carnet con 'fecha_emision' y 'fecha_expiracion'.
+        - ahora (datetime): Hora del servidor; por defecto, hora_servidor().
+        """
+        if ahora is None:
+            ahora = self.hora_servidor()
+        fecha_emision = datetime.combine(carnet['fecha_emision'], datetime.min.time())
+        fecha_expiracion = datetime.combine(carnet['fecha_expiracion'], datetime.min.time())
+        return fecha_emision <= ahora <= fecha_expiracion
+
+    def predicado_vigencia(self, alias="c", ahora=None):
+        """
+        Devuelve la condición SQL equivalente a carnet_vigente, para filtrar muchos carnets a la vez.
+
+        Uso:
+            condicion, parametros = db.predicado_vigencia("c")
+            cursor.execute(f"SELECT ... FROM carnets c WHERE {condicion}", parametros)
+
+        Parámetros:
+        - alias (str): Alias de la tabla de carnets en la consulta.
+        - ahora (datetime): Hora del servidor; por defecto, hora_servidor().
+
+        Retorna:
+        - tuple: (condición, parámetros).
+        """
+        if ahora is None:
+            ahora = self.hora_servidor()
+        return f"({alias}.fecha_emision <= %s AND %s <= {alias}.fecha_expiracion)", (ahora, ahora)
+
     def check_fecha_emision_expiracion(self, last_carnet):
         """
         Comprueba si la hora del servidor SQL está entre las fechas de emisión y expiración del último carnet.
@@ -543,34 +1900,19 @@ class DatabaseManager:
             return False
 
         try:
-            cursor = self.connection.cursor()
-
-            # Obtener la hora actual del servidor SQL
-            query = "SELECT NOW()"
-            cursor.execute(query)
-            hora_actual = cursor.fetchone()[0]
-
-            # Convertir last_carnet['fecha_emision'] y last_carnet['fecha_expiracion'] a objetos de tipo datetime.datetime
-            fecha_emision = datetime.combine(last_carnet['fecha_emision'], datetime.min.time())
-            fecha_expiracion = datetime.combine(last_carnet['fecha_expiracion'], datetime.min.time())
-
-            # Comprobar si la hora actual está entre las fechas de emisión y expiración
-            if fecha_emision <= hora_actual <= fecha_expiracion:
-                return True
-            else:
-                return False
-
+            return self.carnet_vigente(last_carnet)
         except Error as e:
             print(f"Error al comprobar la fecha de emisión y expiración: {e}")
             return False
-        finally:
-            cursor.close()
                 
     def close_database_connection(self):
-        """Cierra la conexión a la base de datos."""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("Conexión a la base de datos cerrada.")
+        """
+        Libera la instancia del pool de conexiones.
+
+        Las conexiones pertenecen al pool del proceso y las siguen usando las
+        demás instancias, por lo que no se cierran aquí.
+        """
+        self.pool = None
     
     def delete_entry(self, cedula):
         """
@@ -580,23 +1922,57 @@ class DatabaseManager:
         Retorna:
         - True si el registro se eliminó correctamente, False en caso contrario.
         """
-        try:
-            id_trabajador = self.fetch_id_by_cedula(cedula)
-            if id_trabajador is None:
-                print("No se encontró el trabajador con la cédula proporcionada.")
-                return False
+        eliminados = self.delete_entries([cedula])
+        if eliminados == 0:
+            print("No se encontró el trabajador con la cédula proporcionada.")
+        return bool(eliminados)
 
-            # Eliminar los registros en la tabla carnets relacionados con el trabajador
-            self.delete_related_carnets(id_trabajador)
+    def delete_entries(self, cedulas, chunk_size=TAMANO_LOTE_IMPORTACION):
+        """
+        Elimina varios trabajadores y sus carnets en una sola transacción.
 
-            # Ahora eliminar el trabajador
-            self.delete_trabajador(cedula)
+        Las cédulas se procesan en bloques de chunk_size: por cada bloque se
+        buscan los ids y se borran sus carnets y los trabajadores con
+        DELETE ... WHERE id IN (...). Si algo falla no se elimina ninguno. Las
+        fotos del almacén no se borran, porque pueden compartirlas otros
+        trabajadores.
 
-            return True
+        Parámetros:
+        - cedulas (iterable): Cédulas de los trabajadores a eliminar.
+        - chunk_size (int): Cédulas por sentencia.
 
+        Retorna:
+        - int: Número de trabajadores eliminados (las cédulas que no existen se
+          omiten), o None si ocurre un error.
+        """
+        cedulas = list(dict.fromkeys(str(cedula) for cedula in cedulas))
+        eliminados = 0
+        try:
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                for inicio in range(0, len(cedulas), chunk_size):
+                    bloque = cedulas[inicio:inicio + chunk_size]
+                    marcadores = ", ".join(["%s"] * len(bloque))
+                    cursor.execute(
+                        f"SELECT id FROM {self.tabla_empleados} WHERE cedula IN ({marcadores}) FOR UPDATE",
+                        tuple(bloque)
+                    )
+                    ids = tuple(fila[0] for fila in cursor.fetchall())
+                    if not ids:
+                        continue
+                    marcadores = ", ".join(["%s"] * len(ids))
+                    cursor.execute(f"DELETE FROM {self.table_carnet} WHERE id_trabajador IN ({marcadores})", ids)
+                    cursor.execute(f"DELETE FROM {self.tabla_empleados} WHERE id IN ({marcadores})", ids)
+                    eliminados += cursor.rowcount
+                cnx.commit()
+                cursor.close()
         except Error as e:
-            print(f"Error al eliminar el registro: {e}")
-            return False
+            print(f"Error al eliminar los trabajadores: {e}")
+            return None
+        if eliminados:
+            self.invalidar_paginacion()
+            self.invalidar_busqueda()
+        return eliminados
 
     def delete_related_carnets(self, id_trabajador):
         """
@@ -605,11 +1981,12 @@ class DatabaseManager:
         - id_trabajador (int): ID del trabajador.
         """
         try:
-            cursor = self.connection.cursor()
-            delete_carnets_query = f"DELETE FROM {self.table_carnet} WHERE id_trabajador = %s"
-            cursor.execute(delete_carnets_query, (id_trabajador,))
-            self.connection.commit()
-            cursor.close()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                delete_carnets_query = f"DELETE FROM {self.table_carnet} WHERE id_trabajador = %s"
+                cursor.execute(delete_carnets_query, (id_trabajador,))
+                cnx.commit()
+                cursor.close()
         except Error as e:
             print(f"Error al eliminar los carnets relacionados: {e}")
 
@@ -620,22 +1997,14 @@ class DatabaseManager:
         - cedula (str): La cédula del trabajador a eliminar.
         """
         try:
-            cursor = self.connection.cursor()
-            delete_trabajador_query = f"DELETE FROM {self.tabla_empleados} WHERE cedula = %s"
-            cursor.execute(delete_trabajador_query, (cedula,))
-            self.connection.commit()
-            cursor.close()
+            with self.conexion() as cnx:
+                cursor = cnx.cursor()
+                delete_trabajador_query = f"DELETE FROM {self.tabla_empleados} WHERE cedula = %s"
+                cursor.execute(delete_trabajador_query, (cedula,))
+                cnx.commit()
+                cursor.close()
+            self.invalidar_paginacion()
+            self.invalidar_busqueda()
         except Error as e:
             print(f"Error al eliminar el trabajador: {e}")
-    
-    def fetch_data_by_cedula(self, cedula):
-        query = f"SELECT * FROM {self.tabla_empleados} WHERE cedula = %s"
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute(query, (cedula,))
-            resultado = cursor.fetchone()
-            cursor.close()
-            return resultado
-        except Error as e:
-            print(f"Error al obtener datos por cédula: {e}")
-            return None
\ No newline at end of file
+
@@ -0,0 +1,229 @@
+import csv
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from openpyxl import Workbook
+
+from database_manager import TAMANO_BLOQUE_LECTURA
+from output_sinks import DirectorySink, ZipSink
+
+# pyarrow solo hace falta para exportar a Parquet
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# Encabezados de la exportación; los seis primeros son los de la hoja de importación
+COLUMNAS_EXPORTACION = [
+    "Nombre", "Apellidos", "Cedula", "Adscrito", "Cargo", "Tipo",
+    "Correlativo", "FechaEmision", "FechaExpiracion",
+]
+
+FORMATOS_EXPORTACION = ("csv", "xlsx", "parquet")
+
+# Filas por hoja de Excel, sin contar el encabezado
+MAX_FILAS_XLSX = 1048575
+
+# Extensión de la foto según los primeros bytes del archivo
+FIRMAS_FOTO = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF8", ".gif"),
+    (b"BM", ".bmp"),
+]
+
+
+def formato_de_ruta(ruta):
+    """Devuelve el formato de exportación según la extensión de la ruta."""
+    formato = os.path.splitext(ruta)[1].lower().lstrip(".")
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no soportado: {formato or ruta}")
+    return formato
+
+
+def exportar_trabajadores(db, ruta, formato=None, adscrito=None, tipo=None, chunk_size=TAMANO_BLOQUE_LECTURA):
+    """
+    Exporta los trabajadores con su último carnet a CSV, XLSX o Parquet.
+
+    Las filas se leen con DatabaseManager.iter_trabajadores_con_carnet y se
+    escriben bloque por bloque, así que la memoria usada no depende del
+    número de trabajadores.
+
+    Parámetros:
+    - db (DatabaseManager): Conexión a la base de datos.
+    - ruta (str): Archivo de destino (se sobrescribe si existe).
+    - formato (str): "csv", "xlsx" o "parquet". Por defecto, según la extensión de la ruta.
+    - adscrito, tipo (str): Filtros opcionales, como en fetch_data.
+    - chunk_size (int): Filas por bloque.
+
+    Retorna:
+    - int: Número de trabajadores exportados.
+
+    Si la lectura de la base de datos falla se lanza el error y el archivo
+    incompleto se elimina.
+    """
+    formato = formato or formato_de_ruta(ruta)
+    exportadores = {"csv": _exportar_csv, "xlsx": _exportar_xlsx, "parquet": _exportar_parquet}
+    if formato not in exportadores:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    bloques = db.iter_trabajadores_con_carnet(adscrito, tipo, chunk_size)
+    try:
+        return exportadores[formato](bloques, ruta)
+    except Exception:
+        # Si la lectura se corta no se deja un archivo incompleto que parezca válido
+        _eliminar_incompleto(ruta)
+        raise
+
+
+def _eliminar_incompleto(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+
+def _exportar_csv(bloques, ruta):
+    total = 0
+    # utf-8-sig para que Excel reconozca los acentos al abrir el archivo
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(COLUMNAS_EXPORTACION)
+        for filas in bloques:
+            escritor.writerows(filas)
+            total += len(filas)
+    return total
+
+
+def _exportar_xlsx(bloques, ruta):
+    # En modo write_only openpyxl escribe cada fila en un archivo temporal en
+    # lugar de mantener la hoja completa en memoria
+    libro = Workbook(write_only=True)
+    hoja = None
+    filas_hoja = 0
+    total = 0
+    try:
+        for filas in bloques:
+            for fila in filas:
+                if hoja is None or filas_hoja == MAX_FILAS_XLSX:
+                    hoja = libro.create_sheet(f"Trabajadores {len(libro.worksheets) + 1}" if hoja else "Trabajadores")
+                    hoja.append(COLUMNAS_EXPORTACION)
+                    filas_hoja = 0
+                hoja.append(list(fila))
+                filas_hoja += 1
+            total += len(filas)
+    except Exception:
+        # Cierra los archivos temporales de las hojas a medio escribir
+        for hoja_abierta in libro.worksheets:
+            hoja_abierta.close()
+        raise
+    if hoja is None:
+        libro.create_sheet("Trabajadores").append(COLUMNAS_EXPORTACION)
+    libro.save(ruta)
+    return total
+
+
+def _exportar_parquet(bloques, ruta):
+    if pa is None:
+        raise RuntimeError("Para exportar a Parquet hay que instalar pyarrow.")
+    esquema = pa.schema(
+        [(columna, pa.string()) for columna in COLUMNAS_EXPORTACION[:7]]
+        + [("FechaEmision", pa.date32()), ("FechaExpiracion", pa.date32())]
+    )
+    total = 0
+    # Cada bloque se escribe como un grupo de filas del archivo
+    with pq.ParquetWriter(ruta, esquema) as escritor:
+        for filas in bloques:
+            columnas = [list(columna) for columna in zip(*filas)]
+            for i in range(7):
+                columnas[i] = [None if valor is None else str(valor) for valor in columnas[i]]
+            escritor.write_table(pa.Table.from_arrays(columnas, schema=esquema))
+            total += len(filas)
+    return total
+
+
+def extension_foto(datos):
+    """Devuelve la extensión de archivo que corresponde a los bytes de una foto."""
+    for firma, extension in FIRMAS_FOTO:
+        if datos.startswith(firma):
+            return extension
+    if datos[:4] == b"RIFF" and datos[8:12] == b"WEBP":
+        return ".webp"
+    return ".bin"
+
+
+def exportar_fotos(db, destino, adscrito=None, tipo=None, workers=4, chunk_size=100):
+    """
+    Exporta las fotos de los trabajadores a un directorio o a un ZIP.
+
+    Cada foto se guarda como <cedula>.<extensión>. Las claves de las fotos se
+    leen en bloques con iter_trabajadores; cada bloque se resuelve con
+    DatabaseManager.fetch_fotos y se escribe en un hilo del grupo, con a lo
+    sumo dos bloques por hilo en curso para que la memoria quede acotada.
+
+    Parámetros:
+    - db (DatabaseManager): Conexión a la base de datos.
+    - destino (str): Directorio, o archivo .zip.
+    - adscrito, tipo (str): Filtros opcionales, como en fetch_data.
+    - workers (int): Hilos que leen y escriben fotos al mismo tiempo.
+    - chunk_size (int): Fotos por bloque.
+
+    Retorna:
+    - tuple: (exportadas, sin_foto, fallidas). fallidas cuenta los
+      trabajadores con clave de foto cuya foto no se pudo leer (un error de
+      fetch_fotos o un archivo que falta en el almacén); se registran en el log.
+
+    Si la lectura de la lista de trabajadores falla se lanza el error; un ZIP
+    incompleto se elimina.
+    """
+    if destino.lower().endswith(".zip"):
+        sink = ZipSink(destino)
+    else:
+        sink = DirectorySink(destino, sobrescribir=True)
+
+    def guardar_bloque(claves):
+        """Guarda las fotos de un bloque; devuelve las cédulas cuya foto no se pudo leer."""
+        fotos = db.fetch_fotos(claves.values())
+        fallidas = []
+        for cedula, clave in claves.items():
+            datos = fotos.get(clave)
+            if datos is None:
+                fallidas.append(cedula)
+            else:
+                sink.save(f"{cedula}{extension_foto(datos)}", datos)
+        return len(claves) - len(fallidas), fallidas
+
+    def contar(tarea):
+        nonlocal exportadas
+        guardadas, fallidas_bloque = tarea.result()
+        exportadas += guardadas
+        fallidas.extend(fallidas_bloque)
+
+    exportadas = 0
+    sin_foto = 0
+    fallidas = []
+    try:
+        with sink, ThreadPoolExecutor(max_workers=workers) as executor:
+            pendientes = set()
+            for filas in db.iter_trabajadores(adscrito, tipo, chunk_size):
+                claves = {fila[2]: fila[5] for fila in filas if fila[5]}
+                sin_foto += len(filas) - len(claves)
+                pendientes.add(executor.submit(guardar_bloque, claves))
+                if len(pendientes) >= 2 * workers:
+                    hechas, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for tarea in hechas:
+                        contar(tarea)
+            for tarea in pendientes:
+                contar(tarea)
+    except Exception:
+        if isinstance(sink, ZipSink):
+            _eliminar_incompleto(destino)
+        raise
+
+    if fallidas:
+        logging.error(f"No se pudieron leer {len(fallidas)} fotos al exportar a {destino}; cédulas: {', '.join(map(str, fallidas))}")
+    logging.info(f"Fotos exportadas a {destino}: {exportadas}, sin foto: {sin_foto}, fallidas: {len(fallidas)}")
+    return exportadas, sin_foto, len(fallidas)
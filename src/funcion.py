@@ -25,6 +25,35 @@ def convertir_imagen_a_binario(ruta_imagen):
         print(f"Error al convertir la imagen a binario: {e}")
         return None
 
+# Tamaño máximo de las miniaturas que se guardan junto a la foto
+MINIATURA_FOTO = (100, 100)
+
+def crear_miniatura(binarios, tamano=MINIATURA_FOTO):
+    """
+    Crea la miniatura JPEG de una foto.
+
+    Parámetros:
+    - binarios (bytes): Datos de la foto en cualquier formato que lea PIL.
+    - tamano (tuple): Ancho y alto máximos; se conserva la proporción.
+
+    Retorna:
+    - bytes: La miniatura en JPEG, o None si no hay foto o no se puede leer.
+    """
+    if not binarios:
+        return None
+    try:
+        with Image.open(io.BytesIO(binarios)) as img:
+            # draft deja que el decodificador JPEG reduzca la imagen al leerla
+            img.draft('RGB', tamano)
+            img = img.convert('RGB')
+            img.thumbnail(tamano)
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=85)
+            return buffer.getvalue()
+    except Exception as e:
+        print(f"Error al crear la miniatura: {e}")
+        return None
+
 def crear_image_thumbnail_binarios(binarios):
         """
         Crea una imagen desde datos binarios utilizando PIL.
@@ -69,3 +98,22 @@ def convertir_str_a_bytes(binary_str):
             print(f"Error al convertir la cadena a bytes: {str(e)}")
             raise
 
+# Claves del diccionario de datos que usa ImageGenerator, en el orden de las columnas de trabajadores
+COLUMNAS_CARNET = ["Nombre", "Apellidos", "Cedula", "Adscrito", "Cargo", "RutaImagen", "TipoCarnet"]
+
+def fila_a_data_row(fila, oficinas):
+        """
+        Convierte una fila de trabajadores en el diccionario que usa ImageGenerator.
+
+        Args:
+            fila (tuple): (nombre, apellidos, cedula, adscrito, cargo, imagen, tipo_carnet).
+            oficinas (RegistroOficinas): Registro de oficinas de DatabaseManager.registro_oficinas.
+
+        Returns:
+            dict: Datos del carnet, con el código de la oficina reemplazado por su nombre completo.
+        """
+        data_row = dict(zip(COLUMNAS_CARNET, fila))
+        oficina_nombre = oficinas.nombre(data_row["Adscrito"])
+        if oficina_nombre:
+            data_row["Adscrito"] = oficina_nombre
+        return data_row
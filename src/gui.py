@@ -3,17 +3,20 @@ import tkinter as tk
 import os
 import logging
 import json
+import multiprocessing
+import threading
 from tkinter import filedialog, messagebox, Menu
 from tkinter import ttk
-import traceback
-import io
 
-from funcion import crear_image_thumbnail_binarios, convertir_str_a_bytes
+from funcion import crear_image_thumbnail_binarios, convertir_str_a_bytes, fila_a_data_row
 
 
 # Asegúrate de tener la clase ImageGenerator implementada
-from image_generator import ImageGenerator
-from database_manager import DatabaseManager
+from image_generator import ImageGenerator, MedidorRendimiento, get_render_workers, get_render_batch_size
+from database_manager import DatabaseManager, TAMANO_PAGINA, clave_foto, es_clave_foto
+from output_sinks import DirectorySink
+from pdf_imposer import PdfSink
+from exporter import exportar_trabajadores, exportar_fotos
 from PIL import Image, ImageTk  # Asegúrate de tener Pillow instalado
 from datetime import datetime
 
@@ -31,6 +34,12 @@ class ImageGeneratorApp:
         self.root.title("Carnet Craft")
         self.database_manager = DatabaseManager()
         self.get_oficinas()
+
+        # Estado de la paginación de la tabla principal
+        self.tamano_pagina = TAMANO_PAGINA
+        self.filtro_actual = (None, None)
+        self.pagina_actual = 1
+        self.pages = 1
         
         
         self.tipo_carnet_options = self.get_tipo_carnet_options()
@@ -84,6 +93,9 @@ class ImageGeneratorApp:
         self.fill_tree()
         self.update_row_colors()
 
+        # El índice de búsqueda se arma en segundo plano para que la primera búsqueda no espere
+        threading.Thread(target=self.database_manager.indice_busqueda, daemon=True).start()
+
     def get_tipo_carnet_options(self):
         # Obtener los tipos de carnet de la base de datos o de un archivo de configuración
         # ...
@@ -92,30 +104,61 @@ class ImageGeneratorApp:
     def get_oficinas(self):
         # Obtener los nombres de las oficinas de la base de datos o de un archivo de configuración
         # ...
-        self.oficinas = self.database_manager.fetch_oficinas()
+        self.registro_oficinas = self.database_manager.registro_oficinas()
+        self.oficinas = self.registro_oficinas.oficinas
     
     def fill_tree(self, adscrito=None, tipo=None, page=1):
         self.clear_treeview()
-        data = self.database_manager.fetch_data(adscrito, tipo, page)
+        self.filtro_actual = (adscrito, tipo)
+        # El conteo está en caché por filtro, así que cambiar de página no vuelve a contar
+        self.pages = self.database_manager.contar_paginas(adscrito, tipo, self.tamano_pagina)
+        self.pagina_actual = min(max(page, 1), self.pages)
+        data = self.database_manager.fetch_data(adscrito, tipo, self.pagina_actual, self.tamano_pagina) or []
         for row in data:
             self.tree.insert("", "end", values=row)
-        self.pages = -(-len(data) // 25)  # Calcula el número de páginas necesarias
-        
 
         # Agregar botones de navegación por páginas
         self.add_pagination_buttons()
         self.update_row_colors()
 
+    def ir_a_pagina(self, page):
+        """Muestra la página indicada con el filtro actual."""
+        adscrito, tipo = self.filtro_actual
+        self.fill_tree(adscrito, tipo, page)
+
     def add_pagination_buttons(self):
         # Eliminar los botones de navegación existentes
         for widget in self.pagination_frame.winfo_children():
             widget.destroy()
 
-        if self.pages > 1:
-            # Agregar botones de navegación
-            for i in range(self.pages):
-                button = tk.Button(self.pagination_frame, text=str(i+1), command=lambda page=i+1: self.fill_tree(adscrito, tipo, page))
-                button.pack(side=tk.LEFT, padx=5)
+        if self.pages <= 1:
+            return
+
+        actual = self.pagina_actual
+        # Solo se muestran las páginas cercanas a la actual, además de la primera y la última
+        inicio = max(1, actual - 3)
+        fin = min(self.pages, actual + 3)
+        botones = [("«", 1), ("‹", actual - 1)]
+        if inicio > 1:
+            botones.append(("1", 1))
+            if inicio > 2:
+                botones.append(("…", None))
+        botones += [(str(page), page) for page in range(inicio, fin + 1)]
+        if fin < self.pages:
+            if fin < self.pages - 1:
+                botones.append(("…", None))
+            botones.append((str(self.pages), self.pages))
+        botones += [("›", actual + 1), ("»", self.pages)]
+
+        for texto, page in botones:
+            if page is None:
+                tk.Label(self.pagination_frame, text=texto).pack(side=tk.LEFT, padx=5)
+                continue
+            button = tk.Button(self.pagination_frame, text=texto, command=lambda page=page: self.ir_a_pagina(page))
+            if page == actual or not 1 <= page <= self.pages:
+                button.config(state=tk.DISABLED)
+            button.pack(side=tk.LEFT, padx=5)
+        tk.Label(self.pagination_frame, text=f"Página {actual} de {self.pages}").pack(side=tk.LEFT, padx=10)
     
     def clear_treeview(self):
         # Limpiar el contenido del Treeview
@@ -144,6 +187,12 @@ class ImageGeneratorApp:
         file_menu = Menu(self.menu_bar, tearoff=0)
         file_menu.add_command(
             label="Importar archivo Excel", command=self.load_file)
+        file_menu.add_command(
+            label="Exportar PDF del filtro actual", command=self.export_pdf_filter)
+        file_menu.add_command(
+            label="Exportar datos del filtro actual", command=self.export_data_filter)
+        file_menu.add_command(
+            label="Exportar fotos del filtro actual", command=self.export_photos_filter)
         self.menu_bar.add_cascade(label="Archivo", menu=file_menu)
         
         # Agregar un menú de editar
@@ -154,13 +203,14 @@ class ImageGeneratorApp:
     
     def create_filter(self):
         #Filtros
-        self.search_label = tk.Label(self.filter_frame, text="Buscar por cédula:")
+        self.search_label = tk.Label(self.filter_frame, text="Buscar:")
         self.search_label.pack(side=tk.LEFT, padx=5)
 
         self.search_entry = tk.Entry(self.filter_frame)
         self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.search_entries())
 
-        self.search_button = tk.Button(self.filter_frame, text="Buscar", command=self.search_by_cedula)
+        self.search_button = tk.Button(self.filter_frame, text="Buscar", command=self.search_entries)
         self.search_button.pack(side=tk.LEFT, padx=5)
 
         self.adscrito_label = tk.Label(self.filter_frame, text="Adscrito:")
@@ -235,26 +285,43 @@ class ImageGeneratorApp:
         self.tipo_var.set("")
         self.filter_data()
         
-    def filter_data(self):
+    def get_filter_values(self):
+        """Devuelve el código de la oficina y el tipo de carnet seleccionados en los filtros."""
         adscrito = self.adscrito_combobox.get()
         tipo = self.tipo_combobox.get()
-        for oficina in self.oficinas:
-            if oficina[0] == adscrito:
-                adscrito = oficina[1]
-                break
+        adscrito = self.registro_oficinas.codigo(adscrito) or adscrito
+        return adscrito, tipo
+
+    def filter_data(self):
+        # Filtrar o quitar un filtro vuelve a contar, para ver lo que escribieron otros equipos
+        self.database_manager.invalidar_paginacion()
+        adscrito, tipo = self.get_filter_values()
         self.fill_tree(adscrito, tipo)
     
-    def search_by_cedula(self):
-        cedula = self.search_entry.get()
-        # Buscar en la base de datos o en el archivo de datos
-        data = self.database_manager.fetch_data_by_cedula(cedula)
-        if data:
-            # Mostrar la entrada encontrada
-            self.tree.delete(*self.tree.get_children())
-            self.tree.insert("", "end", values=data)
-        else:
-            # Mostrar un mensaje de error
-            messagebox.showerror("Error", "No se encontró la cédula")
+    def search_entries(self):
+        """
+        Busca trabajadores por cédula, nombre, apellidos o cargo.
+
+        Una cédula exacta muestra solo ese trabajador; si no, se usa el índice
+        de búsqueda, que no distingue acentos y acepta prefijos y errores de
+        escritura. Con la búsqueda vacía se vuelve al listado del filtro actual.
+        """
+        consulta = self.search_entry.get().strip()
+        if not consulta:
+            self.ir_a_pagina(self.pagina_actual)
+            return
+        data = self.database_manager.fetch_data_by_cedula(consulta)
+        rows = [data] if data else self.database_manager.buscar_trabajadores(consulta)
+        if not rows:
+            messagebox.showerror("Error", "No se encontraron trabajadores")
+            return
+        self.clear_treeview()
+        for row in rows:
+            self.tree.insert("", "end", values=row)
+        # Los resultados de la búsqueda no se paginan
+        for widget in self.pagination_frame.winfo_children():
+            widget.destroy()
+        self.update_row_colors()
     
     def create_sidebar(self):
         """Crea el sidebar con los labels y el botón de editar."""
@@ -302,6 +369,11 @@ class ImageGeneratorApp:
         self.generate_button = tk.Button(
             self.sidebar, text="Generar Imágenes", command=self.generate_images, state="disabled")
         self.generate_button.pack(side="bottom", pady=5, padx=5, fill="x")
+
+        # Botón para exportar la selección a PDF
+        self.pdf_button = tk.Button(
+            self.sidebar, text="Exportar PDF", command=self.export_pdf_selection, state="disabled")
+        self.pdf_button.pack(side="bottom", pady=5, padx=5, fill="x")
         
         # Asociar el evento de selección con el método update_sidebar
         self.tree.bind("<<TreeviewSelect>>", self.update_sidebar)
@@ -321,6 +393,7 @@ class ImageGeneratorApp:
             self.delete_button.config(state="disabled")  # Activar el botón "ekiminar"
                         
             self.generate_button.config(state="disabled")  # Activar el botón "general"
+            self.pdf_button.config(state="disabled")
         elif len(selected_items) == 1:
             # Una fila seleccionada
             self.selection_status_label.pack_forget()  # Ocultar el label de estado
@@ -351,6 +424,8 @@ class ImageGeneratorApp:
             self.generate_button.config(state="normal")  # Activar el botón "ekiminar"
             self.generate_button.pack(side="bottom", fill="x", pady=5)  # Asegurarse de que el botón esté visible
 
+            self.pdf_button.config(state="normal")
+
         else:
             # Selección múltiple
             self.selection_status_label.config(text="Selección múltiple")
@@ -360,34 +435,40 @@ class ImageGeneratorApp:
             self.clear_image_display()  # Limpiar la imagen
             self.edit_button.config(state="disabled")  # Desactivar el botón "Editar"
             self.generate_button.config(state="normal")  # Activar el botón "general"
+            self.pdf_button.config(state="normal")
 
     def delete_entry(self):
         selected_items = self.tree.selection()
-        total = 0
-        eliminado = 0
-        mantenido = 0
-        if selected_items:
-            for item in selected_items:
-                    total += 1
-                    item_values = self.tree.item(item, 'values')
-                    respuesta = messagebox.askyesno("Confirmar eliminación", f"¿Estás seguro de eliminar el registro de {item_values[0]} {item_values[1]} con cédula {item_values[2]}?")
-                    if respuesta:
-                        eliminado += 1
-                        self.database_manager.delete_entry(item_values[2])
-                        self.tree.delete(item)
-                    else:
-                        mantenido += 1            
-        else:
+        if not selected_items:
             messagebox.showerror("Error", "No se ha seleccionado ningún registro para eliminar.")
-        # después de agregar los datos
-        messagebox.showinfo("Eliminar", f"Se Elimaron {eliminado} registros, {mantenido} sin cambios  \n  {total} registros en total.")
+            return
+        total = len(selected_items)
+        if total == 1:
+            item_values = self.tree.item(selected_items[0], 'values')
+            pregunta = f"¿Estás seguro de eliminar el registro de {item_values[0]} {item_values[1]} con cédula {item_values[2]}?"
+        else:
+            pregunta = f"¿Estás seguro de eliminar los {total} registros seleccionados?"
+        # Una sola confirmación y una sola transacción para toda la selección
+        if not messagebox.askyesno("Confirmar eliminación", pregunta):
+            return
+        cedulas = [self.tree.item(item, 'values')[2] for item in selected_items]
+        eliminado = self.database_manager.delete_entries(cedulas)
+        if eliminado is None:
+            messagebox.showerror("Error", "No se pudieron eliminar los registros. No se eliminó ninguno.")
+            return
+        self.tree.delete(*selected_items)
+        messagebox.showinfo("Eliminar", f"Se eliminaron {eliminado} registros, {total - eliminado} sin cambios  \n  {total} registros en total.")
         self.update_sidebar()
             
     def load_image_thumbnail(self, img_path):
         """Carga y muestra la miniatura de la imagen en el sidebar."""
         
         try:
-            binario = convertir_str_a_bytes(img_path)
+            if es_clave_foto(img_path):
+                # Se lee la miniatura guardada, no la foto completa
+                binario = self.database_manager.fetch_miniatura(img_path)
+            else:
+                binario = convertir_str_a_bytes(img_path)
             img = crear_image_thumbnail_binarios(binario)
             img.thumbnail((100, 100))  # Redimensionar la imagen
             img_tk = ImageTk.PhotoImage(img)
@@ -475,8 +556,7 @@ class ImageGeneratorApp:
                 # Verificar que las columnas requeridas estén presentes
                 if not all(col in self.df.columns for col in required_columns):
                     raise ValueError(
-                        f"El Data Frame debe contener las columnas: {
-                            required_columns}"
+                        f"El Data Frame debe contener las columnas: {required_columns}"
                     )
                 # Mostrar ventana de confirmación
                 self.show_confirmation_window()
@@ -526,8 +606,10 @@ class ImageGeneratorApp:
         # Oficina predeterminada en caso de no coincidir
         oficina_predeterminada = self.oficinas[0][1]  # Abreviatura de la oficina predeterminada
 
+        registros = []
         for index, row in self.df.iterrows():
-            values = [
+            # Las celdas vacías llegan como NaN
+            values = ["" if pd.isna(valor) else valor for valor in (
                 row.get("Nombre", ""),
                 row.get("Apellidos", ""),
                 row.get("Cedula", ""),
@@ -535,27 +617,23 @@ class ImageGeneratorApp:
                 row.get("Cargo", ""),
                 row.get("Imagen", ""),  # Campo para la ruta de la imagen
                 row.get("Tipo", "")  # Campo para el tipo de carnet
-            ]
+            )]
             total += 1
 
+            # pandas lee las cédulas numéricas como float si la columna tiene vacíos
+            if isinstance(values[2], float) and values[2].is_integer():
+                values[2] = int(values[2])
+            values[2] = str(values[2]).strip()
+
             # Verificar si el tipo de carnet es válido
             if values[6] not in tipos_carnet_permitidos:
                 # Si no es válido, asignar el valor predeterminado (primer tipo de carnet permitido)
                 values[6] = tipos_carnet_permitidos[0]
                 print(f"Advertencia: Tipo de carnet no válido. Se asignó el valor predeterminado: {tipos_carnet_permitidos[0]}")
 
-            # Verificar si el campo "adscrito" coincide con una abreviatura o nombre de oficina
-            adscrito = values[3]
-            oficina_encontrada = None
-
             # Buscar si el adscrito coincide con una abreviatura o nombre de oficina
-            for oficina in self.oficinas:
-                if adscrito == oficina[1]:  # Si coincide con una abreviatura
-                    oficina_encontrada = oficina[1]  # Dejar la abreviatura
-                    break
-                elif adscrito == oficina[0]:  # Si coincide con un nombre
-                    oficina_encontrada = oficina[1]  # Cambiar por la abreviatura
-                    break
+            adscrito = values[3]
+            oficina_encontrada = self.registro_oficinas.codigo(adscrito)
 
             # Si no se encontró coincidencia, asignar la oficina predeterminada
             if not oficina_encontrada:
@@ -566,45 +644,42 @@ class ImageGeneratorApp:
             values[3] = oficina_encontrada
 
             if values[0] and values[1] and values[2]:  # Verificar si NOMBRE, APELLIDO y CEDULA tienen información
-                print(values)
-                if self.database_manager.check_duplicate_by_cedula(values[2]):
-                    # Si el registro está repetido, actualizarlo
-                    respuesta = messagebox.askyesno("Confirmar actualización", f"¿Estás seguro de actualizar el registro de {values[0]} {values[1]} con cédula {values[2]}?")
-                    if respuesta:
-                        # Obtener los valores actuales del registro
-                        registro_actual = self.database_manager.fetch_data_by_cedula(values[2])
-                        # Actualizar solo los campos que no están vacíos
-                        new_values = {
-                            'nombre': registro_actual[1] if values[0] else registro_actual[1],
-                            'apellidos': registro_actual[2] if values[1] else registro_actual[2],
-                            'cedula': values[2],
-                            'adscrito': values[3],  # Usar el valor actualizado de adscrito
-                            'cargo': registro_actual[5] if values[4] else registro_actual[5],
-                            'imagen': registro_actual[6] if values[5] else registro_actual[6],
-                            't ipo_carnet': registro_actual[7] if values[6] else registro_actual[7]
-                        }
-                        self.database_manager.update_entry(new_values)
-                        actualizados += 1
-                    elif not respuesta:
-                        no_actualizados += 1
-                    else:
-                        errores += 1
-                else:
-                    # Si el registro no está repetido, agregarlo a la base de datos
-                    self.database_manager.save_new_entry({
-                        'nombre': values[0],
-                        'apellidos': values[1],
-                        'cedula': values[2],
-                        'adscrito': values[3],  # Usar el valor actualizado de adscrito
-                        'cargo': values[4],
-                        'imagen': values[5],
-                        'tipo_carnet': values[6]
-                    })
-                    agregados += 1
+                registros.append(values)
             else:
                 errores += 1
 
+        # Una sola confirmación para todos los registros que ya existen
+        existentes = self.database_manager.fetch_cedulas_existentes(values[2] for values in registros)
+        if existentes and not messagebox.askyesno(
+                "Confirmar actualización",
+                f"{len(existentes)} registros del archivo ya existen en la base de datos. ¿Deseas actualizarlos?"):
+            no_actualizados = sum(1 for values in registros if values[2] in existentes)
+            registros = [values for values in registros if values[2] not in existentes]
+
+        def registros_a_importar():
+            for values in registros:
+                # La foto se lee al armar cada bloque; si no hay archivo se conserva la registrada
+                imagen = None
+                if values[5] and os.path.isfile(str(values[5])):
+                    with open(values[5], 'rb') as image_file:
+                        imagen = image_file.read()
+                yield {
+                    'nombre': values[0],
+                    'apellidos': values[1],
+                    'cedula': values[2],
+                    'adscrito': values[3],  # Usar el valor actualizado de adscrito
+                    'cargo': values[4],
+                    'imagen': imagen,
+                    'tipo_carnet': values[6]
+                }
+
+        resumen = self.database_manager.bulk_upsert_trabajadores(registros_a_importar())
+        agregados = resumen["agregados"]
+        actualizados = resumen["actualizados"]
+        errores += resumen["errores"]
+
         confirmation_window.destroy()  # Cerrar la ventana de confirmación
+        self.database_manager.invalidar_paginacion()  # Contar también lo que escribieron otros equipos
         self.fill_tree()  # Actualizar el Treeview con los nuevos datos
         self.update_row_colors()  # Actualizar colores después de agregar los datos
         messagebox.showinfo("Resumen", f"Se agregaron {agregados} registros nuevos, se actualizaron {actualizados}, no se actualizaron {no_actualizados} registros y se encontraron {errores} errores. \n Se encontraron {total} registros en total.")
@@ -623,7 +698,7 @@ class ImageGeneratorApp:
         oficina_abreviatura = data_row[3]
         
         # Buscar el nombre completo de la oficina correspondiente a la abreviatura
-        oficina_nombre = next((oficina[0] for oficina in self.oficinas if oficina[1] == oficina_abreviatura), None)
+        oficina_nombre = self.registro_oficinas.nombre(oficina_abreviatura)
         
         # Si se encuentra el nombre completo, reemplazar la abreviatura
         if oficina_nombre:
@@ -662,7 +737,7 @@ class ImageGeneratorApp:
 
         # Crear la carpeta si no existe
         try:
-            os.makedirs(full_path, exist_ok=True)
+            sink = DirectorySink(full_path)
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo crear la carpeta: {str(e)}")
             return
@@ -670,9 +745,12 @@ class ImageGeneratorApp:
         total_generados = 0
         total_errores = 0
         total_carnets = 0
+        total_cache = 0
+        medidor = MedidorRendimiento()
         errores = []
         column = ["Nombre", "Apellidos", "Cedula", "Adscrito", "Cargo", "RutaImagen", "TipoCarnet"]
 
+        filas_validas = []
         for item in selected_items:
             data_row = self.tree.item(item)["values"]
             data_row = self.reemplazar_abreviatura_oficina(data_row)
@@ -680,67 +758,171 @@ class ImageGeneratorApp:
                 messagebox.showerror("Error", "Todos los campos deben ser completados y válidos.")
                 total_errores += 1
                 continue
-            
-            try:
-                # Generar la imagen y guardarla en la nueva carpeta
-                data = dict(zip(column, data_row))
-                
-                # Generar el nombre del archivo
-                image_filename = self.image_generator.generate_carnet(data)
-
-                # Verificar si el archivo ya existe en el directorio de destino
-                base_filename = os.path.basename(image_filename)  # Obtener el nombre base del archivo
-                name, ext = os.path.splitext(base_filename)  # Separar el nombre y la extensión
-                counter = 1  # Inicializar el contador
-
-                # Bucle para encontrar un nombre de archivo no usado
-                while True:
-                    # Construir el nombre del archivo con el contador
-                    new_image_filename = f"{name}_{counter}{ext}" if counter > 1 else f"{name}{ext}"
-                    new_image_path = os.path.join(full_path, new_image_filename)  # Ruta completa del archivo
-
-                    # Verificar si el archivo ya existe
-                    if not os.path.exists(new_image_path):
-                        break  # Salir del bucle si el archivo no existe
-                    counter += 1  # Incrementar el contador si el archivo existe
-
-                # Mover la imagen generada a la carpeta con el nuevo nombre
-                os.rename(image_filename, new_image_path)
+            filas_validas.append(dict(zip(column, data_row)))
+
+        # Generar las imágenes en paralelo; cada una se escribe directamente en la carpeta
+        for resultado in self.image_generator.iter_carnets(
+                filas_validas, workers=get_render_workers(), sink=sink, tamano_lote=get_render_batch_size()):
+            data = resultado["data_row"]
+            error = resultado["error"]
+            total_carnets += 1
+            medidor.agregar(resultado)
+
+            if error is None:
                 total_generados += 1  # Incrementar contador de generados
-            
-            except FileNotFoundError as fnf_error:
+                if resultado["cache"]:
+                    total_cache += 1
+            elif isinstance(error, FileNotFoundError):
                 total_errores += 1
-                errores.append(f"Archivo no encontrado: {str(fnf_error)}")
-                print(str(e))
-                logging.error(f"Archivo no encontrado: {str(fnf_error)} - {data_row[0]} {data_row[1]} (Cédula: {data_row[2]})")
-            except PermissionError as perm_error:
+                errores.append(f"Archivo no encontrado: {str(error)}")
+                print(str(error))
+                logging.error(f"Archivo no encontrado: {str(error)} - {data['Nombre']} {data['Apellidos']} (Cédula: {data['Cedula']})")
+            elif isinstance(error, PermissionError):
                 total_errores += 1
-                errores.append(f"Permiso denegado al acceder a: {str(perm_error)}")
-                print(str(e))
-                logging.error(f"Permiso denegado: {str(perm_error)} - {data_row[0]} {data_row[1]} (Cédula: {data_row[2]})")
-            except Exception as e:
+                errores.append(f"Permiso denegado al acceder a: {str(error)}")
+                print(str(error))
+                logging.error(f"Permiso denegado: {str(error)} - {data['Nombre']} {data['Apellidos']} (Cédula: {data['Cedula']})")
+            else:
                 total_errores += 1
-                error_message = f"Error al generar imagen para {data_row[0]} {data_row[1]} (Cédula: {data_row[2]}):"
-                print(str(e))
-                error_details = traceback.format_exc()  # Captura la traza del error
-                errores.append(f"{error_message}\nDetalles del error:\n{str(e)}")
-                print(error_details)
-                logging.error(f"No se pudo generar la imagen para {data_row[6]}: {str(e)} - {data_row[0]} {data_row[1]} (Cédula: {data_row[2]})\nDetalles del error:\n{error_details}")
-            total_carnets += 1
+                error_message = f"Error al generar imagen para {data['Nombre']} {data['Apellidos']} (Cédula: {data['Cedula']}):"
+                print(str(error))
+                errores.append(f"{error_message}\nDetalles del error:\n{str(error)}")
+                print(resultado["detalle"])
+                logging.error(f"No se pudo generar la imagen para {data['TipoCarnet']}: {str(error)} - {data['Nombre']} {data['Apellidos']} (Cédula: {data['Cedula']})\nDetalles del error:\n{resultado['detalle']}")
 
         # Mensaje final con el resumen de la operación
+        resumen_cache = f"Desde la caché: {total_cache}, renderizados: {total_generados - total_cache}."
+        if medidor.resumen():
+            resumen_cache += f"\n{medidor.resumen()}"
         if total_errores > 0:
             error_message = "\n".join(errores)
             messagebox.showerror(
                 "Errores en la generación",
                 f"Se generaron {total_carnets} / {total_generados} carnets con éxito.\n"
+                f"{resumen_cache}\n"
                 f"Se encontraron errores en {total_errores} carnets:\n{error_message}"
                 )
         else:
             messagebox.showinfo(
-                "Éxito", f"Todas las imágenes seleccionadas han sido generadas. Total: {total_carnets} / {total_generados}"
+                "Éxito", f"Todas las imágenes seleccionadas han sido generadas. Total: {total_carnets} / {total_generados}\n{resumen_cache}"
             )
 
+    def export_pdf_selection(self):
+        """Exporta los carnets seleccionados en el Treeview a un PDF listo para imprimir."""
+        selected_items = self.tree.selection()
+        if not selected_items:
+            messagebox.showwarning(
+                "Advertencia", "Por favor, selecciona al menos un carnet para exportar."
+            )
+            return
+        self.export_pdf([self.tree.item(item)["values"] for item in selected_items])
+
+    def export_pdf_filter(self):
+        """Exporta a PDF todos los carnets de la oficina y el tipo seleccionados en los filtros."""
+        adscrito, tipo = self.get_filter_values()
+        self.export_pdf(self.database_manager.iter_data(adscrito or None, tipo or None))
+
+    def export_data_filter(self):
+        """Exporta los trabajadores del filtro actual, con su último carnet, a CSV, Excel o Parquet."""
+        ruta = filedialog.asksaveasfilename(
+            title="Exportar trabajadores",
+            defaultextension=".xlsx",
+            filetypes=[("Archivos Excel", "*.xlsx"), ("Archivos CSV", "*.csv"), ("Archivos Parquet", "*.parquet")]
+        )
+        if not ruta:
+            return
+        adscrito, tipo = self.get_filter_values()
+        try:
+            total = exportar_trabajadores(self.database_manager, ruta, adscrito=adscrito or None, tipo=tipo or None)
+        except Exception as e:
+            logging.error(f"Error al exportar los trabajadores: {str(e)}")
+            messagebox.showerror("Error", f"No se pudo exportar: {str(e)}")
+            return
+        messagebox.showinfo("Éxito", f"Se exportaron {total} trabajadores a {os.path.basename(ruta)}.")
+
+    def export_photos_filter(self):
+        """Exporta las fotos de los trabajadores del filtro actual a un ZIP."""
+        ruta = filedialog.asksaveasfilename(
+            title="Exportar fotos",
+            defaultextension=".zip",
+            filetypes=[("Archivos ZIP", "*.zip")]
+        )
+        if not ruta:
+            return
+        adscrito, tipo = self.get_filter_values()
+        try:
+            exportadas, sin_foto, fallidas = exportar_fotos(
+                self.database_manager, ruta, adscrito=adscrito or None, tipo=tipo or None, workers=get_render_workers())
+        except Exception as e:
+            logging.error(f"Error al exportar las fotos: {str(e)}")
+            messagebox.showerror("Error", f"No se pudieron exportar las fotos: {str(e)}")
+            return
+        mensaje = f"Se exportaron {exportadas} fotos. Trabajadores sin foto: {sin_foto}."
+        if fallidas:
+            messagebox.showerror(
+                "Errores en la exportación",
+                f"{mensaje}\nNo se pudieron leer {fallidas} fotos; las cédulas están en el log de errores.")
+        else:
+            messagebox.showinfo("Éxito", mensaje)
+
+    def export_pdf(self, filas):
+        """
+        Genera los carnets de las filas y los impone en hojas de un PDF.
+
+        Parámetros:
+        - filas: Iterable de filas en el formato del Treeview. Las hojas se
+          escriben a medida que se completan, por lo que puede ser un generador.
+        """
+        ruta_pdf = filedialog.asksaveasfilename(
+            title="Guardar carnets en PDF",
+            defaultextension=".pdf",
+            filetypes=[("Archivos PDF", "*.pdf")]
+        )
+        if not ruta_pdf:
+            return
+
+        total_generados = 0
+        total_cache = 0
+        medidor = MedidorRendimiento()
+        errores = []
+        invalidos = []
+
+        def filas_validas():
+            for fila in filas:
+                if self.validate_fields(fila):
+                    yield fila_a_data_row(fila, self.registro_oficinas)
+                else:
+                    invalidos.append(fila)
+
+        try:
+            with PdfSink(ruta_pdf) as sink:
+                for resultado in self.image_generator.iter_carnets(
+                        filas_validas(), workers=get_render_workers(), sink=sink, tamano_lote=get_render_batch_size()):
+                    data = resultado["data_row"]
+                    medidor.agregar(resultado)
+                    if resultado["error"] is None:
+                        total_generados += 1
+                        if resultado["cache"]:
+                            total_cache += 1
+                    else:
+                        errores.append(f"{data['Nombre']} {data['Apellidos']} (Cédula: {data['Cedula']}): {str(resultado['error'])}")
+                        logging.error(f"No se pudo exportar el carnet de {data['Cedula']}: {str(resultado['error'])}\n{resultado['detalle']}")
+        except Exception as e:
+            logging.error(f"Error al exportar el PDF: {str(e)}")
+            messagebox.showerror("Error", f"No se pudo exportar el PDF: {str(e)}")
+            return
+
+        mensaje = f"Se exportaron {total_generados} carnets en {sink.hojas} hojas."
+        mensaje += f"\nDesde la caché: {total_cache}, renderizados: {total_generados - total_cache}."
+        if medidor.resumen():
+            mensaje += f"\n{medidor.resumen()}"
+        if invalidos:
+            mensaje += f"\n{len(invalidos)} registros con datos incompletos o inválidos no se exportaron."
+        if errores:
+            messagebox.showerror("Errores en la exportación", mensaje + "\n" + "\n".join(errores))
+        else:
+            messagebox.showinfo("Éxito", mensaje)
+
     def is_valid_name(self, name):
         """
         Valida que el nombre no contenga números ni caracteres especiales.
@@ -829,6 +1011,11 @@ class SettingsModel:
             "mysql_pass": "",
             "mysql_host": "",
             "mysql_port": "3306",
+            "render_workers": "",
+            "render_batch_size": "",
+            "render_cache_dir": "",
+            "render_cache_mb": "512",
+            "photo_store_dir": "",
         }
 
     def load_settings(self):
@@ -867,6 +1054,11 @@ class SettingsView:
         self.mysql_pass_var = tk.StringVar()
         self.mysql_host_var = tk.StringVar()
         self.mysql_port_var = tk.StringVar(value="3306")
+        self.render_workers_var = tk.StringVar()
+        self.render_batch_size_var = tk.StringVar()
+        self.render_cache_dir_var = tk.StringVar()
+        self.render_cache_mb_var = tk.StringVar(value="512")
+        self.photo_store_dir_var = tk.StringVar()
 
         # Crear la interfaz de usuario
         self.create_ui()
@@ -879,6 +1071,11 @@ class SettingsView:
             ("Contraseña MySQL:", self.mysql_pass_var, {"show": "*"}),
             ("Dirección MySQL:", self.mysql_host_var),
             ("Puerto MySQL:", self.mysql_port_var),
+            ("Procesos de renderizado:", self.render_workers_var),
+            ("Carnets por lote:", self.render_batch_size_var),
+            ("Carpeta de caché:", self.render_cache_dir_var),
+            ("Caché de carnets (MB, 0 = desactivada):", self.render_cache_mb_var),
+            ("Carpeta de fotos (vacío = en la base de datos):", self.photo_store_dir_var),
         ]
 
         # Crear y organizar los campos usando grid
@@ -906,6 +1103,11 @@ class SettingsView:
             "mysql_pass": self.mysql_pass_var.get(),
             "mysql_host": self.mysql_host_var.get(),
             "mysql_port": self.mysql_port_var.get(),
+            "render_workers": self.render_workers_var.get(),
+            "render_batch_size": self.render_batch_size_var.get(),
+            "render_cache_dir": self.render_cache_dir_var.get(),
+            "render_cache_mb": self.render_cache_mb_var.get(),
+            "photo_store_dir": self.photo_store_dir_var.get(),
         }
 
 
@@ -931,12 +1133,19 @@ class SettingsController:
             self.view.mysql_pass_var.set(settings.get("mysql_pass", ""))
             self.view.mysql_host_var.set(settings.get("mysql_host", ""))
             self.view.mysql_port_var.set(settings.get("mysql_port", "3306"))
+            self.view.render_workers_var.set(settings.get("render_workers", ""))
+            self.view.render_batch_size_var.set(settings.get("render_batch_size", ""))
+            self.view.render_cache_dir_var.set(settings.get("render_cache_dir", ""))
+            self.view.render_cache_mb_var.set(settings.get("render_cache_mb", "512"))
+            self.view.photo_store_dir_var.set(settings.get("photo_store_dir", ""))
         else:
             # Establece valores predeterminados si no hay configuraciones
             self.view.mysql_user_var.set("")
             self.view.mysql_pass_var.set("")
             self.view.mysql_host_var.set("")
             self.view.mysql_port_var.set("3306")
+            self.view.render_workers_var.set("")
+            self.view.render_batch_size_var.set("")
 
     def save_settings(self):
         """Guarda las configuraciones desde la vista al modelo."""
@@ -1081,6 +1290,14 @@ class EntryDetailWindow:
                 # Si image_path es una ruta válida, se trata de una imagen en disco
                 img = Image.open(self.image_path)
                 self.image_path_label.config(text=os.path.basename(self.image_path))  # Muestra solo el nombre del archivo
+            elif es_clave_foto(self.image_path):
+                # Foto ya registrada (y validada al guardarla): basta con su miniatura
+                img = crear_image_thumbnail_binarios(self.app.database_manager.fetch_miniatura(self.image_path))
+                self.image_path_label.config(text="Archivo")
+                img_tk = ImageTk.PhotoImage(img)
+                self.image_display.config(image=img_tk)
+                self.image_display.image = img_tk
+                return
             elif any(not char.isprintable() for char in self.image_path):
                 # Si image_path es un bytes, se trata de binarios
                 byna = convertir_str_a_bytes(self.image_path)
@@ -1147,23 +1364,32 @@ class EntryDetailWindow:
             with open(image_path, 'rb') as image_file:
                 image_binary = image_file.read()
             new_values[5] = image_binary
+        elif es_clave_foto(new_values[5]):
+            # La foto no cambió; update_entry conserva la registrada si recibe None
+            clave = new_values[5]
+            new_values[5] = None
         elif any(not char.isprintable() for char in new_values[5]):
             new_values[5] = convertir_str_a_bytes(new_values[5])
         else:
             messagebox.showerror("Error", "El archivo de imagen no existe.")
             return
 
-        # Actualizar o agregar la entrada en el Treeview
+        # En el Treeview se guarda la clave de la foto, no la foto
+        valores_tree = new_values[:5] + [clave_foto(new_values[2])] + new_values[6:]
         if item_id is not None:
             # Actualizar entrada existente
-            self.app.tree.item(item_id, values=new_values)
+            self.app.tree.item(item_id, values=valores_tree)
 
         else:
             # Agregar nueva entrada
-            self.app.tree.insert("", "end", values=new_values)
+            self.app.tree.insert("", "end", values=valores_tree)
 
         # Verificar si la cédula ya existe en la base de datos
-        if self.app.database_manager.check_duplicate_by_cedula(new_values[2]):
+        duplicada = self.app.database_manager.check_duplicate_by_cedula(new_values[2])
+        if new_values[5] is None and not duplicada:
+            # Se cambió la cédula de un registro: la foto se copia desde la clave original
+            new_values[5] = self.app.database_manager.fetch_foto(clave)
+        if duplicada:
             # Si la cédula ya existe, modificar el registro existente
             self.app.database_manager.update_entry({
                 'nombre': new_values[0],
@@ -1385,6 +1611,8 @@ class ofiEntryWindow:
 
 
 if __name__ == "__main__":
+    # Necesario en el ejecutable congelado para los procesos de renderizado
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ImageGeneratorApp(root)
     root.mainloop()
\ No newline at end of file
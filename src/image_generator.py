@@ -2,14 +2,25 @@ import imgkit
 import os
 import platform
 import qrcode
-import tempfile
 import io
 import logging
 import os
 import base64
-from database_manager import DatabaseManager
+import json
+import traceback
+import re
+import threading
+import hashlib
+import time
+from collections import deque, OrderedDict
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from database_manager import DatabaseManager, es_clave_foto
+from output_sinks import escribir_atomico
+from render_cache import RenderCache
 
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 from jinja2 import Environment, FileSystemLoader, TemplateNotFound
 
 
@@ -32,6 +43,364 @@ imagen_url = os.path.join(
     "PLANTILLA.png"
 )
 
+# Colores de la franja del cargo según el tipo de carnet
+COLORES_CARNET = {
+    "Profesional": "#2d29c6",
+    "Gerencial": "#ff0000",
+    "Coordinadores": "#E08343",
+    "Obrero": "#00913f",
+    "Seguridad": "#757575",
+    "Administrativo": "#c63b29"
+}
+
+# Formatos de foto que wkhtmltoimage muestra sin conversión previa
+FORMATOS_FOTO_DIRECTOS = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+}
+
+# Modos de renderizado soportados por generate_carnet
+RENDERERS = ("wkhtml", "pillow")
+
+# Geometría del carnet en píxeles, tomada de carnet_template.html
+ANCHO_IMAGEN = 804  # Opción "width" de wkhtmltoimage
+MARGEN_CARNET = 11  # padding del body (10px) + borde de .carnet (1px)
+ANCHO_CARNET = 784  # 20.736cm a 96 ppp
+ALTO_CARNET = 1152  # 30.468cm a 96 ppp
+ALTO_IMAGEN = ALTO_CARNET + 2 * MARGEN_CARNET
+
+# Cajas (left, top, width, height) de los elementos posicionados de la plantilla
+CAJA_FOTO = (60, 285, 330, 330)  # .Foto-container
+CAJA_QR = (63, 840, 270, 270)  # .qr-container, con el <img> del QR a 270px
+CAJA_CARGO = (63, 741, 660, 90)  # .Cargo, pintada con el color del tipo de carnet
+
+# Textos: caja, "top" del <p> relativo a la caja, tamaño de fuente, negrita y color
+TEXTOS_CARNET = {
+    "Nombre": ((417, 336, 273, 144), 0.15, 45, True, "#000000"),
+    "Cedula": ((417, 495, 273, 90), 0.25, 42, False, "#000000"),
+    "Adscrito": ((60, 657, 660, 75), 0.50, 30, False, "#000000"),
+    "Cargo": (CAJA_CARGO, 0.25, 36, False, "#ffffff"),
+}
+
+# Máscara hexagonal de la foto (mismo path que el SVG de la plantilla, viewBox 0 0 1 1)
+HEXAGONO_PATH = (
+    "M0.5,0.0005C0.475,0.0005,0.4495,0.005,0.4255,0.0145c-0.038,0.0145-0.091,0.039-0.159,0.0785c-0.068,0.0395-0.1155,0.0735-0.147,0.0994 "
+    "C0.08,0.2245,0.0535,0.2705,0.0455,0.3215c-0.0065,0.0405-0.012,0.099-0.012,0.179c0,0.079,0.0055,0.1375,0.012,0.178c0.008,0.0515,0.0345,0.0969,0.0745,0.1295 "
+    "c0.032,0.026,0.079,0.06,0.147,0.0994c0.068,0.0395,0.1215,0.064,0.1595,0.079c0.048,0.0185,0.1005,0.0185,0.148-0.0005c0.038-0.0145,0.091-0.039,0.159-0.079"
+    "c0.068-0.0395,0.1155-0.0735,0.147-0.0994c0.0395-0.0325,0.0665-0.0785,0.0745-0.1295c0.0065-0.0405,0.012-0.099,0.012-0.179c-0.0005-0.079-0.006-0.1369-0.012-0.178"
+    "c-0.008-0.0515-0.0345-0.0969-0.0745-0.1295c-0.032-0.026-0.079-0.06-0.147-0.0994C0.665,0.053,0.612,0.0285,0.574,0.0139C0.55,0.005,0.525,0.0005,0.5,0.0005z"
+)
+# La imagen del patrón SVG se desborda un 3.5% por cada lado (x=-0.035, width=1.07)
+DESBORDE_FOTO = 0.035
+
+# Fuentes equivalentes a "Times New Roman" según el sistema operativo
+FUENTES_SERIF = ("times.ttf", "Times New Roman.ttf", "LiberationSerif-Regular.ttf", "DejaVuSerif.ttf")
+FUENTES_SERIF_NEGRITA = ("timesbd.ttf", "Times New Roman Bold.ttf", "LiberationSerif-Bold.ttf", "DejaVuSerif-Bold.ttf")
+
+
+@lru_cache(maxsize=None)
+def _cargar_fuente(tamano, negrita=False):
+    """Carga una fuente serif del sistema o, si no hay ninguna, la fuente por defecto de Pillow."""
+    for nombre in (FUENTES_SERIF_NEGRITA if negrita else FUENTES_SERIF):
+        try:
+            return ImageFont.truetype(nombre, tamano)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(tamano)
+    except TypeError:  # Pillow < 10.1 no admite tamaño en la fuente por defecto
+        return ImageFont.load_default()
+
+
+def _puntos_path_svg(path, pasos=16):
+    """Aproxima con un polígono un path SVG formado por comandos M, C, c y z."""
+    tokens = re.findall(r"[MCcz]|-?\d*\.?\d+", path)
+    puntos = []
+    x = y = 0.0
+    comando = None
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in ("M", "C", "c", "z"):
+            comando = tokens[i]
+            i += 1
+            continue
+        if comando == "M":
+            x, y = float(tokens[i]), float(tokens[i + 1])
+            puntos.append((x, y))
+            i += 2
+            continue
+        valores = [float(v) for v in tokens[i:i + 6]]
+        i += 6
+        if comando == "c":
+            # Coordenadas relativas al punto actual
+            valores = [v + (x if k % 2 == 0 else y) for k, v in enumerate(valores)]
+        x1, y1, x2, y2, x3, y3 = valores
+        for paso in range(1, pasos + 1):
+            t = paso / pasos
+            u = 1 - t
+            puntos.append((
+                u ** 3 * x + 3 * u ** 2 * t * x1 + 3 * u * t ** 2 * x2 + t ** 3 * x3,
+                u ** 3 * y + 3 * u ** 2 * t * y1 + 3 * u * t ** 2 * y2 + t ** 3 * y3,
+            ))
+        x, y = x3, y3
+    return puntos
+
+
+@lru_cache(maxsize=None)
+def _mascara_hexagono(tamano):
+    """Devuelve la máscara (modo L) del hexágono de la foto, suavizada por sobremuestreo."""
+    escala = 4
+    lado = tamano * escala
+    mascara = Image.new("L", (lado, lado), 0)
+    puntos = [(px * lado, py * lado) for px, py in _puntos_path_svg(HEXAGONO_PATH)]
+    ImageDraw.Draw(mascara).polygon(puntos, fill=255)
+    return mascara.resize((tamano, tamano), Image.Resampling.LANCZOS)
+
+
+# Códigos QR en PNG indexados por el hash de su contenido (LRU del proceso)
+MAX_CACHE_QR = 2048
+_cache_qr = OrderedDict()
+_cache_qr_lock = threading.Lock()
+
+
+# Filas cuyos carnets se emiten juntos con DatabaseManager.emitir_carnets
+TAMANO_BLOQUE_EMISION = 200
+
+# Caché en disco de carnets renderizados (ver get_render_cache)
+DIRECTORIO_CACHE_RENDER = os.path.join("~", ".carnetcraft", "cache")
+MB_CACHE_RENDER = 512
+
+# Archivos que intervienen en el aspecto del carnet, incluidos en la huella de la caché
+ARCHIVOS_PLANTILLA = (
+    "carnet_template.html", "carnet_cuerpo.html", "carnet_estilos.css",
+    "carnet_lote.html", "style.css", "PLANTILLA.png",
+)
+_huella_plantillas = None  # (fechas de modificación, hash)
+_huella_plantillas_lock = threading.Lock()
+
+
+# Capas base (página, plantilla y franja del cargo) ya compuestas por color,
+# compartidas por todo el proceso y reconstruidas si cambia PLANTILLA.png;
+# solo las usa el renderizador "pillow" (ver obtener_capa_base)
+_capas_base = {}
+_capas_base_mtime = None
+_capas_base_lock = threading.Lock()
+
+
+def _componer_capa_base(plantilla, color):
+    """Compone la página con el fondo de la plantilla y la franja del cargo pintada."""
+    # Fondo: color temporal de .carnet, background-image y <img> de la plantilla
+    carnet = Image.new("RGBA", (ANCHO_CARNET, ALTO_CARNET), (255, 127, 127, 255))
+    carnet.alpha_composite(plantilla)
+    carnet.alpha_composite(plantilla)
+
+    # Franja del cargo
+    x, y, ancho, alto = CAJA_CARGO
+    ImageDraw.Draw(carnet).rectangle((x, y, x + ancho - 1, y + alto - 1), fill=color)
+
+    # Página blanca con el borde de 1px de .carnet
+    pagina = Image.new("RGB", (ANCHO_IMAGEN, ALTO_IMAGEN), "white")
+    ImageDraw.Draw(pagina).rectangle(
+        (MARGEN_CARNET - 1, MARGEN_CARNET - 1, MARGEN_CARNET + ANCHO_CARNET, MARGEN_CARNET + ALTO_CARNET),
+        outline="black",
+    )
+    pagina.paste(carnet.convert("RGB"), (MARGEN_CARNET, MARGEN_CARNET))
+    return pagina
+
+
+def obtener_capa_base(color):
+    """
+    Devuelve una copia de la capa base del carnet para el color indicado.
+
+    La plantilla se decodifica una sola vez por proceso y la capa de cada color
+    se compone la primera vez que se pide. Si la fecha de modificación de
+    PLANTILLA.png cambia, la caché se vacía y se vuelve a construir.
+
+    Solo la usa el renderizador "pillow" (render_pillow). Con "wkhtml" el
+    fondo y la franja los pinta WebKit a partir de la plantilla HTML, así que
+    PLANTILLA.png se decodifica en cada ejecución de wkhtmltoimage: una vez
+    por carnet, o una vez por lote si render_batch_size es mayor que 1 (ver
+    render_carnets_lote), porque todos los carnets del documento usan la
+    misma imagen.
+    """
+    global _capas_base_mtime
+    mtime = os.path.getmtime(imagen_url)
+    with _capas_base_lock:
+        if mtime != _capas_base_mtime:
+            _capas_base.clear()
+            _capas_base_mtime = mtime
+        if color not in _capas_base:
+            if "plantilla" not in _capas_base:
+                _capas_base["plantilla"] = ImageOps.fit(
+                    Image.open(imagen_url).convert("RGBA"), (ANCHO_CARNET, ALTO_CARNET)
+                )
+            _capas_base[color] = _componer_capa_base(_capas_base["plantilla"], color)
+        capa = _capas_base[color]
+    return capa.copy()
+
+
+def _ajustar_lineas(texto, fuente, ancho):
+    """Reparte el texto en líneas que quepan en el ancho dado, como hace el navegador."""
+    lineas = []
+    actual = ""
+    for palabra in str(texto).split():
+        candidata = f"{actual} {palabra}" if actual else palabra
+        if actual and fuente.getlength(candidata) > ancho:
+            lineas.append(actual)
+            actual = palabra
+        else:
+            actual = candidata
+    if actual:
+        lineas.append(actual)
+    return lineas
+
+# Generador propio de cada proceso del pool (con su conexión y entorno Jinja)
+_generador_proceso = None
+
+
+def _inicializar_proceso():
+    """Crea el ImageGenerator del proceso de trabajo del pool."""
+    global _generador_proceso
+    _generador_proceso = ImageGenerator()
+
+
+def _generar_en_proceso(lote, carnets, opciones):
+    """Genera un lote de carnets dentro de un proceso del pool y devuelve sus resultados."""
+    return _generador_proceso.generar_resultados(lote, carnets=carnets, **opciones)
+
+
+def _agrupar(data_rows, tamano):
+    """Recorre data_rows en listas de hasta 'tamano' filas."""
+    iterador = iter(data_rows)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def _leer_ajuste(clave, defecto=None):
+    """Lee una clave de settings.json; devuelve defecto si no existe o está vacía."""
+    try:
+        with open('settings.json') as f:
+            valor = json.load(f).get(clave)
+    except (OSError, ValueError, AttributeError):
+        valor = None
+    return defecto if valor in (None, "") else valor
+
+
+def _leer_ajuste_entero(clave):
+    """Lee un entero positivo de settings.json; devuelve 0 si no existe o no es válido."""
+    try:
+        valor = int(_leer_ajuste(clave, 0))
+    except (ValueError, TypeError):
+        valor = 0
+    return max(valor, 0)
+
+
+def get_render_workers():
+    """
+    Devuelve el número de procesos de renderizado configurado.
+
+    Se lee la clave 'render_workers' de settings.json; si no existe o no es
+    válida se usa el número de núcleos disponibles.
+    """
+    return _leer_ajuste_entero('render_workers') or (os.cpu_count() or 1)
+
+
+def get_render_batch_size():
+    """
+    Devuelve cuántos carnets se renderizan por ejecución de wkhtmltoimage.
+
+    Se lee la clave 'render_batch_size' de settings.json; por defecto, 1.
+    """
+    return _leer_ajuste_entero('render_batch_size') or 1
+
+
+class MedidorRendimiento:
+    """
+    Acumula el rendimiento de los lotes a partir de los resultados de iter_carnets.
+
+    Todos los resultados de un lote comparten el mismo diccionario
+    "rendimiento", así que cada lote se cuenta una vez. Los segundos son los
+    de cada proceso, por lo que carnets_por_segundo mide lo que rinde un
+    proceso con el tamaño de lote elegido, no el total con varios procesos.
+    """
+
+    def __init__(self):
+        self.lotes = {}
+        self.ultimo = None
+
+    def agregar(self, resultado):
+        """Registra el lote de un resultado, si no se había registrado."""
+        rendimiento = resultado.get("rendimiento")
+        if rendimiento is not None and id(rendimiento) not in self.lotes:
+            self.lotes[id(rendimiento)] = rendimiento
+            self.ultimo = rendimiento
+
+    @property
+    def carnets_por_segundo(self):
+        """Carnets renderizados por segundo de renderizado, sumando todos los lotes."""
+        carnets = sum(lote["carnets"] for lote in self.lotes.values())
+        segundos = sum(lote["segundos"] for lote in self.lotes.values())
+        return carnets / segundos if segundos > 0 else 0.0
+
+    def resumen(self):
+        """Texto para mostrar al terminar, o "" si no se renderizó ningún lote."""
+        if not any(lote["carnets"] for lote in self.lotes.values()):
+            return ""
+        return f"Rendimiento: {self.carnets_por_segundo:.2f} carnets/s por proceso en {len(self.lotes)} lotes."
+
+
+def get_render_cache():
+    """
+    Crea la caché en disco de carnets renderizados según settings.json.
+
+    Claves:
+    - 'render_cache_dir': Directorio de la caché. Por defecto, ~/.carnetcraft/cache.
+    - 'render_cache_mb': Tamaño máximo en MB. Por defecto, 512; con 0 la caché
+      se desactiva.
+
+    Retorna:
+    - RenderCache, o None si la caché está desactivada o no se pudo crear.
+    """
+    directorio = _leer_ajuste('render_cache_dir', DIRECTORIO_CACHE_RENDER)
+    try:
+        megas = int(_leer_ajuste('render_cache_mb', MB_CACHE_RENDER))
+    except (ValueError, TypeError):
+        megas = MB_CACHE_RENDER
+    if megas <= 0:
+        return None
+    try:
+        return RenderCache(os.path.expanduser(directorio), megas * 1024 * 1024)
+    except OSError as e:
+        logging.error(f"No se pudo abrir la caché de carnets en {directorio}: {str(e)}")
+        return None
+
+
+def huella_plantillas():
+    """
+    Devuelve el hash SHA-256 de los archivos de la plantilla del carnet.
+
+    El hash se recalcula solo cuando cambia la fecha de modificación de alguno
+    de los archivos, por lo que editar la plantilla invalida la caché de carnets.
+    """
+    global _huella_plantillas
+    rutas = [os.path.join(templates_dir, nombre) for nombre in ARCHIVOS_PLANTILLA]
+    mtimes = tuple(os.path.getmtime(ruta) if os.path.exists(ruta) else None for ruta in rutas)
+    with _huella_plantillas_lock:
+        if _huella_plantillas is None or _huella_plantillas[0] != mtimes:
+            sha = hashlib.sha256()
+            for ruta in rutas:
+                sha.update(os.path.basename(ruta).encode("utf-8") + b"\0")
+                if os.path.exists(ruta):
+                    with open(ruta, 'rb') as f:
+                        sha.update(hashlib.sha256(f.read()).digest())
+            _huella_plantillas = (mtimes, sha.hexdigest())
+        return _huella_plantillas[1]
+
 class ImageGenerator:
     def __init__(self):
         self.env = Environment(loader=FileSystemLoader(templates_dir))
@@ -47,6 +416,7 @@ class ImageGenerator:
             print(f"Error al acceder a la ruta del cargador: {str(e)}")
 
         self.path_wkhtmltopdf = self.get_wkhtmltopdf_path()
+        self.cache = get_render_cache()
         # The `get_wkhtmltopdf_path` method in the provided Python code
             # is responsible for determining the path to the `wkhtmltopdf`
             # executable based on the operating system that the script is
@@ -68,87 +438,85 @@ class ImageGenerator:
             logging.error(f"Error al obtener la ruta de wkhtmltopdf: {str(e)}")
             raise
 
-    def generate_carnet(self, data_row):
-        """Genera una imagen a partir de los datos y el tipo de carnet proporcionado."""
+    def generate_carnet(self, data_row, renderer="wkhtml", destino=None):
+        """
+        Genera una imagen a partir de los datos y el tipo de carnet proporcionado.
+
+        Parámetros:
+        - data_row (dict): Datos del trabajador.
+        - renderer (str): Modo de renderizado (ver render_carnet).
+        - destino (str): Ruta del PNG a escribir. Por defecto, nombre_carnet(data_row)
+          en el directorio actual. La escritura es atómica.
+
+        Retorna:
+        - str: Ruta del archivo generado.
+        """
+        datos = self.render_carnet(data_row, renderer)
+        image_filename = destino or self.nombre_carnet(data_row)
+        escribir_atomico(image_filename, datos)
+        return image_filename
+
+    def nombre_carnet(self, data_row):
+        """Devuelve el nombre de archivo del carnet: {cedula}_{tipo}.png."""
+        return f"{data_row['Cedula']}_{data_row['TipoCarnet']}.png"
+
+    def render_carnet(self, data_row, renderer="wkhtml"):
+        """
+        Renderiza el carnet y devuelve el PNG en bytes, sin escribir en disco.
+
+        Parámetros:
+        - data_row (dict): Datos del trabajador.
+        - renderer (str): "wkhtml" renderiza la plantilla HTML con wkhtmltoimage;
+          "pillow" compone la misma geometría directamente con Pillow.
+
+        Retorna:
+        - bytes: Imagen PNG del carnet.
+        """
+        return self.render_carnet_cacheado(data_row, renderer)[0]
+
+    def render_carnet_cacheado(self, data_row, renderer="wkhtml", carnets=None, fotos=None):
+        """
+        Igual que render_carnet, pero indica si el PNG salió de la caché.
+
+        Si el carnet ya se renderizó con los mismos datos, foto, fechas y
+        plantilla (ver huella_carnet), se devuelve el PNG guardado sin volver a
+        renderizarlo.
+
+        Parámetros:
+        - carnets (dict): Carnets ya emitidos (ver preparar_carnet).
+        - fotos (dict): Fotos ya leídas (ver preparar_carnet).
+
+        Retorna:
+        - tuple: (bytes, acierto), donde acierto es True si el PNG salió de la caché.
+        """
         try:
-            # Validar que data_row contenga los campos necesarios
-            required_fields = ["Nombre", "Apellidos", "Cedula", "Adscrito", "Cargo", "RutaImagen", "TipoCarnet"]
-            for field in required_fields:
-                if field not in data_row:
-                    raise ValueError(f"Falta el campo requerido: {field}")
-
-            # Generar la cadena para el código QR
-            color = self.get_template(data_row['TipoCarnet'])
-            try:
-                id_trabajador = self.db.fetch_id_by_cedula(data_row['Cedula'])
-            except Exception as e:
-                print(f"Error al obtener el ID del trabajador: {e}")
-                id_trabajador = None
-            
-            last_carnet = self.db.feth_last_carnet(id_trabajador)
-            if not self.db.check_fecha_emision_expiracion(last_carnet):
-                self.db.save_carnet(id_trabajador)
-                new_carnet =  self.db.feth_last_carnet(id_trabajador)
-            else:
-                new_carnet = last_carnet
+            if renderer not in RENDERERS:
+                raise ValueError(f"Renderizador no válido: {renderer}")
 
-            try:
-                template = self.env.get_template("carnet_template.html")
-            except TemplateNotFound:
-                print("La plantilla no se encontró.")
-                logging.error("La plantilla 'carnet_template.html' no se encontró.")
-                raise FileNotFoundError("La plantilla de carnet no se pudo encontrar. Asegúrate de que el archivo exista en la ruta correcta.")
-            
-            try:
-                blob = self.convertir_str_a_bytes(data_row['RutaImagen'])
-                temp_photo_path = self.create_temp_photo_from_blob(blob)
-                print(f"Foto temporal creada en: {temp_photo_path}")
-            except Exception as e:
-                print(f"Error al crear la foto temporal: {str(e)}")
-                raise  # Relanzar la excepción para manejarla en el bloque externo
+            preparado = self.preparar_carnet(data_row, carnets, fotos)
 
+            huella = None
+            # Sin carnet (la cédula no está en la base de datos) no se guarda en la caché
+            if self.cache is not None and preparado["carnet"] is not None:
+                huella = self.huella_carnet(preparado, renderer)
+                datos = self.cache.get(huella)
+                if datos is not None:
+                    return datos, True
 
-            try:
-                qr_data = self.create_qr_code(data_row, new_carnet)
-                # Intentar renderizar la plantilla
-                html_out = template.render(
-                    data_row=data_row, 
-                    ruta_imagen=temp_photo_path,
-                    imagen_url=imagen_url, 
-                    qr_data=qr_data, 
-                    color=color,
-                    carnet=new_carnet
-                )
-            except Exception as e:
-                # Manejo de errores
-                logging.error(f"Error al renderizar la plantilla: {str(e)}")
-                print(f"Error al renderizar la plantilla: {str(e)}")
-                raise  # Vuelve a lanzar la excepción si es necesario
-
-            if not os.path.exists(temp_photo_path):
-                raise FileNotFoundError(f"La ruta de la imagen no existe: {temp_photo_path}")
-
-            
-            
-            options = {
-                "enable-local-file-access": "",
-                "width": 804,  # Establecer el ancho de la imagen
-                "disable-smart-width": "",  # Deshabilitar el ajuste automático de ancho
-            }
+            if renderer == "pillow":
+                qr_img = self.create_qr_image(data_row)
+                imagen = self.render_pillow(data_row, preparado["foto"], qr_img, preparado["color"])
 
-            image_filename = f"{data_row['Cedula']}_{data_row['TipoCarnet']}.png"
-            print(image_filename)
-            if os.path.exists(image_filename):
-                os.remove(image_filename)
+                buffer = io.BytesIO()
+                imagen.save(buffer, format="PNG")
+                datos = buffer.getvalue()
+            else:
+                html_out = self.render_html("carnet_template.html", **self.contexto_html(preparado))
+                datos = self.ejecutar_wkhtmltoimage(html_out)
 
-            imgkit.from_string(
-                html_out,
-                image_filename,
-                config=imgkit.config(wkhtmltoimage=self.path_wkhtmltopdf),
-                options=options,
-            )
-            os.remove(temp_photo_path)
-            return image_filename
+            if huella is not None:
+                self.cache.put(huella, datos)
+            return datos, False
 
         except FileNotFoundError as fnf_error:
             logging.error(f"Archivo no encontrado: {str(fnf_error)}")
@@ -160,11 +528,429 @@ class ImageGenerator:
             logging.error(f"Error al generar la imagen: {str(e)}")
             raise
 
+    def preparar_carnet(self, data_row, carnets=None, fotos=None):
+        """
+        Valida la fila, obtiene el carnet vigente (emitiendo uno nuevo si hace falta) y lee la foto.
+
+        Parámetros:
+        - data_row (dict): Datos del trabajador.
+        - carnets (dict): Resultado de DatabaseManager.emitir_carnets para un
+          grupo de filas. Si la cédula está incluida, se usa ese carnet sin
+          consultar la base de datos.
+        - fotos (dict): Resultado de DatabaseManager.fetch_fotos para un grupo
+          de filas (ver obtener_foto_bytes).
+
+        Retorna:
+        - dict: {"data_row", "color", "carnet", "foto"}. "carnet" es None
+          solo si la cédula no está en la base de datos; si la emisión falla
+          se lanza el error.
+        """
+        # Validar que data_row contenga los campos necesarios
+        required_fields = ["Nombre", "Apellidos", "Cedula", "Adscrito", "Cargo", "RutaImagen", "TipoCarnet"]
+        for field in required_fields:
+            if field not in data_row:
+                raise ValueError(f"Falta el campo requerido: {field}")
+
+        color = self.get_template(data_row['TipoCarnet'])
+        cedula = str(data_row['Cedula'])
+        if carnets is None or cedula not in carnets:
+            carnets = self.db.emitir_carnets([cedula])
+        new_carnet = carnets.get(cedula)
+
+        return {
+            "data_row": data_row,
+            "color": color,
+            "carnet": new_carnet,
+            "foto": self.obtener_foto_bytes(data_row['RutaImagen'], fotos),
+        }
+
+    def huella_carnet(self, preparado, renderer):
+        """
+        Calcula la huella de un carnet preparado para la caché de renderizado.
+
+        La huella es el SHA-256 de todo lo que se ve en el carnet: los campos de
+        data_row, el hash de la foto, el correlativo y las fechas del carnet, el
+        color, el renderizador y el hash de los archivos de la plantilla.
+        """
+        carnet = preparado["carnet"] or {}
+        entradas = {
+            "data_row": {clave: str(valor) for clave, valor in preparado["data_row"].items() if clave != "RutaImagen"},
+            "foto": hashlib.sha256(preparado["foto"]).hexdigest(),
+            "carnet": [str(carnet.get(clave)) for clave in ("correlativo", "fecha_emision", "fecha_expiracion")],
+            "color": preparado["color"],
+            "renderer": renderer,
+            "plantilla": huella_plantillas(),
+        }
+        return hashlib.sha256(json.dumps(entradas, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def contexto_html(self, preparado):
+        """Devuelve las variables de carnet_cuerpo.html para un carnet preparado."""
+        try:
+            foto_data = self.create_photo_data_uri(preparado["foto"])
+        except Exception as e:
+            print(f"Error al preparar la foto: {str(e)}")
+            raise  # Relanzar la excepción para manejarla en el bloque externo
+
+        return {
+            "data_row": preparado["data_row"],
+            "ruta_imagen": foto_data,
+            "qr_data": self.create_qr_code(preparado["data_row"], preparado["carnet"]),
+            "color": preparado["color"],
+            "carnet": preparado["carnet"],
+        }
+
+    def render_html(self, nombre_plantilla, **contexto):
+        """Renderiza una plantilla del directorio de plantillas."""
+        try:
+            template = self.env.get_template(nombre_plantilla)
+        except TemplateNotFound:
+            print("La plantilla no se encontró.")
+            logging.error(f"La plantilla '{nombre_plantilla}' no se encontró.")
+            raise FileNotFoundError("La plantilla de carnet no se pudo encontrar. Asegúrate de que el archivo exista en la ruta correcta.")
+
+        try:
+            return template.render(imagen_url=imagen_url, **contexto)
+        except Exception as e:
+            # Manejo de errores
+            logging.error(f"Error al renderizar la plantilla: {str(e)}")
+            print(f"Error al renderizar la plantilla: {str(e)}")
+            raise  # Vuelve a lanzar la excepción si es necesario
+
+    def ejecutar_wkhtmltoimage(self, html_out):
+        """Convierte el HTML en PNG con wkhtmltoimage y devuelve los bytes."""
+        options = {
+            "enable-local-file-access": "",
+            "width": ANCHO_IMAGEN,  # Establecer el ancho de la imagen
+            "disable-smart-width": "",  # Deshabilitar el ajuste automático de ancho
+            "format": "png",
+        }
+
+        # Con output_path=False, imgkit devuelve la imagen por la salida estándar
+        return imgkit.from_string(
+            html_out,
+            False,
+            config=imgkit.config(wkhtmltoimage=self.path_wkhtmltopdf),
+            options=options,
+        )
+
+    def render_carnets_lote(self, data_rows, carnets=None, fotos=None):
+        """
+        Renderiza varios carnets con una sola ejecución de wkhtmltoimage.
+
+        Los carnets se colocan uno debajo de otro en un único documento
+        (carnet_lote.html), cada uno en una franja de ANCHO_IMAGEN x ALTO_IMAGEN
+        píxeles, y la imagen resultante se recorta en un PNG por carnet. Así el
+        arranque de wkhtmltoimage y de WebKit se paga una vez por lote. Los
+        carnets que ya están en la caché no entran en el documento.
+
+        Parámetros:
+        - data_rows (list): Filas en el formato de generate_carnet.
+        - carnets (dict): Carnets ya emitidos (ver preparar_carnet). Por
+          defecto, se emiten todos los del lote con una sola llamada.
+        - fotos (dict): Fotos ya leídas (ver preparar_carnet). Por defecto, se
+          leen todas las del lote con una sola consulta.
+
+        Retorna:
+        - tuple: (salidas, aciertos, rendimiento). salidas tiene, por cada fila
+          y en el mismo orden, los bytes del PNG o la excepción que impidió
+          generarlo; aciertos indica por fila si el PNG salió de la caché.
+          rendimiento es {"carnets", "aciertos", "segundos", "carnets_por_segundo"},
+          donde "carnets" cuenta solo los renderizados.
+        """
+        inicio = time.perf_counter()
+        if carnets is None:
+            carnets = self.emitir_carnets(data_rows)
+        if fotos is None:
+            fotos = self.leer_fotos(data_rows)
+        salidas = [None] * len(data_rows)
+        aciertos = [False] * len(data_rows)
+        contextos = []
+        indices = []
+        huellas = []
+        for i, data_row in enumerate(data_rows):
+            try:
+                preparado = self.preparar_carnet(data_row, carnets, fotos)
+                huella = None
+                if self.cache is not None and preparado["carnet"] is not None:
+                    huella = self.huella_carnet(preparado, "wkhtml")
+                    datos = self.cache.get(huella)
+                    if datos is not None:
+                        salidas[i] = datos
+                        aciertos[i] = True
+                        continue
+                contextos.append(self.contexto_html(preparado))
+                indices.append(i)
+                huellas.append(huella)
+            except Exception as e:
+                logging.error(f"Error al preparar el carnet de {data_row.get('Cedula')}: {str(e)}")
+                salidas[i] = e
+
+        if contextos:
+            try:
+                html_out = self.render_html("carnet_lote.html", carnets=contextos, ancho=ANCHO_IMAGEN, alto=ALTO_IMAGEN)
+                hoja = Image.open(io.BytesIO(self.ejecutar_wkhtmltoimage(html_out)))
+                if hoja.height < len(contextos) * ALTO_IMAGEN:
+                    raise ValueError(f"La imagen del lote mide {hoja.height}px y se esperaban {len(contextos) * ALTO_IMAGEN}px.")
+
+                for n, i in enumerate(indices):
+                    recorte = hoja.crop((0, n * ALTO_IMAGEN, ANCHO_IMAGEN, (n + 1) * ALTO_IMAGEN))
+                    buffer = io.BytesIO()
+                    recorte.save(buffer, format="PNG")
+                    salidas[i] = buffer.getvalue()
+                    if huellas[n] is not None:
+                        self.cache.put(huellas[n], salidas[i])
+            except Exception as e:
+                logging.error(f"Error al generar el lote de carnets: {str(e)}")
+                for i in indices:
+                    salidas[i] = e
+
+        segundos = time.perf_counter() - inicio
+        rendimiento = {
+            "carnets": len(contextos),
+            "aciertos": sum(aciertos),
+            "segundos": segundos,
+            "carnets_por_segundo": len(contextos) / segundos if segundos > 0 else 0.0,
+        }
+        logging.debug(f"Lote de {rendimiento['carnets']} carnets en {segundos:.2f} s ({rendimiento['carnets_por_segundo']:.2f} carnets/s), "
+                      f"{rendimiento['aciertos']} desde la caché")
+        return salidas, aciertos, rendimiento
+
+    def leer_fotos(self, data_rows):
+        """Lee con una sola consulta las fotos de las filas que llegan como clave (ver DatabaseManager.fetch_fotos)."""
+        claves = [data_row.get('RutaImagen') for data_row in data_rows if es_clave_foto(data_row.get('RutaImagen'))]
+        return self.db.fetch_fotos(claves) if claves else {}
+
+    def generar_resultado(self, data_row, en_memoria=False, carnets=None, fotos=None, **opciones):
+        """
+        Genera un carnet y devuelve el resultado sin propagar la excepción.
+
+        Parámetros:
+        - data_row (dict): Datos del trabajador.
+        - en_memoria (bool): Si es True, el PNG se devuelve en la clave "datos"
+          en lugar de escribirse en disco.
+        - carnets (dict): Carnets ya emitidos (ver preparar_carnet).
+        - fotos (dict): Fotos ya leídas (ver preparar_carnet).
+
+        Retorna:
+        - dict: {"cedula", "archivo", "datos", "cache", "error", "detalle"}.
+          "cache" es True si el PNG salió de la caché. Si la generación falla,
+          "error" contiene la excepción.
+        """
+        resultado = {"cedula": data_row.get("Cedula"), "archivo": None, "datos": None, "cache": False, "error": None, "detalle": None}
+        try:
+            datos, resultado["cache"] = self.render_carnet_cacheado(data_row, carnets=carnets, fotos=fotos, **opciones)
+            if en_memoria:
+                resultado["datos"] = datos
+            else:
+                resultado["archivo"] = self.nombre_carnet(data_row)
+                escribir_atomico(resultado["archivo"], datos)
+        except Exception as e:
+            resultado["archivo"] = None
+            resultado["error"] = e
+            resultado["detalle"] = traceback.format_exc()
+        return resultado
+
+    def generar_resultados(self, data_rows, en_memoria=False, renderer="wkhtml", carnets=None):
+        """
+        Genera un grupo de carnets y devuelve un resultado por fila.
+
+        Los carnets del grupo se emiten juntos con DatabaseManager.emitir_carnets,
+        salvo que ya vengan en carnets, y las fotos que llegan como clave se leen
+        juntas con DatabaseManager.fetch_fotos, con cualquier renderizador. Con
+        el renderizador "wkhtml" y más de una fila, el grupo se renderiza en un
+        único documento con render_carnets_lote. Cada resultado lleva el
+        rendimiento del grupo en la clave "rendimiento" (ver MedidorRendimiento).
+        """
+        if carnets is None and len(data_rows) > 1:
+            carnets = self.emitir_carnets(data_rows)
+        fotos = self.leer_fotos(data_rows)
+
+        if renderer != "wkhtml" or len(data_rows) == 1:
+            inicio = time.perf_counter()
+            resultados = [self.generar_resultado(data_row, en_memoria, carnets, fotos, renderer=renderer) for data_row in data_rows]
+            segundos = time.perf_counter() - inicio
+            renderizados = sum(1 for resultado in resultados if resultado["error"] is None and not resultado["cache"])
+            rendimiento = {
+                "carnets": renderizados,
+                "aciertos": sum(1 for resultado in resultados if resultado["cache"]),
+                "segundos": segundos,
+                "carnets_por_segundo": renderizados / segundos if segundos > 0 else 0.0,
+            }
+            for resultado in resultados:
+                resultado["rendimiento"] = rendimiento
+            return resultados
+
+        salidas, aciertos, rendimiento = self.render_carnets_lote(data_rows, carnets, fotos)
+        resultados = []
+        for data_row, salida, acierto in zip(data_rows, salidas, aciertos):
+            resultado = {"cedula": data_row.get("Cedula"), "archivo": None, "datos": None, "cache": acierto,
+                         "error": None, "detalle": None, "rendimiento": rendimiento}
+            try:
+                if isinstance(salida, Exception):
+                    raise salida
+                if en_memoria:
+                    resultado["datos"] = salida
+                else:
+                    resultado["archivo"] = self.nombre_carnet(data_row)
+                    escribir_atomico(resultado["archivo"], salida)
+            except Exception as e:
+                resultado["archivo"] = None
+                resultado["error"] = e
+                resultado["detalle"] = traceback.format_exc()
+            resultados.append(resultado)
+        return resultados
+
+    def iter_carnets(self, data_rows, workers=None, sink=None, renderer="wkhtml", tamano_lote=1):
+        """
+        Genera los carnets de varias filas repartiéndolos entre procesos.
+
+        Cada proceso del pool crea su propio ImageGenerator, con su conexión a
+        la base de datos y su entorno Jinja. Los resultados se devuelven uno por
+        fila y en el mismo orden que data_rows, con la fila original en la
+        clave "data_row".
+
+        Parámetros:
+        - data_rows (iterable): Filas en el formato de generate_carnet.
+        - workers (int): Número de procesos. Por defecto, get_render_workers().
+        - sink: Destino de los PNG (DirectorySink, ZipSink, MemorySink...). Los
+          procesos devuelven los bytes y el sink los guarda; "archivo" contiene
+          lo que devuelve sink.save. Sin sink, cada carnet se escribe en el
+          directorio actual como en generate_carnet.
+        - renderer (str): Modo de renderizado (ver render_carnet).
+        - tamano_lote (int): Carnets por ejecución de wkhtmltoimage (ver
+          render_carnets_lote). Con 1 se renderiza cada carnet por separado.
+
+        Los carnets se emiten en este proceso, en bloques de
+        TAMANO_BLOQUE_EMISION filas con DatabaseManager.emitir_carnets, y los
+        procesos del pool solo renderizan.
+        """
+        if workers is None:
+            workers = get_render_workers()
+        opciones = {"en_memoria": sink is not None, "renderer": renderer}
+        lotes = self._lotes_emitidos(data_rows, max(1, tamano_lote))
+
+        if workers <= 1:
+            for lote, carnets, fallo in lotes:
+                if fallo is not None:
+                    yield from self._resultados_con_error(lote, *fallo, sink)
+                    continue
+                for data_row, resultado in zip(lote, self.generar_resultados(lote, carnets=carnets, **opciones)):
+                    yield self._guardar_resultado(data_row, resultado, sink)
+            return
+
+        # Se mantiene una ventana acotada de lotes para no cargar en memoria
+        # todas las filas (y sus fotos) de un trabajo grande.
+        pendientes = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_proceso) as pool:
+            for lote, carnets, fallo in lotes:
+                if fallo is not None:
+                    yield from self._resultados_con_error(lote, *fallo, sink)
+                    continue
+                pendientes.append((lote, pool.submit(_generar_en_proceso, lote, carnets, opciones)))
+                if len(pendientes) >= workers * 2:
+                    yield from self._resultados_de_tarea(*pendientes.popleft(), sink)
+            while pendientes:
+                yield from self._resultados_de_tarea(*pendientes.popleft(), sink)
+
+    def emitir_carnets(self, data_rows):
+        """
+        Emite juntos los carnets de varias filas (ver DatabaseManager.emitir_carnets).
+
+        Las filas con un tipo de carnet no válido se omiten, porque no llegarán
+        a renderizarse.
+        """
+        return self.db.emitir_carnets(
+            data_row.get("Cedula") for data_row in data_rows if data_row.get("TipoCarnet") in COLORES_CARNET
+        )
+
+    def _lotes_emitidos(self, data_rows, tamano_lote):
+        """
+        Recorre data_rows en lotes de tamano_lote filas junto con sus carnets.
+
+        Los carnets se emiten por bloques de TAMANO_BLOQUE_EMISION filas; cada
+        lote recibe solo los carnets de sus propias cédulas. Entrega tuplas
+        (lote, carnets, fallo): si la emisión del bloque falla, fallo es
+        (excepción, detalle) y sus lotes no deben renderizarse.
+        """
+        for bloque in _agrupar(data_rows, max(TAMANO_BLOQUE_EMISION, tamano_lote)):
+            try:
+                carnets = self.emitir_carnets(bloque)
+            except Exception as e:
+                logging.error(f"Error al emitir los carnets: {str(e)}")
+                fallo = (e, traceback.format_exc())
+                for lote in _agrupar(bloque, tamano_lote):
+                    yield lote, None, fallo
+                continue
+            for lote in _agrupar(bloque, tamano_lote):
+                cedulas = {str(data_row.get("Cedula")) for data_row in lote}
+                yield lote, {cedula: carnet for cedula, carnet in carnets.items() if cedula in cedulas}, None
+
+    def generate_carnets(self, data_rows, workers=None, sink=None, renderer="wkhtml", tamano_lote=1):
+        """Genera los carnets de varias filas en paralelo y devuelve la lista de resultados."""
+        return list(self.iter_carnets(data_rows, workers, sink, renderer, tamano_lote))
+
+    def _resultados_de_tarea(self, lote, tarea, sink):
+        """Obtiene los resultados de un lote del pool, incluso si el proceso falló."""
+        try:
+            resultados = tarea.result()
+        except Exception as e:
+            logging.error(f"Error en el proceso de renderizado: {str(e)}")
+            yield from self._resultados_con_error(lote, e, traceback.format_exc(), sink)
+            return
+        for data_row, resultado in zip(lote, resultados):
+            yield self._guardar_resultado(data_row, resultado, sink)
+
+    def _resultados_con_error(self, lote, error, detalle, sink):
+        """Entrega un resultado fallido con el mismo error por cada fila del lote."""
+        for data_row in lote:
+            resultado = {"cedula": data_row.get("Cedula"), "archivo": None, "datos": None, "cache": False, "error": error, "detalle": detalle}
+            yield self._guardar_resultado(data_row, resultado, sink)
+
+    def _guardar_resultado(self, data_row, resultado, sink):
+        """Entrega el PNG del resultado al sink y libera los bytes."""
+        resultado["data_row"] = data_row
+        datos = resultado.pop("datos", None)
+        if sink is not None and datos is not None:
+            try:
+                resultado["archivo"] = sink.save(self.nombre_carnet(data_row), datos)
+            except Exception as e:
+                logging.error(f"Error al guardar el carnet: {str(e)}")
+                resultado["error"] = e
+                resultado["detalle"] = traceback.format_exc()
+        return resultado
+
     def create_qr_code(self, data_row, carnet):
-        """Genera un código QR y lo guarda como imagen en una ubicación temporal."""
+        """Genera el código QR y lo devuelve como data URI para la plantilla HTML."""
+        try:
+            qr_png = self.create_qr_png(data_row)
+            return "data:image/png;base64," + base64.b64encode(qr_png).decode("ascii")
+
+        except Exception as e:
+            logging.error(f"Error al crear el código QR: {str(e)}")
+            raise
+
+    def create_qr_image(self, data_row):
+        """Genera la imagen del código QR con los datos del trabajador."""
+        return Image.open(io.BytesIO(self.create_qr_png(data_row)))
+
+    def create_qr_png(self, data_row):
+        """
+        Genera el código QR en memoria y lo devuelve como bytes PNG.
+
+        Los códigos se guardan en una caché del proceso indexada por el hash
+        SHA-256 del texto del QR, por lo que reemitir el carnet de un trabajador
+        sin cambios no vuelve a generar el código.
+        """
         try:
             qr_string = f"V-{data_row['Cedula']} \n{data_row['Nombre']}. {data_row['Apellidos']}. \n\n{data_row['Cargo']} \n{data_row['Adscrito']} \n\nEn caso de Emergencia, Perdida, Extravio, Hurto o Robo Debe de Notificar a la oficina de tecnologia de la informacion \n(212) 351 0822 \n\nFUNDALANAVIAL"    
             qr_string = qr_string.upper()
+            clave = hashlib.sha256(qr_string.encode("utf-8")).hexdigest()
+
+            with _cache_qr_lock:
+                if clave in _cache_qr:
+                    _cache_qr.move_to_end(clave)
+                    return _cache_qr[clave]
+
             qr = qrcode.QRCode( 
                 version=1,  
                 error_correction=qrcode.constants.ERROR_CORRECT_L,  
@@ -174,19 +960,78 @@ class ImageGenerator:
             qr.add_data(qr_string)  
             qr.make(fit=True)   
             qr_img = qr.make_image(fill_color="black", back_color="white")  
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file: 
-                qr_code_filename = temp_file.name  
-                qr_img.save(qr_code_filename)  
-            
-            if not os.path.exists(qr_code_filename):    
-                raise FileNotFoundError("Error: El archivo QR no se ha creado correctamente.")
 
-            return qr_code_filename
+            buffer = io.BytesIO()
+            qr_img.save(buffer)
+            qr_png = buffer.getvalue()
+
+            with _cache_qr_lock:
+                _cache_qr[clave] = qr_png
+                while len(_cache_qr) > MAX_CACHE_QR:
+                    _cache_qr.popitem(last=False)
+            return qr_png
 
         except Exception as e:
             logging.error(f"Error al crear el código QR: {str(e)}")
             raise
+
+    def render_pillow(self, data_row, foto_bytes, qr_img, color):
+        """
+        Compone el carnet con Pillow usando la misma geometría que carnet_template.html.
+
+        Parámetros:
+        - data_row (dict): Datos del trabajador.
+        - foto_bytes (bytes): Foto del trabajador en cualquier formato soportado por Pillow.
+        - qr_img (Image): Imagen del código QR.
+        - color (str): Color de la franja del cargo.
+
+        Retorna:
+        - Image: Imagen RGB de ANCHO_IMAGEN x ALTO_IMAGEN píxeles.
+        """
+        try:
+            imagen = obtener_capa_base(color)
+
+            # Foto recortada en hexágono
+            x, y, ancho, alto = CAJA_FOTO
+            desborde = round(ancho * DESBORDE_FOTO)
+            foto = Image.open(io.BytesIO(foto_bytes))
+            foto = ImageOps.exif_transpose(foto).convert("RGBA")
+            foto = ImageOps.fit(foto, (ancho + 2 * desborde, alto + 2 * desborde), Image.Resampling.LANCZOS)
+            foto = foto.crop((desborde, desborde, desborde + ancho, desborde + alto))
+            imagen.paste(foto, (MARGEN_CARNET + x, MARGEN_CARNET + y), _mascara_hexagono(ancho))
+
+            # Código QR
+            x, y, ancho, alto = CAJA_QR
+            imagen.paste(qr_img.convert("RGB").resize((ancho, alto), Image.Resampling.NEAREST),
+                         (MARGEN_CARNET + x, MARGEN_CARNET + y))
+
+            # Textos (la plantilla muestra data_row['Apellido'], que no forma parte de data_row)
+            valores = {
+                "Nombre": f"{data_row['Nombre']}  {data_row.get('Apellido', '')}",
+                "Cedula": f"V-{data_row['Cedula']}",
+                "Adscrito": data_row['Adscrito'],
+                "Cargo": data_row['Cargo'],
+            }
+            draw = ImageDraw.Draw(imagen)
+            for campo, ((x, y, ancho, alto), top, tamano, negrita, color_texto) in TEXTOS_CARNET.items():
+                fuente = _cargar_fuente(tamano, negrita)
+                alto_linea = round(tamano * 1.15)
+                x += MARGEN_CARNET
+                y += MARGEN_CARNET
+                y_linea = y + round(alto * top)
+                for linea in _ajustar_lineas(valores[campo], fuente, ancho):
+                    # El <p> tiene overflow: hidden y max-height igual al alto de la caja
+                    if y_linea + alto_linea > y + round(alto * top) + alto:
+                        break
+                    draw.text((x + ancho / 2, y_linea + (alto_linea - tamano) / 2), linea,
+                              font=fuente, fill=color_texto, anchor="ma")
+                    y_linea += alto_linea
+
+            return imagen
+
+        except Exception as e:
+            logging.error(f"Error al componer el carnet con Pillow: {str(e)}")
+            raise
     
     def convertir_str_a_bytes(self, binary_str):
         """
@@ -204,15 +1049,37 @@ class ImageGenerator:
             print(f"Error al convertir la cadena a bytes: {str(e)}")
             raise    
     
-    def create_temp_photo_from_blob(self, blob_data):
+    def obtener_foto_bytes(self, foto, fotos=None):
         """
-        Crea una foto temporal a partir de datos en formato blob.
+        Devuelve la foto como bytes.
+
+        La foto puede llegar en binario, como cadena latin1 o como la clave que
+        devuelven las consultas de listado de DatabaseManager; en este último
+        caso se toma de 'fotos' si está ahí o se pide con fetch_foto, que lee
+        las claves "sha256:" del almacén de fotos sin consultar la base de datos.
+        """
+        if isinstance(foto, (bytes, bytearray, memoryview)):
+            return bytes(foto)
+        if es_clave_foto(foto):
+            datos = (fotos or {}).get(foto) or self.db.fetch_foto(foto)
+            if datos is None:
+                raise ValueError(f"No se encontró la foto {foto}.")
+            return datos
+        return self.convertir_str_a_bytes(foto)
+
+    def create_photo_data_uri(self, blob_data):
+        """
+        Crea un data URI con la foto para insertarla directamente en la plantilla.
+
+        Si el formato almacenado ya lo muestra wkhtmltoimage (JPEG, PNG, GIF o
+        BMP), se usan los bytes originales sin decodificarlos; solo los demás
+        formatos se convierten a PNG en memoria.
 
         Args:
             blob_data (bytes): Datos de la imagen en formato blob.
 
         Returns:
-            str: Ruta del archivo temporal generado.
+            str: Data URI de la imagen.
 
         Raises:
             ValueError: Si los datos blob están vacíos o no son válidos.
@@ -223,35 +1090,25 @@ class ImageGenerator:
             if not blob_data:
                 raise ValueError("Los datos blob están vacíos o no son válidos.")
 
-            # Crear un archivo temporal para guardar la imagen
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                temp_file_path = temp_file.name
-
-                # Convertir los datos blob en una imagen y guardarla
-                image = Image.open(io.BytesIO(blob_data))
-                image.save(temp_file_path, format='PNG')
-
-                # Verificar si el archivo se creó correctamente
-                if not os.path.exists(temp_file_path):
-                    raise FileNotFoundError("No se pudo crear el archivo temporal de la imagen.")
+            # Image.open solo lee la cabecera para identificar el formato
+            with Image.open(io.BytesIO(blob_data)) as image:
+                mime = FORMATOS_FOTO_DIRECTOS.get(image.format)
+                if mime is None:
+                    buffer = io.BytesIO()
+                    image.save(buffer, format='PNG')
+                    blob_data = buffer.getvalue()
+                    mime = "image/png"
 
-                return temp_file_path
+            return f"data:{mime};base64," + base64.b64encode(blob_data).decode("ascii")
 
         except Exception as e:
-            logging.error(f"Error al crear la foto temporal desde blob: {str(e)}")
+            logging.error(f"Error al preparar la foto desde blob: {str(e)}")
             raise
         
     def get_template(self, tipo_carnet):
         """Devuelve el código de color según el tipo de carnet."""
         # Diccionario que asocia tipos de carnet con códigos de color   
-        colores = { 
-            "Profesional": "#2d29c6",   
-            "Gerencial": "#ff0000",
-            "Coordinadores": "#E08343",
-            "Obrero": "#00913f",
-            "Seguridad": "#757575",
-            "Administrativo": "#c63b29" 
-        }   
+        colores = COLORES_CARNET
         # Verificar si el tipo de carnet es válido y devolver el color correspondiente
         try:    
             if tipo_carnet in colores:  
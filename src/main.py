@@ -1,8 +1,11 @@
 from gui import ImageGeneratorApp
+import multiprocessing
 import tkinter as tk
 
 
 if __name__ == "__main__":
+    # Necesario en el ejecutable congelado para los procesos de renderizado
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ImageGeneratorApp(root)
 
@@ -0,0 +1,188 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+
+def escribir_atomico(ruta, datos):
+    """
+    Escribe los datos en la ruta indicada de forma atómica.
+
+    Los bytes se escriben primero en un archivo temporal del mismo directorio y
+    luego se reemplaza el destino con os.replace, de modo que nunca queda un
+    archivo a medio escribir.
+
+    Parámetros:
+    - ruta (str): Ruta final del archivo.
+    - datos (bytes): Contenido a escribir.
+    """
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    with tempfile.NamedTemporaryFile(dir=directorio, suffix='.tmp', delete=False) as temp_file:
+        temp_path = temp_file.name
+        try:
+            temp_file.write(datos)
+        except Exception:
+            temp_file.close()
+            os.remove(temp_path)
+            raise
+    try:
+        os.replace(temp_path, ruta)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class DirectorySink:
+    """Guarda los carnets generados como archivos dentro de un directorio."""
+
+    def __init__(self, directorio, sobrescribir=False):
+        """
+        Parámetros:
+        - directorio (str): Directorio de destino (se crea si no existe).
+        - sobrescribir (bool): Si es False, a los nombres repetidos se les
+          agrega un sufijo _2, _3, ... en lugar de reemplazar el archivo.
+        """
+        self.directorio = directorio
+        self.sobrescribir = sobrescribir
+        os.makedirs(directorio, exist_ok=True)
+
+    def save(self, nombre, datos):
+        """Escribe el carnet y devuelve la ruta final del archivo."""
+        ruta = os.path.join(self.directorio, nombre)
+        if not self.sobrescribir:
+            ruta = self._reservar_nombre(nombre)
+        escribir_atomico(ruta, datos)
+        return ruta
+
+    def _reservar_nombre(self, nombre):
+        """Crea un archivo vacío con un nombre no usado para que otro lote no lo tome."""
+        base, ext = os.path.splitext(nombre)
+        counter = 1
+        while True:
+            candidato = f"{base}_{counter}{ext}" if counter > 1 else f"{base}{ext}"
+            ruta = os.path.join(self.directorio, candidato)
+            try:
+                os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return ruta
+            except FileExistsError:
+                counter += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ZipSink:
+    """Guarda los carnets generados dentro de un archivo ZIP."""
+
+    def __init__(self, ruta_zip):
+        """
+        Parámetros:
+        - ruta_zip (str): Ruta del archivo ZIP a crear (se reemplaza si existe).
+
+        Un ZIP cuyo proceso se cortó sin cerrarlo no tiene directorio central y
+        no se puede leer ni ampliar; para reanudar trabajos largos se escribe
+        un ZIP por ejecución y se unen al final con unir_zips.
+        """
+        self.ruta_zip = ruta_zip
+        self.lock = threading.Lock()
+        # Los PNG ya están comprimidos, por lo que se guardan sin volver a comprimir
+        self.zip = zipfile.ZipFile(ruta_zip, 'w', compression=zipfile.ZIP_STORED)
+        self.nombres = set()
+
+    def save(self, nombre, datos):
+        """Agrega el carnet al ZIP y devuelve el nombre de la entrada."""
+        with self.lock:
+            base, ext = os.path.splitext(nombre)
+            counter = 1
+            while nombre in self.nombres:
+                counter += 1
+                nombre = f"{base}_{counter}{ext}"
+            self.nombres.add(nombre)
+            self.zip.writestr(nombre, datos)
+        return nombre
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def nombres_zip(ruta):
+    """Devuelve los nombres de las entradas de un ZIP, o None si el archivo no se puede leer."""
+    try:
+        with zipfile.ZipFile(ruta) as archivo:
+            return set(archivo.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return None
+
+
+def unir_zips(destino, origenes):
+    """
+    Une varios ZIP en uno solo, de forma atómica.
+
+    Las entradas se copian sin descomprimir a un archivo temporal del mismo
+    directorio, que luego reemplaza al destino con os.replace. Si un nombre
+    se repite, queda la entrada del último ZIP de la lista.
+
+    Parámetros:
+    - destino (str): ZIP resultante; puede estar también entre los orígenes.
+    - origenes (list): Rutas de los ZIP a unir, en orden.
+    """
+    zips = [zipfile.ZipFile(ruta) for ruta in origenes]
+    try:
+        entradas = {}
+        for archivo in zips:
+            for info in archivo.infolist():
+                entradas[info.filename] = (archivo, info)
+        directorio = os.path.dirname(os.path.abspath(destino))
+        with tempfile.NamedTemporaryFile(dir=directorio, suffix='.tmp', delete=False) as temp_file:
+            temp_path = temp_file.name
+        try:
+            with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_STORED) as salida:
+                for archivo, info in entradas.values():
+                    with archivo.open(info) as origen, salida.open(info, 'w') as copia:
+                        shutil.copyfileobj(origen, copia)
+            os.replace(temp_path, destino)
+        except Exception:
+            os.remove(temp_path)
+            raise
+    finally:
+        for archivo in zips:
+            archivo.close()
+
+
+class MemorySink:
+    """Conserva los carnets generados en memoria, en un diccionario nombre -> bytes."""
+
+    def __init__(self):
+        self.archivos = {}
+
+    def save(self, nombre, datos):
+        """Guarda el carnet en memoria y devuelve su nombre."""
+        self.archivos[nombre] = datos
+        return nombre
+
+    def open(self, nombre):
+        """Devuelve un buffer de lectura con el contenido del carnet."""
+        return io.BytesIO(self.archivos[nombre])
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
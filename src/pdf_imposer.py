@@ -0,0 +1,243 @@
+import io
+import logging
+
+from PIL import Image, ImageDraw
+
+from image_generator import MARGEN_CARNET, ANCHO_CARNET, ALTO_CARNET
+
+
+# Tamaños de papel en milímetros (ancho, alto) en orientación vertical
+PAPELES = {
+    "A4": (210.0, 297.0),
+    "Letter": (215.9, 279.4),
+}
+
+# Calidad JPEG de las hojas dentro del PDF
+CALIDAD_JPEG_PDF = 90
+
+# Tamaño real del carnet impreso: la plantilla está dibujada 3 veces más grande (20.736cm x 30.468cm)
+ANCHO_CARNET_MM = 69.12
+ALTO_CARNET_MM = 101.56
+
+
+def mm_a_px(mm, dpi):
+    """Convierte milímetros a píxeles para la resolución indicada."""
+    return round(mm * dpi / 25.4)
+
+
+class EscritorPdf:
+    """
+    Escribe un PDF con una imagen por página en una sola pasada.
+
+    Cada página se escribe en el archivo en cuanto se agrega y solo se guarda
+    su posición; el árbol de páginas y la tabla xref se escriben una vez al
+    cerrar. Así el costo de cada hoja no depende de cuántas hay antes (el
+    modo append de Pillow vuelve a leer y reescribir el índice del archivo
+    completo en cada hoja).
+    """
+
+    def __init__(self, ruta_pdf, dpi):
+        self.dpi = dpi
+        self.archivo = open(ruta_pdf, "wb")
+        # Posición en el archivo de cada objeto; el 1 (catálogo) y el 2 (páginas) se escriben al cerrar
+        self.posiciones = [None, None]
+        self.paginas = []
+        self.archivo.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _objeto(self, diccionario, flujo=None, numero=None):
+        """Escribe un objeto (con su flujo de datos, si tiene) y devuelve su número."""
+        if numero is None:
+            self.posiciones.append(None)
+            numero = len(self.posiciones)
+        self.posiciones[numero - 1] = self.archivo.tell()
+        self.archivo.write(f"{numero} 0 obj\n".encode("ascii") + diccionario.encode("ascii"))
+        if flujo is not None:
+            self.archivo.write(b"\nstream\n" + flujo + b"\nendstream")
+        self.archivo.write(b"\nendobj\n")
+        return numero
+
+    def agregar_pagina(self, imagen):
+        """Agrega una página del tamaño de la imagen (en píxeles a self.dpi)."""
+        buffer = io.BytesIO()
+        imagen.convert("RGB").save(buffer, format="JPEG", quality=CALIDAD_JPEG_PDF, dpi=(self.dpi, self.dpi))
+        jpeg = buffer.getvalue()
+        ancho, alto = imagen.size
+        ancho_pt = ancho * 72 / self.dpi
+        alto_pt = alto * 72 / self.dpi
+
+        foto = self._objeto(
+            f"<< /Type /XObject /Subtype /Image /Width {ancho} /Height {alto} /ColorSpace /DeviceRGB "
+            f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>",
+            jpeg,
+        )
+        dibujo = f"q {ancho_pt:.4f} 0 0 {alto_pt:.4f} 0 0 cm /Im0 Do Q".encode("ascii")
+        contenido = self._objeto(f"<< /Length {len(dibujo)} >>", dibujo)
+        self.paginas.append(self._objeto(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {ancho_pt:.4f} {alto_pt:.4f}] "
+            f"/Resources << /XObject << /Im0 {foto} 0 R >> >> /Contents {contenido} 0 R >>"
+        ))
+
+    def close(self):
+        """Escribe el árbol de páginas, la tabla xref y cierra el archivo."""
+        if self.archivo.closed:
+            return
+        try:
+            self._objeto("<< /Type /Catalog /Pages 2 0 R >>", numero=1)
+            hijos = " ".join(f"{pagina} 0 R" for pagina in self.paginas)
+            self._objeto(f"<< /Type /Pages /Kids [{hijos}] /Count {len(self.paginas)} >>", numero=2)
+            inicio_xref = self.archivo.tell()
+            lineas = [f"xref\n0 {len(self.posiciones) + 1}\n", "0000000000 65535 f \n"]
+            lineas += [f"{posicion:010d} 00000 n \n" for posicion in self.posiciones]
+            lineas.append(f"trailer\n<< /Size {len(self.posiciones) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n")
+            self.archivo.write("".join(lineas).encode("ascii"))
+        finally:
+            self.archivo.close()
+
+
+class PdfSink:
+    """
+    Imposición de carnets en hojas PDF listas para imprimir.
+
+    Los carnets se colocan en una cuadrícula N-up centrada en la hoja, con
+    marcas de corte en el margen. Cada hoja se agrega al PDF en cuanto se
+    completa (ver EscritorPdf), de modo que en memoria solo hay una hoja a la
+    vez y el tiempo por hoja es el mismo sin importar cuántos carnets tenga el
+    trabajo.
+
+    Tiene la misma interfaz que los sinks de output_sinks, por lo que puede
+    pasarse directamente a ImageGenerator.iter_carnets.
+    """
+
+    def __init__(self, ruta_pdf, papel="A4", dpi=300, margen_mm=10, separacion_mm=4, columnas=None, filas=None):
+        """
+        Parámetros:
+        - ruta_pdf (str): Ruta del PDF a crear (se sobrescribe si existe).
+        - papel (str): Clave de PAPELES ("A4" o "Letter").
+        - dpi (int): Resolución de las hojas.
+        - margen_mm (float): Margen mínimo de la hoja, donde van las marcas de corte.
+        - separacion_mm (float): Separación entre carnets.
+        - columnas, filas (int): Cuadrícula a usar. Por defecto, la mayor que cabe en la hoja.
+        """
+        if papel not in PAPELES:
+            raise ValueError(f"Tamaño de papel no válido: {papel}")
+
+        self.ruta_pdf = ruta_pdf
+        self.dpi = dpi
+        ancho_mm, alto_mm = PAPELES[papel]
+
+        max_columnas = int((ancho_mm - 2 * margen_mm + separacion_mm) // (ANCHO_CARNET_MM + separacion_mm))
+        max_filas = int((alto_mm - 2 * margen_mm + separacion_mm) // (ALTO_CARNET_MM + separacion_mm))
+        self.columnas = columnas or max_columnas
+        self.filas = filas or max_filas
+        if not (0 < self.columnas <= max_columnas and 0 < self.filas <= max_filas):
+            raise ValueError(
+                f"Una cuadrícula de {self.columnas}x{self.filas} carnets no cabe en una hoja {papel} "
+                f"(máximo {max_columnas}x{max_filas})."
+            )
+
+        self.tamano_hoja = (mm_a_px(ancho_mm, dpi), mm_a_px(alto_mm, dpi))
+        self.tamano_carnet = (mm_a_px(ANCHO_CARNET_MM, dpi), mm_a_px(ALTO_CARNET_MM, dpi))
+        self.separacion = mm_a_px(separacion_mm, dpi)
+        self.margen = mm_a_px(margen_mm, dpi)
+
+        # Origen de la cuadrícula, centrada en la hoja
+        ancho_grilla = self.columnas * self.tamano_carnet[0] + (self.columnas - 1) * self.separacion
+        alto_grilla = self.filas * self.tamano_carnet[1] + (self.filas - 1) * self.separacion
+        self.origen = ((self.tamano_hoja[0] - ancho_grilla) // 2, (self.tamano_hoja[1] - alto_grilla) // 2)
+
+        self.hoja = None
+        self.posicion = 0
+        self.hojas = 0
+        self.carnets = 0
+        self.escritor = EscritorPdf(ruta_pdf, dpi)
+
+    @property
+    def por_hoja(self):
+        """Número de carnets por hoja."""
+        return self.columnas * self.filas
+
+    def save(self, nombre, datos):
+        """
+        Coloca un carnet (PNG de ImageGenerator.render_carnet) en la hoja actual.
+
+        Retorna:
+        - str: Ubicación del carnet en el PDF, "ruta.pdf#hoja".
+        """
+        if self.hoja is None:
+            self.hoja = self._nueva_hoja()
+
+        with Image.open(io.BytesIO(datos)) as imagen:
+            # Se descarta la página blanca y el borde que rodean al carnet
+            carnet = imagen.convert("RGB").crop(
+                (MARGEN_CARNET, MARGEN_CARNET, MARGEN_CARNET + ANCHO_CARNET, MARGEN_CARNET + ALTO_CARNET)
+            )
+        carnet = carnet.resize(self.tamano_carnet, Image.Resampling.LANCZOS)
+
+        columna = self.posicion % self.columnas
+        fila = self.posicion // self.columnas
+        x = self.origen[0] + columna * (self.tamano_carnet[0] + self.separacion)
+        y = self.origen[1] + fila * (self.tamano_carnet[1] + self.separacion)
+        self.hoja.paste(carnet, (x, y))
+
+        self.posicion += 1
+        self.carnets += 1
+        ubicacion = f"{self.ruta_pdf}#{self.hojas + 1}"
+        if self.posicion == self.por_hoja:
+            self._escribir_hoja()
+        return ubicacion
+
+    def _nueva_hoja(self):
+        """Crea una hoja en blanco con las marcas de corte de la cuadrícula."""
+        hoja = Image.new("RGB", self.tamano_hoja, "white")
+        draw = ImageDraw.Draw(hoja)
+        ancho_carnet, alto_carnet = self.tamano_carnet
+        x0, y0 = self.origen
+        x1 = x0 + self.columnas * ancho_carnet + (self.columnas - 1) * self.separacion
+        y1 = y0 + self.filas * alto_carnet + (self.filas - 1) * self.separacion
+
+        # Las marcas quedan fuera de la cuadrícula, separadas 1mm del borde
+        hueco = mm_a_px(1, self.dpi)
+        largo = max(min(mm_a_px(5, self.dpi), min(x0, y0) - 2 * hueco), 0)
+        grosor = max(1, mm_a_px(0.1, self.dpi))
+
+        bordes_x = set()
+        for columna in range(self.columnas):
+            x = x0 + columna * (ancho_carnet + self.separacion)
+            bordes_x.update((x, x + ancho_carnet - 1))
+        bordes_y = set()
+        for fila in range(self.filas):
+            y = y0 + fila * (alto_carnet + self.separacion)
+            bordes_y.update((y, y + alto_carnet - 1))
+
+        for x in bordes_x:
+            draw.line((x, y0 - hueco - largo, x, y0 - hueco), fill="black", width=grosor)
+            draw.line((x, y1 + hueco, x, y1 + hueco + largo), fill="black", width=grosor)
+        for y in bordes_y:
+            draw.line((x0 - hueco - largo, y, x0 - hueco, y), fill="black", width=grosor)
+            draw.line((x1 + hueco, y, x1 + hueco + largo, y), fill="black", width=grosor)
+        return hoja
+
+    def _escribir_hoja(self):
+        """Agrega la hoja actual al PDF y la libera."""
+        try:
+            self.escritor.agregar_pagina(self.hoja)
+        except Exception as e:
+            logging.error(f"Error al escribir la hoja {self.hojas + 1} del PDF: {str(e)}")
+            raise
+        self.hojas += 1
+        self.hoja = None
+        self.posicion = 0
+
+    def close(self):
+        """Escribe la última hoja, aunque no esté completa, y cierra el PDF."""
+        try:
+            if self.hoja is not None:
+                self._escribir_hoja()
+        finally:
+            self.escritor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
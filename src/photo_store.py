@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+
+from output_sinks import escribir_atomico
+
+
+# Prefijo de las claves de foto que apuntan al almacén
+PREFIJO_CLAVE_ALMACEN = "sha256:"
+
+# Almacén del proceso: False mientras no se haya leído settings.json
+_almacen = False
+
+
+def hash_foto(datos):
+    """Devuelve el SHA-256 en hexadecimal de los bytes de una foto."""
+    return hashlib.sha256(datos).hexdigest()
+
+
+class AlmacenFotos:
+    """
+    Almacén de fotos en disco direccionado por contenido.
+
+    Cada foto se guarda una sola vez con su SHA-256 como nombre, en
+    <directorio>/ab/cd/abcd...; los dos niveles de subdirectorios evitan
+    directorios con cientos de miles de archivos. Dos trabajadores con la
+    misma foto comparten el archivo, y volver a importar una foto que ya
+    está no escribe nada.
+
+    El directorio puede estar en una unidad de red o ser la carpeta
+    sincronizada de un almacenamiento de objetos.
+    """
+
+    def __init__(self, directorio):
+        """
+        Parámetros:
+        - directorio (str): Directorio raíz del almacén (se crea si no existe).
+        """
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def ruta(self, hash_hex):
+        """Devuelve la ruta del archivo de una foto."""
+        return os.path.join(self.directorio, hash_hex[:2], hash_hex[2:4], hash_hex)
+
+    def guardar(self, datos):
+        """
+        Guarda una foto si no está en el almacén.
+
+        Retorna:
+        - str: El SHA-256 de la foto, que es su clave en el almacén.
+        """
+        hash_hex = hash_foto(datos)
+        ruta = self.ruta(hash_hex)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            escribir_atomico(ruta, datos)
+        return hash_hex
+
+    def leer(self, hash_hex):
+        """Devuelve los bytes de la foto, o None si no está en el almacén."""
+        try:
+            with open(self.ruta(hash_hex), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def existe(self, hash_hex):
+        """Indica si la foto está en el almacén."""
+        return os.path.exists(self.ruta(hash_hex))
+
+
+def get_almacen_fotos():
+    """
+    Devuelve el almacén de fotos configurado en settings.json, o None.
+
+    El almacén es opcional: si photo_store_dir no está configurado las fotos
+    se siguen guardando en trabajadores.imagen. El archivo se lee una sola
+    vez por proceso.
+    """
+    global _almacen
+    if _almacen is False:
+        try:
+            with open('settings.json') as f:
+                directorio = json.load(f).get('photo_store_dir')
+        except (OSError, ValueError):
+            directorio = None
+        _almacen = AlmacenFotos(os.path.expanduser(directorio)) if directorio else None
+    return _almacen
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+
+from output_sinks import escribir_atomico
+
+
+# Fracción de max_bytes que un proceso escribe en la caché entre dos recorridos del directorio
+FRACCION_REVISION = 16
+
+
+class RenderCache:
+    """
+    Caché en disco de carnets ya renderizados.
+
+    Cada PNG se guarda como <huella>.png, donde la huella es el hash de todos
+    los datos que intervienen en el carnet (ver ImageGenerator.huella_carnet).
+    Cuando el tamaño total supera max_bytes se eliminan primero los archivos
+    usados hace más tiempo; la fecha de modificación de cada archivo se
+    actualiza en cada acierto, por lo que el orden se conserva entre ejecuciones.
+
+    El límite es del directorio, no de cada proceso: los procesos de
+    renderizado comparten la caché, y la expulsión se decide recorriendo el
+    directorio con os.scandir. Cada proceso lo recorre cuando su estimación
+    del total supera max_bytes o cuando escribió max_bytes / FRACCION_REVISION
+    bytes desde el último recorrido, así que el directorio solo se pasa del
+    límite en lo que los procesos escriban entre dos recorridos.
+    """
+
+    def __init__(self, directorio, max_bytes):
+        """
+        Parámetros:
+        - directorio (str): Directorio de la caché (se crea si no existe).
+        - max_bytes (int): Tamaño máximo de la caché en bytes.
+        """
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+        # Total del directorio según el último recorrido más lo escrito desde entonces
+        self.total = sum(tamano for _, _, tamano in self._recorrer())
+        self.escrito = 0
+
+    def _ruta(self, huella):
+        return os.path.join(self.directorio, f"{huella}.png")
+
+    def _recorrer(self):
+        """Devuelve (fecha de modificación, huella, tamaño) de cada PNG del directorio."""
+        entradas = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith('.png'):
+                try:
+                    estado = entrada.stat()
+                except FileNotFoundError:
+                    # Otro proceso lo expulsó durante el recorrido
+                    continue
+                entradas.append((estado.st_mtime, entrada.name[:-4], estado.st_size))
+        return entradas
+
+    def get(self, huella):
+        """Devuelve el PNG guardado para la huella, o None si no está en la caché."""
+        ruta = self._ruta(huella)
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            os.utime(ruta)
+        except FileNotFoundError:
+            # Otro proceso pudo haberlo expulsado
+            return None
+        return datos
+
+    def put(self, huella, datos):
+        """Guarda el PNG de la huella y expulsa las entradas más antiguas si hace falta."""
+        try:
+            escribir_atomico(self._ruta(huella), datos)
+        except OSError as e:
+            logging.error(f"Error al guardar el carnet en la caché: {str(e)}")
+            return
+        with self.lock:
+            self.total += len(datos)
+            self.escrito += len(datos)
+            if self.total > self.max_bytes or self.escrito >= self.max_bytes // FRACCION_REVISION:
+                self._expulsar(huella)
+
+    def _expulsar(self, conservar):
+        """Recorre el directorio y elimina los PNG usados hace más tiempo hasta quedar en max_bytes."""
+        entradas = sorted(self._recorrer())
+        total = sum(tamano for _, _, tamano in entradas)
+        for _, huella, tamano in entradas:
+            if total <= self.max_bytes:
+                break
+            if huella == conservar:
+                continue
+            try:
+                os.remove(self._ruta(huella))
+            except FileNotFoundError:
+                # Otro proceso ya lo expulsó
+                pass
+            total -= tamano
+        self.total = total
+        self.escrito = 0
@@ -0,0 +1,128 @@
+import re
+import unicodedata
+import heapq
+from bisect import bisect_left
+from collections import Counter
+
+
+# Fracción mínima de los trigramas de cada término que debe compartir un
+# trabajador para aparecer en una búsqueda aproximada
+SIMILITUD_MINIMA = 0.5
+
+
+def normalizar(texto):
+    """
+    Devuelve el texto en minúsculas, sin acentos y con solo letras, números y espacios.
+
+    "José  PÉREZ-Núñez" -> "jose perez nunez"
+    """
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return " ".join(re.findall(r"\w+", texto.casefold()))
+
+
+def trigramas(token):
+    """Devuelve los trigramas de un término, con un espacio antes y después para marcar los bordes."""
+    relleno = f" {token} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceBusqueda:
+    """
+    Índice en memoria para buscar trabajadores por nombre, apellidos, cargo o cédula.
+
+    Cada trabajador se guarda como términos normalizados (ver normalizar). La
+    búsqueda por prefijo usa la lista ordenada de términos, de modo que
+    "jos per" encuentra a "José Pérez" con dos búsquedas binarias; si no hay
+    coincidencias por prefijo se recurre a los trigramas de los términos, lo
+    que tolera errores de escritura ("jose peres").
+    """
+
+    def __init__(self, filas=()):
+        """
+        Parámetros:
+        - filas (iterable): Tuplas (id, nombre, apellidos, cedula, cargo).
+        """
+        self.ids_por_termino = {}
+        self.terminos_por_trigrama = {}
+        self.terminos_por_id = {}
+        for id_trabajador, nombre, apellidos, cedula, cargo in filas:
+            terminos = set(normalizar(f"{nombre} {apellidos} {cedula} {cargo}").split())
+            self.terminos_por_id[id_trabajador] = terminos
+            for termino in terminos:
+                self.ids_por_termino.setdefault(termino, set()).add(id_trabajador)
+        # Los trigramas apuntan a términos, no a trabajadores: hay muchos menos
+        for termino in self.ids_por_termino:
+            for trigrama in trigramas(termino):
+                self.terminos_por_trigrama.setdefault(trigrama, set()).add(termino)
+        self.terminos = sorted(self.ids_por_termino)
+
+    def __len__(self):
+        return len(self.terminos_por_id)
+
+    def _por_prefijo(self, prefijo):
+        """Devuelve los ids de los trabajadores con algún término que empieza por el prefijo."""
+        ids = set()
+        # Los términos con el prefijo son los que quedan entre el prefijo y el prefijo seguido del mayor carácter
+        inicio = bisect_left(self.terminos, prefijo)
+        fin = bisect_left(self.terminos, prefijo + "\U0010ffff", inicio)
+        for termino in self.terminos[inicio:fin]:
+            ids |= self.ids_por_termino[termino]
+        return ids
+
+    def _por_similitud(self, termino):
+        """Devuelve {id: similitud} de los trabajadores con términos parecidos al indicado."""
+        buscados = trigramas(termino)
+        comunes = Counter()
+        for trigrama in buscados:
+            comunes.update(self.terminos_por_trigrama.get(trigrama, ()))
+        similitudes = {}
+        for parecido, cantidad in comunes.items():
+            similitud = cantidad / len(buscados | trigramas(parecido))
+            if cantidad / len(buscados) < SIMILITUD_MINIMA:
+                continue
+            for id_trabajador in self.ids_por_termino[parecido]:
+                similitudes[id_trabajador] = max(similitudes.get(id_trabajador, 0), similitud)
+        return similitudes
+
+    def buscar(self, consulta, limite=100):
+        """
+        Busca trabajadores cuyos términos empiecen por cada palabra de la consulta.
+
+        Si ninguno coincide por prefijo, se buscan términos parecidos por
+        trigramas. Los resultados se ordenan poniendo primero las
+        coincidencias exactas de palabras completas.
+
+        Parámetros:
+        - consulta (str): Texto a buscar; se normaliza igual que los datos.
+        - limite (int): Máximo de resultados.
+
+        Retorna:
+        - list: Ids de los trabajadores encontrados.
+        """
+        palabras = normalizar(consulta).split()
+        if not palabras:
+            return []
+
+        # Primero las palabras más largas, que suelen dejar menos candidatos
+        ids = None
+        for palabra in sorted(palabras, key=len, reverse=True):
+            encontrados = self._por_prefijo(palabra)
+            ids = encontrados if ids is None else ids & encontrados
+            if not ids:
+                break
+        if ids:
+            completas = set(palabras)
+            return heapq.nsmallest(limite, ids, key=lambda i: (-len(completas & self.terminos_por_id[i]), i))
+
+        # Búsqueda aproximada: todas las palabras deben tener algún término parecido
+        puntajes = None
+        for palabra in palabras:
+            similitudes = self._por_similitud(palabra)
+            if puntajes is None:
+                puntajes = similitudes
+            else:
+                puntajes = {i: puntaje + similitudes[i] for i, puntaje in puntajes.items() if i in similitudes}
+            if not puntajes:
+                return []
+        return heapq.nsmallest(limite, puntajes, key=lambda i: (-puntajes[i], i))
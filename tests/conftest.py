@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de src se importan entre sí sin paquete (from database_manager import ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
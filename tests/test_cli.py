@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from cli import leer_checkpoint, numero_parte, partes_zip, verificar_checkpoint
+from output_sinks import ZipSink
+
+
+def escribir_checkpoint(ruta, registros, cola=""):
+    with open(ruta, "w", encoding="utf-8") as f:
+        for cedula, archivo in registros:
+            f.write(json.dumps({"cedula": cedula, "archivo": archivo}) + "\n")
+        f.write(cola)
+
+
+def crear_zip(ruta, nombres):
+    with ZipSink(str(ruta)) as sink:
+        for nombre in nombres:
+            sink.save(nombre, b"png")
+
+
+def test_leer_checkpoint(tmp_path):
+    ruta = tmp_path / "progreso.jsonl"
+    escribir_checkpoint(ruta, [(123, "123.png"), ("456", "456.png")], cola='{"cedula": "789", "arch')
+    assert leer_checkpoint(str(ruta)) == {"123": "123.png", "456": "456.png"}
+
+
+def test_leer_checkpoint_inexistente(tmp_path):
+    assert leer_checkpoint(str(tmp_path / "no_existe.jsonl")) == {}
+
+
+def test_numero_parte():
+    salida = "/tmp/carnets.zip"
+    assert numero_parte(salida, "/tmp/carnets.zip.part-3.zip") == 3
+    assert numero_parte(salida, "/tmp/carnets.zip.part-12.zip") == 12
+    assert numero_parte(salida, "/tmp/carnets.zip.part-x.zip") is None
+    assert numero_parte(salida, "/tmp/carnets.zip.part-.zip") is None
+
+
+def test_partes_zip_en_orden_numerico(tmp_path):
+    salida = str(tmp_path / "carnets.zip")
+    for n in (10, 2, 1):
+        crear_zip(f"{salida}.part-{n}.zip", [])
+    (tmp_path / "carnets.zip.part-a.zip").write_bytes(b"")
+    assert partes_zip(salida) == [f"{salida}.part-{n}.zip" for n in (1, 2, 10)]
+
+
+def test_verificar_checkpoint_directorio(tmp_path):
+    (tmp_path / "123.png").write_bytes(b"png")
+    hechas = {"123": "123.png", "456": "456.png"}
+    assert verificar_checkpoint(hechas, str(tmp_path)) == {"123": "123.png"}
+
+
+def test_verificar_checkpoint_zip_con_partes(tmp_path):
+    salida = tmp_path / "carnets.zip"
+    crear_zip(salida, ["1.png"])
+    crear_zip(f"{salida}.part-1.zip", ["2.png"])
+    # Parte de una ejecución que se cortó sin cerrar el ZIP
+    cortada = tmp_path / "carnets.zip.part-2.zip"
+    cortada.write_bytes(b"PK\x03\x04 incompleto")
+
+    hechas = {"1": "1.png", "2": "2.png", "3": "3.png"}
+    assert verificar_checkpoint(hechas, str(salida)) == {"1": "1.png", "2": "2.png"}
+    assert not cortada.exists()
+
+
+def test_verificar_checkpoint_zip_ilegible(tmp_path):
+    salida = tmp_path / "carnets.zip"
+    salida.write_bytes(b"no es un zip")
+    with pytest.raises(ValueError):
+        verificar_checkpoint({"1": "1.png"}, str(salida))
+    assert os.path.exists(salida)
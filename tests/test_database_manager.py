@@ -0,0 +1,153 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+from mysql.connector import Error
+
+from database_manager import DatabaseManager, RegistroOficinas, ReservaCorrelativos, servidor_compatible
+
+
+OFICINAS = [("Recursos Humanos", "RRHH"), ("Tecnología", "TEC")]
+
+
+class CursorFalso:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, parametros=()):
+        self.db.consultas.append(query)
+        if self.db.fallar:
+            raise Error(msg="conexión perdida")
+
+    def fetchall(self):
+        return list(self.db.oficinas)
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return CursorFalso(self.db)
+
+
+def crear_db(oficinas=OFICINAS, fallar=False):
+    """DatabaseManager sin servidor, con una conexión que devuelve las oficinas indicadas."""
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.host, db.port, db.database = "prueba", 0, f"db-{id(db)}"
+    db.tabla_oficina = "oficinas"
+    db.oficinas = oficinas
+    db.fallar = fallar
+    db.consultas = []
+
+    @contextmanager
+    def conexion():
+        yield ConexionFalsa(db)
+
+    db.conexion = conexion
+    return db
+
+
+def test_registro_oficinas_por_nombre_y_codigo():
+    registro = RegistroOficinas(OFICINAS)
+    assert len(registro) == 2
+    assert list(registro) == OFICINAS
+    assert registro.nombre("TEC") == "Tecnología"
+    assert registro.nombre("XYZ") is None
+    assert registro.codigo("TEC") == "TEC"
+    assert registro.codigo("Recursos Humanos") == "RRHH"
+    assert registro.codigo("Otra") is None
+
+
+def test_registro_oficinas_se_consulta_una_vez():
+    db = crear_db()
+    registro = db.registro_oficinas()
+    assert db.registro_oficinas() is registro
+    assert len(db.consultas) == 1
+
+    db.invalidar_oficinas()
+    db.oficinas = OFICINAS + [("Seguridad", "SEG")]
+    assert db.registro_oficinas().codigo("Seguridad") == "SEG"
+    assert len(db.consultas) == 2
+
+
+def test_registro_oficinas_no_guarda_un_fallo():
+    db = crear_db(fallar=True)
+    assert len(db.registro_oficinas()) == 0
+    db.fallar = False
+    assert len(db.registro_oficinas()) == 2
+    assert len(db.consultas) == 2
+
+
+class ContadorFalso:
+    """Imita DatabaseManager.reservar_correlativos con un contador por oficina."""
+
+    def __init__(self):
+        self.ultimos = {}
+        self.reservas = []
+
+    def reservar_correlativos(self, adscrito, cantidad=1):
+        self.reservas.append((adscrito, cantidad))
+        self.ultimos[adscrito] = self.ultimos.get(adscrito, 0) + cantidad
+        return self.ultimos[adscrito]
+
+
+def test_reserva_correlativos_por_bloques():
+    db = ContadorFalso()
+    reserva = ReservaCorrelativos(db, tamano_bloque=10)
+    assert reserva.tomar("TEC", 3) == [1, 2, 3]
+    assert reserva.tomar("TEC", 7) == [4, 5, 6, 7, 8, 9, 10]
+    assert db.reservas == [("TEC", 10)]
+
+    # El bloque se agotó: se reserva otro y se continúa desde el siguiente número
+    assert reserva.tomar("TEC", 2) == [11, 12]
+    assert reserva.tomar("RRHH") == [1]
+    assert db.reservas == [("TEC", 10), ("TEC", 10), ("RRHH", 10)]
+
+
+def test_reserva_correlativos_mayor_que_el_bloque():
+    db = ContadorFalso()
+    reserva = ReservaCorrelativos(db, tamano_bloque=10)
+    assert reserva.tomar("TEC", 4) == [1, 2, 3, 4]
+    # Quedan 6 del primer bloque y el resto sale de una sola reserva
+    assert reserva.tomar("TEC", 25) == list(range(5, 30))
+    assert db.reservas == [("TEC", 10), ("TEC", 19)]
+
+
+def test_reserva_correlativos_entre_hilos():
+    db = ContadorFalso()
+    reserva = ReservaCorrelativos(db, tamano_bloque=7)
+    numeros = []
+    lock = threading.Lock()
+
+    def tomar():
+        for _ in range(50):
+            tomados = reserva.tomar("TEC", 3)
+            with lock:
+                numeros.extend(tomados)
+
+    hilos = [threading.Thread(target=tomar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(numeros) == list(range(1, 601))
+
+
+@pytest.mark.parametrize("version, compatible", [
+    ("8.0.36", True),
+    ("8.4.0-log", True),
+    ("5.7.44", False),
+    ("10.2.44-MariaDB", True),
+    ("10.1.48-MariaDB", False),
+    ("5.5.5-10.6.12-MariaDB-0ubuntu0.22.04.1", True),
+    ("5.5.5-10.1.48-MariaDB", False),
+    ("", False),
+    (None, False),
+    ("desconocida", False),
+])
+def test_servidor_compatible(version, compatible):
+    assert servidor_compatible(version) is compatible
@@ -0,0 +1,91 @@
+import os
+import zipfile
+
+import pytest
+
+from output_sinks import DirectorySink, ZipSink, escribir_atomico, nombres_zip, unir_zips
+
+
+def test_escribir_atomico_no_deja_temporales(tmp_path):
+    ruta = str(tmp_path / "a.png")
+    escribir_atomico(ruta, b"uno")
+    escribir_atomico(ruta, b"dos")
+    assert open(ruta, "rb").read() == b"dos"
+    assert os.listdir(tmp_path) == ["a.png"]
+
+
+def test_directory_sink_nombres_repetidos(tmp_path):
+    with DirectorySink(str(tmp_path / "salida")) as sink:
+        rutas = [sink.save("123.png", str(i).encode()) for i in range(3)]
+    assert [os.path.basename(ruta) for ruta in rutas] == ["123.png", "123_2.png", "123_3.png"]
+    assert [open(ruta, "rb").read() for ruta in rutas] == [b"0", b"1", b"2"]
+
+
+def test_directory_sink_respeta_archivos_existentes(tmp_path):
+    (tmp_path / "123.png").write_bytes(b"anterior")
+    sink = DirectorySink(str(tmp_path))
+    assert os.path.basename(sink.save("123.png", b"nuevo")) == "123_2.png"
+    assert (tmp_path / "123.png").read_bytes() == b"anterior"
+
+
+def test_directory_sink_sobrescribir(tmp_path):
+    sink = DirectorySink(str(tmp_path), sobrescribir=True)
+    sink.save("123.png", b"uno")
+    assert os.path.basename(sink.save("123.png", b"dos")) == "123.png"
+    assert os.listdir(tmp_path) == ["123.png"]
+    assert (tmp_path / "123.png").read_bytes() == b"dos"
+
+
+def test_zip_sink_nombres_repetidos(tmp_path):
+    ruta = str(tmp_path / "carnets.zip")
+    with ZipSink(ruta) as sink:
+        assert sink.save("123.png", b"a") == "123.png"
+        assert sink.save("123.png", b"b") == "123_2.png"
+        assert sink.save("456.png", b"c") == "456.png"
+    with zipfile.ZipFile(ruta) as archivo:
+        assert archivo.read("123_2.png") == b"b"
+    assert nombres_zip(ruta) == {"123.png", "123_2.png", "456.png"}
+
+
+def test_nombres_zip_ilegible(tmp_path):
+    ruta = tmp_path / "cortado.zip"
+    ruta.write_bytes(b"PK\x03\x04 sin directorio central")
+    assert nombres_zip(str(ruta)) is None
+    assert nombres_zip(str(tmp_path / "no_existe.zip")) is None
+
+
+def test_unir_zips(tmp_path):
+    destino = str(tmp_path / "carnets.zip")
+    partes = []
+    for n, contenido in enumerate([{"1.png": b"a", "2.png": b"b"}, {"2.png": b"B", "3.png": b"c"}], start=1):
+        ruta = str(tmp_path / f"carnets.zip.part-{n}.zip")
+        with ZipSink(ruta) as sink:
+            for nombre, datos in contenido.items():
+                sink.save(nombre, datos)
+        partes.append(ruta)
+
+    unir_zips(destino, partes)
+    with zipfile.ZipFile(destino) as archivo:
+        assert sorted(archivo.namelist()) == ["1.png", "2.png", "3.png"]
+        # Si un nombre se repite, queda el del último ZIP
+        assert archivo.read("2.png") == b"B"
+
+    # El destino puede estar entre los orígenes
+    with ZipSink(partes[0]) as sink:
+        sink.save("4.png", b"d")
+    unir_zips(destino, [destino, partes[0]])
+    assert nombres_zip(destino) == {"1.png", "2.png", "3.png", "4.png"}
+    assert not [nombre for nombre in os.listdir(tmp_path) if nombre.endswith(".tmp")]
+
+
+def test_unir_zips_con_un_origen_ilegible(tmp_path):
+    destino = tmp_path / "carnets.zip"
+    with ZipSink(str(destino)) as sink:
+        sink.save("1.png", b"a")
+    cortado = tmp_path / "cortado.zip"
+    cortado.write_bytes(b"no es un zip")
+
+    with pytest.raises(zipfile.BadZipFile):
+        unir_zips(str(destino), [str(destino), str(cortado)])
+    # El destino queda como estaba
+    assert nombres_zip(str(destino)) == {"1.png"}
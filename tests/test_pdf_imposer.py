@@ -0,0 +1,112 @@
+import io
+
+import pytest
+from PIL import Image
+from PIL.PdfParser import PdfParser
+
+from image_generator import MARGEN_CARNET, ANCHO_CARNET, ALTO_CARNET
+from pdf_imposer import PdfSink, EscritorPdf, PAPELES, mm_a_px
+
+
+DPI = 50
+
+
+def png_carnet(color):
+    imagen = Image.new("RGB", (ANCHO_CARNET + 2 * MARGEN_CARNET, ALTO_CARNET + 2 * MARGEN_CARNET), "white")
+    imagen.paste(color, (MARGEN_CARNET, MARGEN_CARNET, MARGEN_CARNET + ANCHO_CARNET, MARGEN_CARNET + ALTO_CARNET))
+    buffer = io.BytesIO()
+    imagen.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def paginas(ruta):
+    pdf = PdfParser(ruta)
+    return [pdf.read_indirect(pagina) for pagina in pdf.pages]
+
+
+def test_impone_varias_hojas(tmp_path):
+    ruta = str(tmp_path / "carnets.pdf")
+    with PdfSink(ruta, dpi=DPI) as sink:
+        assert (sink.columnas, sink.filas) == (2, 2)
+        ubicaciones = [sink.save(f"{i}.png", png_carnet("red")) for i in range(9)]
+
+    assert sink.hojas == 3
+    assert sink.carnets == 9
+    assert ubicaciones[0] == f"{ruta}#1"
+    assert ubicaciones[4] == f"{ruta}#2"
+    assert ubicaciones[8] == f"{ruta}#3"
+
+    hojas = paginas(ruta)
+    assert len(hojas) == 3
+    ancho_mm, alto_mm = PAPELES["A4"]
+    for hoja in hojas:
+        _, _, ancho_pt, alto_pt = hoja[b"MediaBox"]
+        assert ancho_pt == pytest.approx(ancho_mm / 25.4 * 72, abs=1)
+        assert alto_pt == pytest.approx(alto_mm / 25.4 * 72, abs=1)
+
+
+def test_pdf_vacio_es_valido(tmp_path):
+    ruta = str(tmp_path / "vacio.pdf")
+    PdfSink(ruta, dpi=DPI).close()
+    assert paginas(ruta) == []
+
+
+def test_escritor_pdf_una_pagina_por_imagen(tmp_path):
+    ruta = str(tmp_path / "hojas.pdf")
+    escritor = EscritorPdf(ruta, 72)
+    for _ in range(5):
+        escritor.agregar_pagina(Image.new("RGB", (100, 50), "white"))
+    escritor.close()
+    hojas = paginas(ruta)
+    assert len(hojas) == 5
+    assert list(hojas[0][b"MediaBox"]) == [0, 0, 100, 50]
+
+
+def test_carnets_en_la_cuadricula(tmp_path):
+    sink = PdfSink(str(tmp_path / "c.pdf"), dpi=DPI)
+    sink.save("a.png", png_carnet((255, 0, 0)))
+    sink.save("b.png", png_carnet((0, 0, 255)))
+    ancho, alto = sink.tamano_carnet
+    x0, y0 = sink.origen
+    centro_y = y0 + alto // 2
+
+    assert sink.hoja.getpixel((x0 + ancho // 2, centro_y)) == (255, 0, 0)
+    segundo_x = x0 + ancho + sink.separacion
+    assert sink.hoja.getpixel((segundo_x + ancho // 2, centro_y)) == (0, 0, 255)
+    # La separación entre carnets queda en blanco
+    assert sink.hoja.getpixel((x0 + ancho + sink.separacion // 2, centro_y)) == (255, 255, 255)
+    # La segunda fila todavía está vacía
+    assert sink.hoja.getpixel((x0 + ancho // 2, y0 + alto + sink.separacion + alto // 2)) == (255, 255, 255)
+    sink.close()
+
+
+def test_marcas_de_corte(tmp_path):
+    sink = PdfSink(str(tmp_path / "m.pdf"), dpi=DPI)
+    hoja = sink._nueva_hoja()
+    ancho, alto = sink.tamano_carnet
+    x0, y0 = sink.origen
+    x1 = x0 + sink.columnas * ancho + (sink.columnas - 1) * sink.separacion
+    y1 = y0 + sink.filas * alto + (sink.filas - 1) * sink.separacion
+    hueco = mm_a_px(1, DPI)
+    negro = (0, 0, 0)
+
+    for columna in range(sink.columnas):
+        for x in (x0 + columna * (ancho + sink.separacion), x0 + columna * (ancho + sink.separacion) + ancho - 1):
+            # Marcas arriba y abajo de cada borde vertical, fuera de la cuadrícula
+            assert hoja.getpixel((x, y0 - hueco - 1)) == negro
+            assert hoja.getpixel((x, y1 + hueco + 1)) == negro
+    for fila in range(sink.filas):
+        for y in (y0 + fila * (alto + sink.separacion), y0 + fila * (alto + sink.separacion) + alto - 1):
+            assert hoja.getpixel((x0 - hueco - 1, y)) == negro
+            assert hoja.getpixel((x1 + hueco + 1, y)) == negro
+
+    # Ninguna marca entra en la cuadrícula ni en el hueco de 1 mm que la rodea
+    for x in range(x0 - hueco + 1, x1 + hueco):
+        for y in range(y0 - hueco + 1, y1 + hueco):
+            assert hoja.getpixel((x, y)) == (255, 255, 255)
+    sink.close()
+
+
+def test_cuadricula_que_no_cabe():
+    with pytest.raises(ValueError):
+        PdfSink("no_se_crea.pdf", columnas=5)
@@ -0,0 +1,63 @@
+import os
+
+from render_cache import RenderCache
+
+
+def envejecer(cache, huella, segundos):
+    """Pone la fecha de modificación de la entrada 'segundos' en el pasado."""
+    ruta = cache._ruta(huella)
+    instante = os.path.getmtime(ruta) - segundos
+    os.utime(ruta, (instante, instante))
+
+
+def test_guarda_y_lee(tmp_path):
+    cache = RenderCache(str(tmp_path), 10_000)
+    assert cache.get("a") is None
+    cache.put("a", b"datos")
+    assert cache.get("a") == b"datos"
+
+
+def test_expulsa_las_menos_usadas(tmp_path):
+    cache = RenderCache(str(tmp_path), 2500)
+    for i, huella in enumerate("abc"):
+        cache.put(huella, b"x" * 1000)
+        envejecer(cache, huella, 100 - i)
+    assert sorted(os.listdir(tmp_path)) == ["b.png", "c.png"]
+
+    # Un acierto actualiza la fecha, así que se expulsa la otra
+    envejecer(cache, "c", 200)
+    assert cache.get("c") is not None
+    cache.put("d", b"x" * 1000)
+    assert sorted(os.listdir(tmp_path)) == ["c.png", "d.png"]
+
+
+def test_conserva_la_entrada_recien_guardada(tmp_path):
+    cache = RenderCache(str(tmp_path), 500)
+    cache.put("a", b"x" * 400)
+    cache.put("b", b"x" * 1000)
+    assert os.listdir(tmp_path) == ["b.png"]
+
+
+def test_limite_compartido_entre_instancias(tmp_path):
+    # Dos instancias sobre el mismo directorio, como dos procesos del pool
+    primera = RenderCache(str(tmp_path), 3000)
+    segunda = RenderCache(str(tmp_path), 3000)
+    for i in range(6):
+        cache = primera if i % 2 else segunda
+        cache.put(f"e{i}", b"x" * 1000)
+        envejecer(cache, f"e{i}", 100 - i)
+    total = sum(entrada.stat().st_size for entrada in os.scandir(tmp_path))
+    assert total <= 3000
+    assert "e5.png" in os.listdir(tmp_path)
+
+
+def test_entradas_de_una_ejecucion_anterior(tmp_path):
+    cache = RenderCache(str(tmp_path), 2000)
+    cache.put("vieja", b"x" * 1000)
+    envejecer(cache, "vieja", 100)
+
+    nueva = RenderCache(str(tmp_path), 2000)
+    assert nueva.total == 1000
+    nueva.put("a", b"x" * 1000)
+    nueva.put("b", b"x" * 1000)
+    assert sorted(os.listdir(tmp_path)) == ["a.png", "b.png"]
@@ -0,0 +1,56 @@
+from search_index import IndiceBusqueda, normalizar
+
+
+FILAS = [
+    (1, "José", "Pérez Núñez", 12345678, "Analista"),
+    (2, "Josefina", "Pérez", 23456789, "Jefa de Oficina"),
+    (3, "Ana", "Josa", 34567890, "Obrera"),
+    (4, "María", "González", 45678901, "Analista"),
+]
+
+
+def test_normalizar_quita_acentos_y_signos():
+    assert normalizar("José  PÉREZ-Núñez") == "jose perez nunez"
+    assert normalizar(None) == ""
+
+
+def test_busqueda_por_prefijo():
+    indice = IndiceBusqueda(FILAS)
+    assert indice.buscar("jos per") == [1, 2]
+    assert sorted(indice.buscar("jos")) == [1, 2, 3]
+    assert indice.buscar("2345") == [2]
+    assert indice.buscar("xyz") == []
+
+
+def test_busqueda_sin_acentos_ni_mayusculas():
+    indice = IndiceBusqueda(FILAS)
+    assert indice.buscar("NUÑEZ") == [1]
+    assert indice.buscar("nunez") == [1]
+    assert indice.buscar("gonzález") == [4]
+
+
+def test_palabras_completas_primero():
+    indice = IndiceBusqueda(FILAS)
+    # "jose" es una palabra completa de 1 y solo un prefijo de "josefina"
+    assert indice.buscar("jose") == [1, 2]
+    assert indice.buscar("analista") == [1, 4]
+
+
+def test_prefijo_al_final_del_vocabulario():
+    indice = IndiceBusqueda([(1, "Zoe", "Zuloaga", 1, "Zz")])
+    assert indice.buscar("zu") == [1]
+    assert indice.buscar("zz") == [1]
+
+
+def test_busqueda_aproximada():
+    indice = IndiceBusqueda(FILAS)
+    assert indice.buscar("jose peres") == [1, 2]
+    assert indice.buscar("gonsalez") == [4]
+    assert indice.buscar("qwerty") == []
+
+
+def test_limite_y_consulta_vacia():
+    indice = IndiceBusqueda(FILAS)
+    assert indice.buscar("jos", limite=2) == [1, 2]
+    assert indice.buscar("  ") == []
+    assert len(indice) == 4